@@ -1,13 +1,89 @@
-from fastapi import APIRouter
+from typing import Optional
 
-from app.scheduler import sync_markets, sync_trades, sync_users
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from app.cache import result_cache
+from app.db import pool_stats
+from app.executor import executor_stats
+from app.profiling import load_report, profile_path
+from app.scheduler import request_backfill, request_sync, scheduler_status
+from app.snapshot import result_snapshot
+from app.services.archive import archive_stats
+from app.services.rankings import leaderboards
+from app.services.suspicious import detection_stats
+from app.services.whale_feed import whale_feed
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
-@router.post("/sync")
+@router.post("/sync", status_code=202)
 def sync_all():
-    sync_trades()
-    sync_markets()
-    sync_users()
-    return {"status": "ok"}
+    # The scheduler leader picks the request up; this worker may not be it.
+    return {"status": "queued", "requested_at": request_sync()}
+
+
+@router.get("/scheduler")
+def scheduler_stats():
+    return {"data": scheduler_status()}
+
+
+@router.post("/backfill", status_code=202)
+def backfill(max_pages: Optional[int] = Query(None, ge=1)):
+    # Runs on the scheduler leader; the result shows up under /admin/scheduler.
+    return {"status": "queued", "requested_at": request_backfill(max_pages)}
+
+
+@router.get("/cache")
+def cache_stats():
+    return {
+        "data": {
+            **result_cache.stats(),
+            **executor_stats(),
+            "snapshot": result_snapshot.stats(),
+        }
+    }
+
+
+@router.get("/db")
+def db_stats():
+    return {"data": pool_stats()}
+
+
+@router.get("/archive")
+def archive():
+    return {"data": archive_stats()}
+
+
+@router.get("/leaderboards")
+def leaderboard_stats():
+    return {"data": leaderboards.stats()}
+
+
+@router.get("/whale-feed")
+def whale_feed_stats():
+    return {"data": whale_feed.stats()}
+
+
+@router.get("/suspicious")
+def suspicious_stats():
+    return {"data": detection_stats()}
+
+
+@router.get("/profiles/{profile_id}")
+def profile_report(profile_id: str):
+    report = load_report(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {"data": report}
+
+
+@router.get("/profiles/{profile_id}/pstats")
+def profile_download(profile_id: str):
+    if load_report(profile_id) is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(
+        profile_path(profile_id, "prof"),
+        media_type="application/octet-stream",
+        filename=f"{profile_id}.prof",
+    )
@@ -1,10 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 
+from app.executor import run_analytics
 from app.services.hot_markets import hot_markets
 
 router = APIRouter(prefix="/markets", tags=["markets"])
 
 
 @router.get("/hot")
-def hot_market_list():
-    return {"data": hot_markets()}
+async def hot_market_list(since_hours: int = Query(24, ge=1, le=24 * 365)):
+    return {
+        "data": await run_analytics(
+            "hot-markets", hot_markets, {"since_hours": since_hours}
+        )
+    }
@@ -1,43 +1,139 @@
+import asyncio
+import json
 import os
+from itertools import islice
+from typing import Optional
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from app.services.smart_money import compute_smart_money, compute_suspicious_wallets
-from app.services.whales import compute_whales
+from app.executor import run_analytics
+from app.pagination import decode_cursor, encode_cursor, ndjson_response, wants_ndjson
+from app.services.smart_money import compute_smart_money
+from app.services.suspicious import (
+    DEFAULT_THRESHOLDS,
+    findings_page,
+    iter_findings,
+    request_config,
+    stored_findings,
+)
+from app.services.whale_feed import whale_feed
+from app.services.whales import compute_whales, iter_whales, whales_page
 
-DEFAULT_ACCOUNT_AGE_DAYS = int(os.getenv("SUSPICIOUS_ACCOUNT_AGE_DAYS", "30"))
-DEFAULT_LARGE_STAKE = float(os.getenv("SUSPICIOUS_LARGE_STAKE", "10000"))
-DEFAULT_PROFIT_THRESHOLD = float(os.getenv("SUSPICIOUS_PROFIT_THRESHOLD", "10000"))
-DEFAULT_REINVEST_MIN_DAYS = int(os.getenv("SUSPICIOUS_REINVEST_MIN_DAYS", "1"))
-DEFAULT_REINVEST_MAX_DAYS = int(os.getenv("SUSPICIOUS_REINVEST_MAX_DAYS", "30"))
+DEFAULT_SMART_MONEY_LIMIT = int(os.getenv("SMART_MONEY_LIMIT", "100"))
+DEFAULT_PAGE_SIZE = int(os.getenv("MONITOR_PAGE_SIZE", "500"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SUSPICIOUS_RETRY_AFTER_SECONDS = 5
 
 router = APIRouter(prefix="/monitor", tags=["monitor"])
 
 
 @router.get("/smart-money")
-def smart_money():
-    return {"data": compute_smart_money()}
+async def smart_money(limit: int = Query(DEFAULT_SMART_MONEY_LIMIT, ge=1, le=10000)):
+    return {
+        "data": await run_analytics(
+            "smart-money", compute_smart_money, {"limit": limit}
+        )
+    }
 
 
 @router.get("/whales")
-def whales():
-    return {"data": compute_whales()}
+async def whales(
+    request: Request,
+    since_hours: int = Query(24, ge=1, le=24 * 365),
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    cursor: Optional[str] = None,
+):
+    after = decode_cursor(cursor, 2)
+    if wants_ndjson(request):
+        return ndjson_response(
+            islice(iter_whales(after, since_hours=since_hours), limit)
+        )
+    if limit is None and after is None:
+        return {
+            "data": await run_analytics(
+                "whales", compute_whales, {"since_hours": since_hours}
+            )
+        }
+
+    page = await run_analytics(
+        "whales-page",
+        whales_page,
+        {
+            "limit": limit or DEFAULT_PAGE_SIZE,
+            "after": after,
+            "since_hours": since_hours,
+        },
+    )
+    return {"data": page["data"], "next_cursor": encode_cursor(page["next_cursor"])}
+
+
+@router.get("/whales/stream")
+async def whale_stream(request: Request):
+    subscriber = whale_feed.subscribe()
+    _, queue = subscriber
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: whale\ndata: {json.dumps(alert)}\n\n"
+        finally:
+            whale_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/suspicious-wallets")
-def suspicious_wallets(
-    account_age_days: int = Query(DEFAULT_ACCOUNT_AGE_DAYS, ge=1),
-    large_stake: float = Query(DEFAULT_LARGE_STAKE, ge=0),
-    profit_threshold: float = Query(DEFAULT_PROFIT_THRESHOLD, ge=0),
-    reinvest_min_days: int = Query(DEFAULT_REINVEST_MIN_DAYS, ge=0),
-    reinvest_max_days: int = Query(DEFAULT_REINVEST_MAX_DAYS, ge=0),
+async def suspicious_wallets(
+    request: Request,
+    account_age_days: int = Query(DEFAULT_THRESHOLDS["account_age_days"], ge=1),
+    large_stake: float = Query(DEFAULT_THRESHOLDS["large_stake"], ge=0),
+    profit_threshold: float = Query(DEFAULT_THRESHOLDS["profit_threshold"], ge=0),
+    reinvest_min_days: int = Query(DEFAULT_THRESHOLDS["reinvest_min_days"], ge=0),
+    reinvest_max_days: int = Query(DEFAULT_THRESHOLDS["reinvest_max_days"], ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    cursor: Optional[str] = None,
 ):
-    return {
-        "data": compute_suspicious_wallets(
-            account_age_days=account_age_days,
-            large_stake=large_stake,
-            profit_threshold=profit_threshold,
-            reinvest_min_days=reinvest_min_days,
-            reinvest_max_days=reinvest_max_days,
+    after = decode_cursor(cursor, 2)
+    config_id, status = await asyncio.to_thread(
+        request_config,
+        {
+            "account_age_days": account_age_days,
+            "large_stake": large_stake,
+            "profit_threshold": profit_threshold,
+            "reinvest_min_days": reinvest_min_days,
+            "reinvest_max_days": reinvest_max_days,
+        },
+    )
+    if status != "ready":
+        # Findings for new thresholds are built in the background.
+        return JSONResponse(
+            {"status": status, "data": []},
+            status_code=202,
+            headers={"Retry-After": str(SUSPICIOUS_RETRY_AFTER_SECONDS)},
         )
-    }
+    if wants_ndjson(request):
+        return ndjson_response(islice(iter_findings(config_id, after), limit))
+    if limit is None and after is None:
+        return {
+            "data": await run_analytics(
+                "suspicious-wallets", stored_findings, {"config_id": config_id}
+            )
+        }
+
+    page = await run_analytics(
+        "suspicious-wallets-page",
+        findings_page,
+        {"config_id": config_id, "limit": limit or DEFAULT_PAGE_SIZE, "after": after},
+    )
+    return {"data": page["data"], "next_cursor": encode_cursor(page["next_cursor"])}
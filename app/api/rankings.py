@@ -1,10 +1,32 @@
-from fastapi import APIRouter
+import asyncio
+from typing import Literal
 
-from app.services.rankings import top_profit
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services.rankings import DEFAULT_WINDOW, top_profit, wallet_rank
 
 router = APIRouter(prefix="/rankings", tags=["rankings"])
 
+Window = Literal["1d", "7d", "30d", "all"]
+
 
 @router.get("/top-profit")
-def top_profit_rankings():
-    return {"data": top_profit()}
+async def top_profit_rankings(
+    window: Window = DEFAULT_WINDOW,
+    limit: int = Query(20, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    # Leaderboards are kept ranked in this worker; a page is a cheap lookup.
+    return await asyncio.to_thread(top_profit, window, limit, offset)
+
+
+@router.get("/wallets/{address}")
+async def wallet_ranking(
+    address: str,
+    window: Window = DEFAULT_WINDOW,
+    neighbors: int = Query(5, ge=0, le=100),
+):
+    result = await asyncio.to_thread(wallet_rank, address, window, neighbors)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown wallet")
+    return {"data": result}
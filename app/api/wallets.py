@@ -0,0 +1,39 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.pagination import decode_cursor, encode_cursor
+from app.services.wallets import wallet_detail
+from app.time_utils import to_epoch
+
+router = APIRouter(prefix="/wallets", tags=["wallets"])
+
+
+def _epoch_param(name: str, value: Optional[str]) -> Optional[int]:
+    try:
+        return to_epoch(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+
+@router.get("/{address}")
+async def wallet(
+    address: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    # A lookup is a few index ranges for one wallet; no need for the pool.
+    page = await asyncio.to_thread(
+        wallet_detail,
+        address,
+        limit,
+        decode_cursor(cursor, 2),
+        _epoch_param("since", since),
+        _epoch_param("until", until),
+    )
+    if page is None:
+        raise HTTPException(status_code=404, detail="Unknown wallet")
+    return {"data": page["data"], "next_cursor": encode_cursor(page["next_cursor"])}
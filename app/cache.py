@@ -0,0 +1,90 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Tuple, TypeVar
+
+from app.db import get_data_generation
+
+T = TypeVar("T")
+
+CacheKey = Tuple[str, Tuple[Tuple[str, Hashable], ...]]
+
+MISSING = object()
+
+
+class ResultCache:
+    """LRU cache of endpoint results, invalidated by the data generation counter.
+
+    Entries are keyed by endpoint name plus query parameters and remember the
+    generation they were computed at; any write that bumps the generation makes
+    every older entry a miss.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint: str, params: Dict[str, Hashable]) -> CacheKey:
+        return (endpoint, tuple(sorted(params.items())))
+
+    def get(self, key: CacheKey, generation: int) -> Any:
+        """Return the cached value for ``key`` at ``generation``, or ``MISSING``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return MISSING
+
+    def put(self, key: CacheKey, generation: int, value: Any) -> None:
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current[0] > generation:
+                return
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(
+        self, endpoint: str, params: Dict[str, Hashable], compute: Callable[[], T]
+    ) -> T:
+        key = self.key(endpoint, params)
+        generation = get_data_generation()
+        value = self.get(key, generation)
+        if value is MISSING:
+            value = compute()
+            self.put(key, generation, value)
+        return value
+
+    def entries(self) -> List[Tuple[CacheKey, int, Any]]:
+        with self._lock:
+            return [
+                (key, generation, value)
+                for key, (generation, value) in self._entries.items()
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+result_cache = ResultCache(int(os.getenv("RESULT_CACHE_SIZE", "256")))
@@ -1,46 +1,330 @@
 import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.metrics import statement_timer
+from app.time_utils import epoch_or_none
 
 DB_PATH = os.getenv(
     "DATABASE_URL", "/home/hy125245/workspace/ploymarket_kit/polymarket.db"
 )
 
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+
+_BACKFILL_BATCH = 10_000
+
+DATA_GENERATION_KEY = "data_generation"
+
+# Wallets and markets are stored as integer keys into wallet_keys/market_keys.
+_TRADES_COLUMNS = """
+    id TEXT PRIMARY KEY,
+    market_id INTEGER,
+    user_id INTEGER,
+    side TEXT,
+    price REAL,
+    size REAL,
+    timestamp TEXT,
+    profit REAL,
+    realized INTEGER DEFAULT 0,
+    ts INTEGER
+"""
+
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that records how long each statement takes to execute."""
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            statement_timer(sql).observe(time.perf_counter() - started)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            statement_timer(sql).observe(time.perf_counter() - started)
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+
+def get_connection(
+    read_only: bool = False, check_same_thread: bool = True
+) -> sqlite3.Connection:
+    if read_only:
+        conn = sqlite3.connect(
+            f"file:{DB_PATH}?mode=ro",
+            uri=True,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            check_same_thread=check_same_thread,
+            factory=TimedConnection,
+        )
+    else:
+        conn = sqlite3.connect(
+            DB_PATH, cached_statements=SQLITE_STATEMENT_CACHE, factory=TimedConnection
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
     conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
     return conn
 
 
+class ConnectionPool:
+    """Per-thread SQLite connections: one writer and one read-only reader each.
+
+    Connections stay open for the life of the thread so the statement cache and
+    page cache are reused. Writers are serialized in-process by a lock (SQLite
+    allows one writer at a time anyway); readers never take it and, under WAL,
+    run concurrently with ingest.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "read_checkouts": 0,
+            "write_checkouts": 0,
+            "connections_opened": 0,
+            "write_wait_seconds": 0.0,
+            "write_wait_max_seconds": 0.0,
+        }
+
+    def _connection(self, read_only: bool) -> sqlite3.Connection:
+        local = self._local
+        # Connections must not cross a fork; worker processes open their own.
+        if getattr(local, "pid", None) != os.getpid():
+            local.pid = os.getpid()
+            local.reader = None
+            local.writer = None
+            local.depth = 0
+        attr = "reader" if read_only else "writer"
+        conn = getattr(local, attr)
+        if conn is None:
+            conn = get_connection(read_only=read_only)
+            setattr(local, attr, conn)
+            with self._stats_lock:
+                self._stats["connections_opened"] += 1
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection(read_only=True)
+        with self._stats_lock:
+            self._stats["read_checkouts"] += 1
+        yield conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection(read_only=False)
+        started = time.perf_counter()
+        with self._write_lock:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self._stats["write_checkouts"] += 1
+                self._stats["write_wait_seconds"] += waited
+                self._stats["write_wait_max_seconds"] = max(
+                    self._stats["write_wait_max_seconds"], waited
+                )
+            local = self._local
+            local.depth += 1
+            try:
+                yield conn
+                if local.depth == 1:
+                    conn.commit()
+            except BaseException:
+                if local.depth == 1:
+                    conn.rollback()
+                raise
+            finally:
+                local.depth -= 1
+
+    def close(self) -> None:
+        """Close the calling thread's connections."""
+        for attr in ("reader", "writer"):
+            conn = getattr(self._local, attr, None)
+            if conn is not None:
+                conn.close()
+                setattr(self._local, attr, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+pool = ConnectionPool()
+
+
 @contextmanager
 def db_session() -> Iterator[sqlite3.Connection]:
-    conn = get_connection()
+    with pool.write() as conn:
+        yield conn
+
+
+@contextmanager
+def read_session() -> Iterator[sqlite3.Connection]:
+    with pool.read() as conn:
+        yield conn
+
+
+@contextmanager
+def stream_session() -> Iterator[sqlite3.Connection]:
+    """A private read-only connection for generators that stream results.
+
+    Streaming response bodies are resumed on whichever worker thread is free,
+    so they cannot borrow the calling thread's pooled reader.
+    """
+    conn = get_connection(read_only=True, check_same_thread=False)
     try:
         yield conn
-        conn.commit()
     finally:
         conn.close()
 
 
-def init_db() -> None:
-    with db_session() as conn:
+def pool_stats() -> Dict[str, float]:
+    return pool.stats()
+
+
+def _migrate_trades_ts(conn: sqlite3.Connection) -> None:
+    """Add the epoch ``ts`` column to older databases and backfill it."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(trades)")}
+    if "ts" not in columns:
+        conn.execute("ALTER TABLE trades ADD COLUMN ts INTEGER")
+
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT rowid, timestamp
+            FROM trades
+            WHERE ts IS NULL AND timestamp IS NOT NULL AND rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+            """,
+            (last_rowid, _BACKFILL_BATCH),
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE trades SET ts = ? WHERE rowid = ?",
+            [(epoch_or_none(row["timestamp"]), row["rowid"]) for row in rows],
+        )
+        last_rowid = rows[-1]["rowid"]
+
+
+def _column_type(conn: sqlite3.Connection, table: str, column: str) -> Optional[str]:
+    for row in conn.execute(f"PRAGMA table_info({table})"):
+        if row["name"] == column:
+            return row["type"].upper()
+    return None
+
+
+def _ensure_index(
+    conn: sqlite3.Connection, name: str, table: str, columns: Tuple[str, ...]
+) -> None:
+    """Create index ``name``, replacing an older definition with other columns."""
+    existing = tuple(row["name"] for row in conn.execute(f"PRAGMA index_info({name})"))
+    if existing and existing != columns:
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+
+# Secondary indexes on trades; readers name them with INDEXED BY.
+TRADE_INDEXES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("idx_trades_user_market", ("user_id", "market_id")),
+    ("idx_trades_ts", ("ts",)),
+    # Covering: wallet histories and drill-downs never touch the table.
+    (
+        "idx_trades_user_ts",
+        ("user_id", "ts", "market_id", "side", "price", "size", "id"),
+    ),
+    ("idx_trades_market_ts", ("market_id", "ts")),
+)
+
+
+def create_trade_indexes(conn: sqlite3.Connection) -> None:
+    for name, columns in TRADE_INDEXES:
+        _ensure_index(conn, name, "trades", columns)
+
+
+def _migrate_trade_keys(conn: sqlite3.Connection) -> None:
+    """Move older databases from string wallet/market ids to integer keys.
+
+    The trades table is rebuilt with its addresses and condition ids replaced
+    by ``wallet_keys``/``market_keys`` surrogates, keeping rowid order. The
+    derived ledger and rollup tables are dropped so startup rebuilds them.
+    """
+    if _column_type(conn, "trades", "user_id") == "TEXT":
         conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS trades (
-                id TEXT PRIMARY KEY,
-                market_id TEXT,
-                user_id TEXT,
-                side TEXT,
-                price REAL,
-                size REAL,
-                timestamp TEXT,
-                profit REAL,
-                realized INTEGER DEFAULT 0
-            )
-                        """
+            INSERT OR IGNORE INTO wallet_keys (address)
+            SELECT user_id FROM trades WHERE user_id IS NOT NULL ORDER BY rowid
+            """
+        )
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO market_keys (condition_id)
+            SELECT market_id FROM trades WHERE market_id IS NOT NULL ORDER BY rowid
+            """
+        )
+        conn.execute(f"CREATE TABLE trades_keyed ({_TRADES_COLUMNS})")
+        conn.execute(
+            """
+            INSERT INTO trades_keyed
+            (id, market_id, user_id, side, price, size, timestamp, profit, realized, ts)
+            SELECT t.id, m.id, w.id, t.side, t.price, t.size, t.timestamp,
+                   t.profit, t.realized, t.ts
+            FROM trades t
+            LEFT JOIN market_keys m ON m.condition_id = t.market_id
+            LEFT JOIN wallet_keys w ON w.address = t.user_id
+            ORDER BY t.rowid
+            """
         )
+        conn.execute("DROP TABLE trades")
+        conn.execute("ALTER TABLE trades_keyed RENAME TO trades")
+
+    for table, column in (
+        ("positions", "user_id"),
+        ("profit_events", "user_id"),
+        ("user_hourly", "user_id"),
+        ("market_hourly", "market_id"),
+    ):
+        if _column_type(conn, table, column) == "TEXT":
+            conn.execute(f"DROP TABLE {table}")
+
+
+def init_db() -> None:
+    with db_session() as conn:
+        for table, column in (
+            ("wallet_keys", "address"),
+            ("market_keys", "condition_id"),
+        ):
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    {column} TEXT NOT NULL UNIQUE
+                )
+                """
+            )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS trades ({_TRADES_COLUMNS})")
+        _migrate_trades_ts(conn)
+        _migrate_trade_keys(conn)
+        create_trade_indexes(conn)
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS markets (
@@ -49,7 +333,194 @@ def init_db() -> None:
                 volume_24h REAL,
                 volume REAL,
                 status TEXT,
-                created_at TEXT
+                created_at TEXT,
+                content_hash TEXT
+            )
+            """
+        )
+        if _column_type(conn, "markets", "content_hash") is None:
+            conn.execute("ALTER TABLE markets ADD COLUMN content_hash TEXT")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS positions (
+                user_id INTEGER,
+                market_id INTEGER,
+                position REAL,
+                cost REAL,
+                last_ts INTEGER,
+                PRIMARY KEY (user_id, market_id)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS profit_events (
+                trade_id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                market_id INTEGER,
+                ts INTEGER,
+                profit REAL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_profit_events_pair ON profit_events (user_id, market_id)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_profit_events_ts ON profit_events (ts)"
+        )
+        _ensure_index(
+            conn,
+            "idx_profit_events_user_ts",
+            "profit_events",
+            ("user_id", "ts", "market_id", "profit"),
+        )
+        # Wallets whose profit events changed, in commit order; a NULL wallet
+        # means all of them. Leaderboards in every worker catch up from here.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS profit_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER
+            )
+            """
+        )
+        # Whale feed alerts, published by the ingesting worker and streamed by
+        # every worker from here.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS whale_alerts (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT
+            )
+            """
+        )
+        # Each pair's position as of the retention horizon. The trades before
+        # it are deleted, so replays start from here instead of zero.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ledger_base (
+                user_id INTEGER,
+                market_id INTEGER,
+                position REAL,
+                cost REAL,
+                last_ts INTEGER,
+                PRIMARY KEY (user_id, market_id)
+            ) WITHOUT ROWID
+            """
+        )
+        # Pairs bulk ingest committed but has not replayed into the ledger yet,
+        # with the earliest trade time written for each.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ledger_dirty (
+                user_id INTEGER,
+                market_id INTEGER,
+                since_ts INTEGER,
+                PRIMARY KEY (user_id, market_id)
+            ) WITHOUT ROWID
+            """
+        )
+        for table, column in (
+            ("user_hourly", "user_id"),
+            ("market_hourly", "market_id"),
+        ):
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {column} INTEGER,
+                    hour INTEGER,
+                    notional REAL,
+                    trade_count INTEGER,
+                    PRIMARY KEY ({column}, hour)
+                )
+                """
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_hour ON {table} (hour)"
+            )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS suspicious_configs (
+                id INTEGER PRIMARY KEY,
+                account_age_days INTEGER,
+                large_stake REAL,
+                profit_threshold REAL,
+                reinvest_min_days INTEGER,
+                reinvest_max_days INTEGER,
+                status TEXT NOT NULL DEFAULT 'building',
+                built_at INTEGER,
+                last_used_at INTEGER,
+                claimed_by TEXT,
+                claimed_at INTEGER,
+                UNIQUE (
+                    account_age_days,
+                    large_stake,
+                    profit_threshold,
+                    reinvest_min_days,
+                    reinvest_max_days
+                )
+            )
+            """
+        )
+        for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "INTEGER")):
+            if _column_type(conn, "suspicious_configs", column) is None:
+                conn.execute(
+                    f"ALTER TABLE suspicious_configs ADD COLUMN {column} {kind}"
+                )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS wallet_detection_state (
+                config_id INTEGER,
+                user_id INTEGER,
+                first_ts INTEGER,
+                early_large_bets INTEGER,
+                early_profit REAL,
+                profit_hit_ts INTEGER,
+                PRIMARY KEY (config_id, user_id)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS suspicious_findings (
+                config_id INTEGER,
+                user_id INTEGER,
+                idx INTEGER,
+                reason TEXT,
+                market_id INTEGER,
+                ts INTEGER,
+                stake REAL,
+                profit_hit_ts INTEGER,
+                PRIMARY KEY (config_id, user_id, idx)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS suspicious_dirty (
+                config_id INTEGER,
+                user_id INTEGER,
+                since_ts INTEGER,
+                PRIMARY KEY (config_id, user_id)
+            )
+            """
+        )
+        # One row per UTC day that has trades; see app.services.archive.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trade_partitions (
+                day INTEGER PRIMARY KEY,
+                changes INTEGER NOT NULL DEFAULT 0,
+                pruned_version INTEGER
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
             )
             """
         )
@@ -61,3 +532,37 @@ def init_db() -> None:
             )
             """
         )
+
+
+def get_sync_state(key: str) -> Optional[str]:
+    with read_session() as conn:
+        row = conn.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key,)
+        ).fetchone()
+    return row["value"] if row else None
+
+
+def set_sync_state(key: str, value: Optional[str]) -> None:
+    with db_session() as conn:
+        if value is None:
+            conn.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+
+def bump_data_generation(conn: sqlite3.Connection) -> None:
+    """Mark derived results as stale; call inside the transaction that changed data."""
+    conn.execute(
+        """
+        INSERT INTO sync_state (key, value) VALUES (?, '1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """,
+        (DATA_GENERATION_KEY,),
+    )
+
+
+def get_data_generation() -> int:
+    return int(get_sync_state(DATA_GENERATION_KEY) or 0)
@@ -0,0 +1,144 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.cache import MISSING, CacheKey, result_cache
+from app.db import get_data_generation
+from app.metrics import REGISTRY, Snapshot
+from app.profiling import attach_report, profile_call, profile_requested
+from app.snapshot import result_snapshot
+
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "2"))
+ANALYTICS_TIMEOUT_SECONDS = float(os.getenv("ANALYTICS_TIMEOUT_SECONDS", "60"))
+
+_executor: Optional[Executor] = None
+_inflight: Dict[Tuple[CacheKey, int], "asyncio.Future[Any]"] = {}
+_stats: Dict[str, int] = {"computations": 0, "coalesced": 0, "timeouts": 0}
+
+
+def get_executor() -> Optional[Executor]:
+    """Process pool for heavy analytics; ``None`` runs them on the thread pool."""
+    global _executor
+    if _executor is None and ANALYTICS_WORKERS > 0:
+        # Spawn rather than fork: the API process has live threads and SQLite
+        # connections that must not be copied into workers.
+        _executor = ProcessPoolExecutor(
+            max_workers=ANALYTICS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _run_collecting(
+    fn: Callable[..., Any], params: Dict[str, Any]
+) -> Tuple[Any, Snapshot]:
+    """Run in an analytics worker and hand back the metrics the call recorded."""
+    result = fn(**params)
+    return result, REGISTRY.drain()
+
+
+async def _compute(fn: Callable[..., Any], params: Dict[str, Any]) -> Any:
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    if executor is None:
+        return await loop.run_in_executor(None, functools.partial(fn, **params))
+    result, snapshot = await loop.run_in_executor(
+        executor, functools.partial(_run_collecting, fn, params)
+    )
+    REGISTRY.merge(snapshot)
+    return result
+
+
+async def _run_profiled(
+    fn: Callable[..., Any], params: Dict[str, Hashable], timeout: float
+) -> Any:
+    """Compute ``fn(**params)`` under the profiler, bypassing cache and coalescing."""
+    started = time.perf_counter()
+    result, report = await asyncio.wait_for(
+        _compute(profile_call, {"fn": fn, "params": params}), timeout
+    )
+    # Queueing for a worker and shipping the result back to this process.
+    report["phases"]["dispatch"] = round(
+        time.perf_counter() - started - report["wall_seconds"], 6
+    )
+    report["_returned_at"] = time.perf_counter()
+    attach_report(report)
+    return result
+
+
+def _timed_out(endpoint: str, timeout: float) -> HTTPException:
+    _stats["timeouts"] += 1
+    return HTTPException(
+        status_code=504, detail=f"{endpoint} timed out after {timeout:g}s"
+    )
+
+
+async def run_analytics(
+    endpoint: str,
+    fn: Callable[..., Any],
+    params: Optional[Dict[str, Hashable]] = None,
+    timeout: float = ANALYTICS_TIMEOUT_SECONDS,
+) -> Any:
+    """Serve ``fn(**params)`` from the result cache, the snapshot or the pool.
+
+    Identical requests (same endpoint, parameters and data generation) that
+    arrive while a computation is running await that one computation rather
+    than starting their own. Each caller waits at most ``timeout`` seconds; a
+    timed-out caller gets a 504 while the shared computation keeps running for
+    anyone else waiting on it. A result another worker, or a previous run,
+    saved for the same generation is served from the snapshot. Requests being
+    profiled always compute afresh.
+    """
+    params = params or {}
+    if profile_requested():
+        try:
+            return await _run_profiled(fn, params, timeout)
+        except asyncio.TimeoutError:
+            raise _timed_out(endpoint, timeout)
+    key = result_cache.key(endpoint, params)
+    generation = get_data_generation()
+    cached = result_cache.get(key, generation)
+    if cached is not MISSING:
+        return cached
+    cached = result_snapshot.get(key, generation)
+    if cached is not MISSING:
+        result_cache.put(key, generation, cached)
+        return cached
+
+    flight = (key, generation)
+    future = _inflight.get(flight)
+    if future is None:
+        future = asyncio.ensure_future(_compute(fn, params))
+        _inflight[flight] = future
+
+        def _finish(done: "asyncio.Future[Any]") -> None:
+            _inflight.pop(flight, None)
+            if not done.cancelled() and done.exception() is None:
+                result_cache.put(key, generation, done.result())
+
+        future.add_done_callback(_finish)
+        _stats["computations"] += 1
+    else:
+        _stats["coalesced"] += 1
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        raise _timed_out(endpoint, timeout)
+
+
+def executor_stats() -> Dict[str, int]:
+    return {**_stats, "inflight": len(_inflight), "workers": ANALYTICS_WORKERS}
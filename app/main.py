@@ -1,14 +1,25 @@
 import logging
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.admin import router as admin_router
 from app.api.markets import router as markets_router
 from app.api.monitor import router as monitor_router
 from app.api.rankings import router as rankings_router
+from app.api.wallets import router as wallets_router
 from app.db import init_db
-from app.scheduler import start_scheduler
+from app.executor import shutdown_executor
+from app.metrics import CONTENT_TYPE, REGISTRY
+from app.polymarket.bulk import replay_dirty_pairs
+from app.profiling import PROFILE_TOKENS, ProfilingMiddleware
+from app.scheduler import start_scheduler, stop_scheduler
+from app.services.archive import ensure_partitions
+from app.services.ledger import ensure_ledger
+from app.services.rollups import ensure_rollups
+from app.services.suspicious import ensure_suspicious, shutdown_suspicious
+from app.services.whale_feed import whale_feed
+from app.snapshot import start_snapshots, stop_snapshots
 
 logging.basicConfig(level=logging.INFO)
 
@@ -21,10 +32,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if PROFILE_TOKENS:
+    # Without tokens profiling is off and requests skip the middleware entirely.
+    app.add_middleware(ProfilingMiddleware)
 
 app.include_router(monitor_router)
 app.include_router(rankings_router)
 app.include_router(markets_router)
+app.include_router(wallets_router)
 app.include_router(admin_router)
 
 
@@ -33,7 +48,28 @@ def demo():
     return {"status": "ok", "message": "demo endpoint"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.on_event("startup")
 def startup() -> None:
     init_db()
+    ensure_ledger()
+    replay_dirty_pairs()
+    ensure_rollups()
+    ensure_partitions()
+    ensure_suspicious()
+    whale_feed.start()
     start_scheduler()
+    start_snapshots()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    stop_scheduler()
+    shutdown_executor()
+    stop_snapshots()
+    whale_feed.stop()
+    shutdown_suspicious()
@@ -0,0 +1,314 @@
+import abc
+import bisect
+import functools
+import hashlib
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+LabelValues = Tuple[str, ...]
+Snapshot = Dict[str, Dict[LabelValues, Any]]
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+ROW_BUCKETS = (0, 1, 10, 100, 500, 1000, 5000, 10000, 50000, 100000, 1000000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> Snapshot:
+        """Take and reset every value; analytics workers ship these to the API."""
+        return {name: metric.drain() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshot: Snapshot) -> None:
+        for name, values in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is not None and values:
+                metric.merge(values)
+
+
+REGISTRY = Registry()
+
+
+class Metric(abc.ABC):
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple([str(labels[name]) for name in self.labelnames])
+
+    def _labels(self, key: LabelValues, *extra: Tuple[str, str]) -> str:
+        pairs = [*zip(self.labelnames, key), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def drain(self) -> Dict[LabelValues, Any]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    @abc.abstractmethod
+    def lines(self) -> List[str]:
+        """Sample lines in the Prometheus text format."""
+
+    @abc.abstractmethod
+    def merge(self, values: Dict[LabelValues, Any]) -> None:
+        """Add values drained from another process's registry."""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in values]
+
+    def merge(self, values: Dict[LabelValues, float]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+
+class HistogramChild:
+    """One label combination of a histogram; hold on to it on hot paths."""
+
+    __slots__ = ("_buckets", "_lock", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...], lock: threading.Lock) -> None:
+        self._buckets = buckets
+        self._lock = lock
+        # Per-bucket counts; the last is +Inf.
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; an observation is one bisect and three additions."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def labels(self, *values: Any) -> HistogramChild:
+        key = tuple([str(value) for value in values])
+        child = self._values.get(key)
+        if child is None:
+            with self._lock:
+                child = self._values.setdefault(
+                    key, HistogramChild(self.buckets, self._lock)
+                )
+        return child
+
+    def observe(self, value: float, **labels: Any) -> None:
+        self.labels(*[labels[name] for name in self.labelnames]).observe(value)
+
+    def count(self, **labels: Any) -> int:
+        child = self._values.get(self._key(labels))
+        return child.count if child else 0
+
+    def _snapshot(self) -> List[Tuple[LabelValues, Tuple[List[int], float, int]]]:
+        with self._lock:
+            return sorted(
+                (key, (list(child.counts), child.total, child.count))
+                for key, child in self._values.items()
+                if child.count
+            )
+
+    def drain(self) -> Dict[LabelValues, Any]:
+        # Children stay registered (callers may hold them); only reset them.
+        snapshot = {}
+        with self._lock:
+            for key, child in self._values.items():
+                if child.count:
+                    snapshot[key] = (list(child.counts), child.total, child.count)
+                    child.counts = [0] * len(child.counts)
+                    child.total = 0.0
+                    child.count = 0
+        return snapshot
+
+    def lines(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._snapshot():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{self._labels(key, ('le', str(bound)))} "
+                    f"{cumulative}"
+                )
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+    def merge(self, values: Dict[LabelValues, Any]) -> None:
+        for key, (counts, total, count) in values.items():
+            child = self.labels(*key)
+            with self._lock:
+                child.counts = [a + b for a, b in zip(child.counts, counts)]
+                child.total += total
+                child.count += count
+
+
+SERVICE_SECONDS = Histogram(
+    "service_seconds", "Wall time of analytics service calls.", ["service"]
+)
+SERVICE_ROWS = Counter(
+    "service_rows_scanned_total",
+    "Rows read from SQLite or processed in Python by analytics services.",
+    ["service"],
+)
+SQL_SECONDS = Histogram(
+    "sql_statement_seconds",
+    "Time to execute a SQL statement, up to its first row.",
+    ["statement"],
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_seconds", "Latency of Polymarket API requests.", ["path"]
+)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total",
+    "Polymarket API requests by path and HTTP status.",
+    ["path", "status"],
+)
+INGEST_ROWS = Counter(
+    "ingest_rows_total",
+    "Rows written by ingest, by table and outcome.",
+    ["table", "outcome"],
+)
+SYNC_ROWS = Histogram(
+    "sync_rows_upserted", "Rows upserted per sync run.", ["job"], buckets=ROW_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    "scheduler_job_seconds", "Duration of scheduler job runs.", ["job"]
+)
+JOB_LAG_SECONDS = Histogram(
+    "scheduler_job_lag_seconds",
+    "Delay between a job's scheduled and actual start.",
+    ["job"],
+)
+JOB_FAILURES = Counter(
+    "scheduler_job_failures_total", "Scheduler job runs that failed.", ["job"]
+)
+
+
+def timed_service(fn: F) -> F:
+    """Record each call's wall time under ``service_seconds``."""
+    service = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            SERVICE_SECONDS.observe(time.perf_counter() - started, service=service)
+
+    return wrapper  # type: ignore[return-value]
+
+
+_PLACEHOLDER_RUN = re.compile(r"\?(?:\s*,\s*\?)+")
+_STATEMENT_PREFIX_LENGTH = 100
+_MAX_STATEMENT_TIMERS = 10000
+_statement_timers: Dict[str, HistogramChild] = {}
+
+
+def statement_label(sql: str) -> str:
+    """Collapse whitespace and placeholder lists so each query has one label.
+
+    The label is the start of the normalized text followed by a hash of all of
+    it, so statements sharing a long prefix still get distinct labels.
+    """
+    normalized = _PLACEHOLDER_RUN.sub("?, ...", " ".join(sql.split()))
+    digest = hashlib.blake2b(normalized.encode(), digest_size=4).hexdigest()
+    return f"{normalized[:_STATEMENT_PREFIX_LENGTH].rstrip()} #{digest}"
+
+
+def statement_timer(sql: str) -> HistogramChild:
+    """The ``sql_statement_seconds`` child for ``sql``, cached by exact text."""
+    timer = _statement_timers.get(sql)
+    if timer is None:
+        timer = SQL_SECONDS.labels(statement_label(sql))
+        if len(_statement_timers) < _MAX_STATEMENT_TIMERS:
+            _statement_timers[sql] = timer
+    return timer
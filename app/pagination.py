@@ -0,0 +1,41 @@
+import base64
+import binascii
+import json
+from typing import Any, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+NDJSON = "application/x-ndjson"
+
+
+def encode_cursor(position: Optional[Tuple[Any, ...]]) -> Optional[str]:
+    if position is None:
+        return None
+    raw = json.dumps(list(position), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], arity: int) -> Optional[Tuple[Any, ...]]:
+    """Turn an opaque ``cursor`` back into the position tuple it was built from."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        position = None
+    if not isinstance(position, list) or len(position) != arity:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(position)
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+def ndjson_response(items: Iterable[Any]) -> StreamingResponse:
+    """Stream ``items`` one JSON document per line as the iterable yields them."""
+    return StreamingResponse(
+        (json.dumps(item) + "\n" for item in items), media_type=NDJSON
+    )
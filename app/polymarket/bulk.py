@@ -0,0 +1,284 @@
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from itertools import chain
+from typing import Any, Deque, Dict, Iterable, List, Set
+
+from app.db import bump_data_generation, db_session
+from app.polymarket.client import (
+    INSERT_TRADE,
+    encode_trades,
+    record_ingest,
+    trade_row,
+)
+from app.services.archive import touch_partitions, touch_staged_partitions
+from app.services.ledger import (
+    STORED_COLUMNS,
+    Pair,
+    TradeDiff,
+    TradeRow,
+    diff_against,
+    replay_marked_pairs,
+)
+from app.services.rollups import add_staged_rollups, update_rollups
+from app.services.suspicious import mark_wallets_dirty, refresh_dirty
+from app.services.trade_store import archived_copies
+from app.services.whale_feed import whale_feed
+
+logger = logging.getLogger(__name__)
+
+BULK_INGEST_BATCH_SIZE = int(os.getenv("BULK_INGEST_BATCH_SIZE", "50000"))
+BULK_INGEST_RECENT_IDS = int(os.getenv("BULK_INGEST_RECENT_IDS", "1000000"))
+
+
+class RecentIds:
+    """Bounded set of trade ids committed by this process, oldest evicted first."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._ids: Set[str] = set()
+        self._order: Deque[str] = deque()
+
+    def __contains__(self, trade_id: str) -> bool:
+        return trade_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def update(self, trade_ids: Iterable[str]) -> None:
+        for trade_id in trade_ids:
+            if trade_id in self._ids:
+                continue
+            self._ids.add(trade_id)
+            self._order.append(trade_id)
+        while len(self._order) > self.capacity:
+            self._ids.discard(self._order.popleft())
+
+
+_MARK_PAIR = """
+    INSERT INTO ledger_dirty (user_id, market_id, since_ts) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, market_id)
+    DO UPDATE SET since_ts = MIN(since_ts, excluded.since_ts)
+"""
+
+
+def _mark_pairs(
+    conn: sqlite3.Connection, changed: List[TradeRow], replaced: List[sqlite3.Row]
+) -> None:
+    """Queue the pairs whose trades a batch wrote or overwrote for replay."""
+    since: Dict[Pair, int] = {}
+    for user_id, market_id, ts in chain(
+        ((row.user_id, row.market_id, row.ts) for row in changed),
+        ((row["user_id"], row["market_id"], row["ts"]) for row in replaced),
+    ):
+        if user_id is None or market_id is None or ts is None:
+            continue
+        pair = (user_id, market_id)
+        if pair not in since or ts < since[pair]:
+            since[pair] = ts
+    conn.executemany(_MARK_PAIR, [(*pair, ts) for pair, ts in since.items()])
+
+
+def replay_dirty_pairs() -> int:
+    """Replay the ledger pairs left by bulk ingest and re-check their wallets.
+
+    ``ledger_dirty`` is filled in the same transaction as each batch, so pairs
+    from a load that crashed before finishing are picked up here too; startup
+    calls this for that reason. Returns the number of pairs replayed.
+    """
+    started = time.perf_counter()
+    with db_session() as conn:
+        touched = dict(
+            conn.execute(
+                "SELECT user_id, MIN(since_ts) FROM ledger_dirty GROUP BY user_id"
+            ).fetchall()
+        )
+        pairs = replay_marked_pairs(conn)
+        if not pairs:
+            return 0
+        # Detection reads the ledger, so it runs after the replay.
+        mark_wallets_dirty(conn, touched)
+        refresh_dirty(conn)
+        conn.execute("DELETE FROM ledger_dirty")
+        bump_data_generation(conn)
+    logger.info(
+        "Replayed %d ledger pairs in %.2fs", pairs, time.perf_counter() - started
+    )
+    return pairs
+
+
+class BulkTradeIngest:
+    """Load large trade volumes in big transactions through a staging table.
+
+    Trades whose id was already committed by this ingest are dropped in memory.
+    The rest are deduplicated per batch and staged in a temp table. When no
+    staged id is stored yet, the batch is copied into ``trades`` and counted
+    into the rollups set-wise, without a per-row diff. Otherwise one join
+    against ``trades`` finds which staged rows are new or changed, and only
+    those are written.
+
+    Ledger replays for the touched (user, market) pairs are deferred to
+    ``close()``, because backfilled history arrives out of order and would
+    otherwise replay the same pairs on every batch. The pairs are recorded in
+    ``ledger_dirty`` inside each batch's transaction, so a crash cannot lose
+    them. Readers rely on the ``trades`` indexes while a load runs, so they
+    are kept; new batches are inserted in index order instead.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BULK_INGEST_BATCH_SIZE,
+        recent_ids: int = BULK_INGEST_RECENT_IDS,
+    ) -> None:
+        self.batch_size = batch_size
+        self._recent = RecentIds(recent_ids)
+        self._pending: Dict[str, TradeRow] = {}
+        self._started = time.perf_counter()
+        self._stats: Dict[str, Any] = {
+            "received": 0,
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "skipped_duplicates": 0,
+            "rejected": 0,
+            "commits": 0,
+            "commit_seconds": 0.0,
+            "commit_max_seconds": 0.0,
+        }
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, trades: Iterable[Dict[str, Any]]) -> None:
+        for trade in trades:
+            self._stats["received"] += 1
+            row = trade_row(trade)
+            if row is None:
+                self._stats["rejected"] += 1
+                continue
+            if row.id in self._recent:
+                self._stats["skipped_duplicates"] += 1
+                continue
+            if row.id in self._pending:
+                # The later copy of a trade seen twice in one batch wins.
+                self._stats["skipped_duplicates"] += 1
+            self._pending[row.id] = row
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        started = time.perf_counter()
+        with db_session() as conn:
+            latest = {
+                row.id: row for row in encode_trades(conn, list(pending.values()))
+            }
+            conn.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS trades_staging (
+                    id TEXT,
+                    market_id INTEGER,
+                    user_id INTEGER,
+                    side TEXT,
+                    price REAL,
+                    size REAL,
+                    timestamp TEXT,
+                    profit REAL,
+                    realized INTEGER,
+                    ts INTEGER
+                )
+                """
+            )
+            conn.execute("DELETE FROM trades_staging")
+            conn.executemany(
+                f"INSERT INTO trades_staging ({STORED_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                latest.values(),
+            )
+            stored = conn.execute(
+                f"""
+                SELECT {STORED_COLUMNS}
+                FROM trades
+                WHERE id IN (SELECT id FROM trades_staging)
+                """
+            ).fetchall()
+            found = {row["id"] for row in stored}
+            stored.extend(
+                archived_copies(
+                    conn, (row for row in latest.values() if row.id not in found)
+                )
+            )
+            if not stored:
+                # Every staged row is new: copy, count and mark set-wise. The
+                # copy follows the widest index so its pages fill in order.
+                diff = TradeDiff(list(latest.values()), [], set())
+                conn.execute(
+                    f"INSERT INTO trades ({STORED_COLUMNS}) "
+                    f"SELECT {STORED_COLUMNS} FROM trades_staging ORDER BY user_id, ts"
+                )
+                add_staged_rollups(conn, "trades_staging")
+                touch_staged_partitions(conn, "trades_staging")
+                conn.execute(
+                    """
+                    INSERT INTO ledger_dirty (user_id, market_id, since_ts)
+                    SELECT user_id, market_id, MIN(ts) FROM trades_staging
+                    WHERE user_id IS NOT NULL
+                      AND market_id IS NOT NULL
+                      AND ts IS NOT NULL
+                    GROUP BY user_id, market_id
+                    ON CONFLICT (user_id, market_id)
+                    DO UPDATE SET since_ts = MIN(since_ts, excluded.since_ts)
+                    """
+                )
+            else:
+                diff = diff_against(latest, stored)
+                conn.executemany(INSERT_TRADE, diff.changed)
+                update_rollups(conn, diff.changed, diff.replaced)
+                touch_partitions(conn, diff.changed, diff.replaced)
+                _mark_pairs(conn, diff.changed, diff.replaced)
+            if diff.changed:
+                bump_data_generation(conn)
+        elapsed = time.perf_counter() - started
+
+        self._recent.update(latest)
+        whale_feed.observe(diff.changed, diff.replaced)
+
+        record_ingest(len(latest), diff)
+        stats = self._stats
+        stats["inserted"] += len(diff.changed) - len(diff.replaced)
+        stats["updated"] += len(diff.replaced)
+        stats["unchanged"] += len(latest) - len(diff.changed)
+        stats["commits"] += 1
+        stats["commit_seconds"] += elapsed
+        stats["commit_max_seconds"] = max(stats["commit_max_seconds"], elapsed)
+
+    def close(self) -> Dict[str, Any]:
+        """Flush what is pending, replay the touched ledger pairs and report."""
+        self.flush()
+        self._stats["replayed_pairs"] = replay_dirty_pairs()
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        stats = dict(self._stats)
+        stats["seconds"] = round(elapsed, 4)
+        stats["rows_per_second"] = (
+            round(stats["received"] / elapsed, 1) if elapsed else None
+        )
+        stats["commit_seconds"] = round(stats["commit_seconds"], 4)
+        stats["commit_max_seconds"] = round(stats["commit_max_seconds"], 4)
+        return stats
+
+
+def bulk_upsert_trades(
+    batches: Iterable[List[Dict[str, Any]]], batch_size: int = BULK_INGEST_BATCH_SIZE
+) -> Dict[str, Any]:
+    ingest = BulkTradeIngest(batch_size=batch_size)
+    for batch in batches:
+        ingest.add(batch)
+    return ingest.close()
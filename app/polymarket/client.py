@@ -1,13 +1,32 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
-from typing import Any, Dict, List, Optional
+import random
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 
-from app.db import db_session
+from app.db import bump_data_generation, db_session
+from app.metrics import INGEST_ROWS, UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+from app.services.archive import touch_partitions
+from app.services.keys import encode_markets, encode_wallets
+from app.services.ledger import TradeDiff, TradeRow, diff_trades, update_ledger
+from app.services.rollups import update_rollups
+from app.services.suspicious import update_suspicious
+from app.services.whale_feed import whale_feed
+from app.time_utils import epoch_or_none
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_GAMMA_URL = "https://gamma-api.polymarket.com"
 DEFAULT_DATA_URL = "https://data-api.polymarket.com"
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 
 class PolymarketClient:
     def __init__(
@@ -19,11 +38,20 @@ class PolymarketClient:
             "POLYMARKET_GAMMA_URL", DEFAULT_GAMMA_URL
         )
         self.data_url = data_url or os.getenv("POLYMARKET_DATA_URL", DEFAULT_DATA_URL)
+        self._http = httpx.Client(timeout=30)
 
     def get(
         self, base_url: str, path: str, params: Optional[Dict[str, Any]] = None
     ) -> Any:
-        response = httpx.get(f"{base_url}{path}", params=params, timeout=30)
+        started = time.perf_counter()
+        try:
+            response = self._http.get(f"{base_url}{path}", params=params)
+        except httpx.TransportError:
+            UPSTREAM_REQUESTS.inc(path=path, status="error")
+            raise
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, path=path)
+        UPSTREAM_REQUESTS.inc(path=path, status=response.status_code)
         response.raise_for_status()
         return response.json()
 
@@ -55,57 +83,282 @@ class PolymarketClient:
         return []
 
 
+class AsyncPolymarketClient:
+    """Async counterpart of ``PolymarketClient`` over one pooled connection set.
+
+    Requests that hit a rate limit, a 5xx or a transport error are retried with
+    exponential backoff, honoring ``Retry-After`` when the server sends it.
+    """
+
+    def __init__(
+        self,
+        gamma_url: Optional[str] = None,
+        data_url: Optional[str] = None,
+        max_connections: int = 8,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.gamma_url = gamma_url or os.getenv(
+            "POLYMARKET_GAMMA_URL", DEFAULT_GAMMA_URL
+        )
+        self.data_url = data_url or os.getenv("POLYMARKET_DATA_URL", DEFAULT_DATA_URL)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._http = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncPolymarketClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    return max(float(retry_after), 0.0)
+                except ValueError:
+                    pass
+        return self.backoff * (2**attempt) * (0.5 + random.random() / 2)
+
+    async def get(
+        self, base_url: str, path: str, params: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        attempt = 0
+        while True:
+            response: Optional[httpx.Response] = None
+            started = time.perf_counter()
+            try:
+                response = await self._http.get(f"{base_url}{path}", params=params)
+            except httpx.TransportError:
+                UPSTREAM_REQUESTS.inc(path=path, status="error")
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                UPSTREAM_REQUESTS.inc(path=path, status=response.status_code)
+                if (
+                    response.status_code not in RETRY_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    response.raise_for_status()
+                    return response.json()
+            finally:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, path=path)
+
+            delay = self._retry_delay(attempt, response)
+            logger.warning(
+                "Retrying %s%s in %.2fs (attempt %d, status %s)",
+                base_url,
+                path,
+                delay,
+                attempt + 1,
+                response.status_code if response is not None else "error",
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def fetch_markets(
+        self,
+        limit: int = 500,
+        offset: int = 0,
+        order: str = "volume24hr",
+        ascending: bool = False,
+    ) -> List[Dict[str, Any]]:
+        return await self.get(
+            self.gamma_url,
+            "/markets",
+            {
+                "active": True,
+                "closed": False,
+                "limit": limit,
+                "offset": offset,
+                "order": order,
+                "ascending": ascending,
+            },
+        )
+
+    async def fetch_trades(
+        self, limit: int = 500, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        return await self.get(
+            self.data_url,
+            "/trades",
+            {
+                "limit": limit,
+                "offset": offset,
+            },
+        )
+
+
+def trade_id(trade: Dict[str, Any]) -> str:
+    return (
+        trade.get("transactionHash")
+        or trade.get("id")
+        or f"{trade.get('proxyWallet')}-{trade.get('timestamp')}-{trade.get('asset')}"
+    )
+
+
+def trade_row(trade: Dict[str, Any]) -> Optional[TradeRow]:
+    """A trade as a ``trades`` row; None, logged, if its timestamp is unreadable."""
+    ts = epoch_or_none(trade.get("timestamp"))
+    if ts is None and trade.get("timestamp") is not None:
+        logger.warning(
+            "Skipping trade %s with unreadable timestamp %r",
+            trade_id(trade),
+            trade.get("timestamp"),
+        )
+        INGEST_ROWS.inc(table="trades", outcome="rejected")
+        return None
+    return TradeRow(
+        trade_id(trade),
+        trade.get("conditionId"),
+        trade.get("proxyWallet"),
+        trade.get("side"),
+        trade.get("price"),
+        trade.get("size"),
+        trade.get("timestamp"),
+        trade.get("realizedPnl"),
+        1 if trade.get("realizedPnl") else 0,
+        ts,
+    )
+
+
+def encode_trades(conn: sqlite3.Connection, rows: List[TradeRow]) -> List[TradeRow]:
+    """Swap wallet addresses and condition ids for their integer keys."""
+    wallets = encode_wallets(conn, (row.user_id for row in rows))
+    markets = encode_markets(conn, (row.market_id for row in rows))
+    return [
+        row._replace(
+            user_id=wallets.get(row.user_id), market_id=markets.get(row.market_id)
+        )
+        for row in rows
+    ]
+
+
+INSERT_TRADE = """
+    INSERT OR REPLACE INTO trades
+    (id, market_id, user_id, side, price, size, timestamp, profit, realized, ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def record_ingest(received: int, diff: TradeDiff) -> None:
+    INGEST_ROWS.inc(
+        len(diff.changed) - len(diff.replaced), table="trades", outcome="inserted"
+    )
+    INGEST_ROWS.inc(len(diff.replaced), table="trades", outcome="updated")
+    INGEST_ROWS.inc(received - len(diff.changed), table="trades", outcome="unchanged")
+
+
 def upsert_trades(trades: List[Dict[str, Any]]) -> None:
-    if not trades:
+    rows = [row for row in map(trade_row, trades) if row is not None]
+    if not rows:
         return
     with db_session() as conn:
-        conn.executemany(
-            """
-            INSERT OR REPLACE INTO trades
-            (id, market_id, user_id, side, price, size, timestamp, profit, realized)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            [
-                (
-                    trade.get("transactionHash")
-                    or trade.get("id")
-                    or f"{trade.get('proxyWallet')}-{trade.get('timestamp')}-{trade.get('asset')}",
-                    trade.get("conditionId"),
-                    trade.get("proxyWallet"),
-                    trade.get("side"),
-                    trade.get("price"),
-                    trade.get("size"),
-                    trade.get("timestamp"),
-                    trade.get("realizedPnl"),
-                    1 if trade.get("realizedPnl") else 0,
-                )
-                for trade in trades
-            ],
-        )
+        rows = encode_trades(conn, rows)
+        diff = diff_trades(conn, rows)
+        # Rows identical to what is stored are skipped rather than rewritten.
+        conn.executemany(INSERT_TRADE, diff.changed)
+        update_ledger(conn, diff.changed, diff.stale)
+        update_rollups(conn, diff.changed, diff.replaced)
+        touch_partitions(conn, diff.changed, diff.replaced)
+        update_suspicious(conn, diff.changed, diff.replaced)
+        if diff.changed:
+            bump_data_generation(conn)
+    record_ingest(len(rows), diff)
+    whale_feed.observe(diff.changed, diff.replaced)
 
 
-def upsert_markets(markets: List[Dict[str, Any]]) -> None:
-    if not markets:
-        return
+def market_row(market: Dict[str, Any]) -> Tuple[Any, ...]:
+    """A Gamma market as a ``markets`` row, without its content hash."""
+    return (
+        market.get("conditionId") or market.get("id"),
+        market.get("question"),
+        market.get("volume24hr"),
+        market.get("volume"),
+        "active" if market.get("active") else "closed",
+        market.get("createdAt"),
+    )
+
+
+def market_hash(row: Tuple[Any, ...]) -> str:
+    return hashlib.blake2b(
+        json.dumps(row, separators=(",", ":")).encode(), digest_size=16
+    ).hexdigest()
+
+
+def upsert_markets(
+    markets: List[Dict[str, Any]], close_missing: bool = False
+) -> Dict[str, int]:
+    """Write new and changed markets in one transaction; skip unchanged ones.
+
+    Each row's content hash is compared with the stored one, so an unchanged
+    market costs a lookup rather than a rewrite. With ``close_missing`` the
+    batch is taken to be every active market, and stored active markets absent
+    from it are marked closed.
+    """
+    rows = {row[0]: row for row in map(market_row, markets) if row[0] is not None}
+    stats = {"new": 0, "updated": 0, "unchanged": 0, "closed": 0}
+    if not rows and not close_missing:
+        return stats
+    ids = json.dumps(list(rows))
     with db_session() as conn:
+        stored = dict(
+            conn.execute(
+                """
+                SELECT id, content_hash FROM markets
+                WHERE id IN (SELECT value FROM json_each(?))
+                """,
+                (ids,),
+            ).fetchall()
+        )
+        writes = []
+        for market_id, row in rows.items():
+            content_hash = market_hash(row)
+            if market_id not in stored:
+                stats["new"] += 1
+            elif stored[market_id] != content_hash:
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            writes.append((*row, content_hash))
+        encode_markets(conn, (row[0] for row in writes if row[0] not in stored))
         conn.executemany(
             """
             INSERT OR REPLACE INTO markets
-            (id, question, volume_24h, volume, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
+            (id, question, volume_24h, volume, status, created_at, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
-            [
-                (
-                    market.get("conditionId") or market.get("id"),
-                    market.get("question"),
-                    market.get("volume24hr"),
-                    market.get("volume"),
-                    "active" if market.get("active") else "closed",
-                    market.get("createdAt"),
-                )
-                for market in markets
-            ],
+            writes,
         )
+        if close_missing:
+            # The hash is cleared so the market is rewritten if it reopens.
+            stats["closed"] = conn.execute(
+                """
+                UPDATE markets SET status = 'closed', content_hash = NULL
+                WHERE status = 'active'
+                  AND id NOT IN (SELECT value FROM json_each(?))
+                """,
+                (ids,),
+            ).rowcount
+        if writes or stats["closed"]:
+            bump_data_generation(conn)
+    for outcome, count in stats.items():
+        INGEST_ROWS.inc(count, table="markets", outcome=outcome)
+    return stats
 
 
 def upsert_users(users: List[Dict[str, Any]]) -> None:
@@ -0,0 +1,240 @@
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import re
+import secrets
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_TOKENS = frozenset(
+    token.strip()
+    for token in os.getenv("PROFILE_TOKENS", "").split(",")
+    if token.strip()
+)
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "30"))
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "polymarket-profiles")
+)
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+PROFILE_HEADER = "x-profile-token"
+PROFILE_QUERY = "profile"
+PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+# Reports of the analytics calls profiled for the current request; only set
+# while ``ProfilingMiddleware`` handles a request that asked for profiling.
+_request_reports: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar(
+    "request_reports", default=None
+)
+_clock: ContextVar[Optional["PhaseClock"]] = ContextVar("phase_clock", default=None)
+# One profiler at a time per process; profiled requests are rare.
+_profile_lock = threading.Lock()
+
+
+class PhaseClock:
+    """Splits a profiled call's wall time into named phases, lap by lap."""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        """Charge the time since the previous lap to ``name``."""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+
+def phase_clock() -> Optional[PhaseClock]:
+    """The clock of the call being profiled, or ``None`` when not profiling.
+
+    Services check the result once and only lap when it is set, so unprofiled
+    calls pay a single context variable lookup.
+    """
+    return _clock.get()
+
+
+def profile_requested() -> bool:
+    return _request_reports.get() is not None
+
+
+def attach_report(report: Dict[str, Any]) -> None:
+    reports = _request_reports.get()
+    if reports is not None:
+        reports.append(report)
+
+
+def profile_path(profile_id: str, suffix: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{suffix}")
+
+
+def _function_label(key: Tuple[str, int, str]) -> Dict[str, Any]:
+    filename, line, name = key
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        filename = filename[len(cwd) :]
+    return {"function": name, "file": filename, "line": line}
+
+
+def _top_functions(stats: pstats.Stats, limit: int) -> List[Dict[str, Any]]:
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+    return [
+        {
+            **_function_label(key),
+            "calls": calls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+        }
+        for key, (_, calls, tottime, cumtime, _) in rows[:limit]
+    ]
+
+
+def _prune() -> None:
+    profiles = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".prof")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in profiles[: max(len(profiles) - PROFILE_KEEP, 0)]:
+        for suffix in ("prof", "json"):
+            try:
+                os.remove(profile_path(entry.name[: -len(".prof")], suffix))
+            except FileNotFoundError:
+                pass
+
+
+def profile_call(
+    fn: Callable[..., Any], params: Dict[str, Any]
+) -> Tuple[Any, Dict[str, Any]]:
+    """Run ``fn(**params)`` under cProfile and return its result and report.
+
+    The raw profile is written to ``PROFILE_DIR`` for download; the report
+    holds the phases the service lapped and its hottest functions by own time.
+    """
+    profile_id = f"{int(time.time())}-{secrets.token_hex(4)}"
+    clock = PhaseClock()
+    profiler = cProfile.Profile()
+    with _profile_lock:
+        token = _clock.set(clock)
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            result = fn(**params)
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - started
+            _clock.reset(token)
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id, "prof"))
+    _prune()
+    report = {
+        "profile_id": profile_id,
+        "service": getattr(fn, "__name__", repr(fn)),
+        "wall_seconds": round(wall, 6),
+        "phases": {name: round(value, 6) for name, value in clock.phases.items()},
+        "top": _top_functions(pstats.Stats(profiler), PROFILE_TOP_N),
+    }
+    return result, report
+
+
+def load_report(profile_id: str) -> Optional[Dict[str, Any]]:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id, "json")) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def _save_report(report: Dict[str, Any]) -> None:
+    try:
+        with open(profile_path(report["profile_id"], "json"), "w") as handle:
+            json.dump(report, handle)
+    except FileNotFoundError:
+        # Pruned by a newer profile in the meantime.
+        pass
+
+
+def _server_timing(reports: List[Dict[str, Any]]) -> str:
+    metrics = []
+    for report in reports:
+        for name, seconds in report["phases"].items():
+            metrics.append(f"{name};dur={seconds * 1000:.3f}")
+        metrics.append(f"total;dur={report['wall_seconds'] * 1000:.3f}")
+    return ", ".join(metrics)
+
+
+def _authorized(token: str) -> bool:
+    return any(hmac.compare_digest(token, allowed) for allowed in PROFILE_TOKENS)
+
+
+class ProfilingMiddleware:
+    """Profile the analytics calls of requests that carry an allowed token.
+
+    The token comes from the ``X-Profile-Token`` header or the ``profile``
+    query parameter. Profiled responses get ``X-Profile-Id`` and a
+    ``Server-Timing`` header with the call's phases; the full report and the
+    raw profile are served under ``/admin/profiles``. Requests without a token
+    pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = Headers(scope=scope).get(PROFILE_HEADER) or QueryParams(
+            scope["query_string"]
+        ).get(PROFILE_QUERY)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+        if not _authorized(token):
+            await JSONResponse({"detail": "Invalid profile token"}, status_code=403)(
+                scope, receive, send
+            )
+            return
+
+        reports: List[Dict[str, Any]] = []
+        reset = _request_reports.set(reports)
+
+        async def send_with_profile(message: Message) -> None:
+            if message["type"] == "http.response.start" and reports:
+                now = time.perf_counter()
+                for report in reports:
+                    # The service result arriving to the response starting is
+                    # mostly JSON encoding of the payload.
+                    phases = report["phases"]
+                    phases["serialize"] = round(
+                        phases.get("serialize", 0.0) + now - report.pop("_returned_at"),
+                        6,
+                    )
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (
+                        b"x-profile-id",
+                        ",".join(report["profile_id"] for report in reports).encode(),
+                    )
+                )
+                headers.append((b"server-timing", _server_timing(reports).encode()))
+                message = {**message, "headers": headers}
+                for report in reports:
+                    _save_report(report)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _request_reports.reset(reset)
@@ -1,49 +1,677 @@
+import asyncio
+import fcntl
+import functools
+import json
 import logging
-from typing import Optional
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import (
+    IO,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from app.db import DB_PATH, get_sync_state, set_sync_state
+from app.metrics import JOB_FAILURES, JOB_LAG_SECONDS, JOB_SECONDS, SYNC_ROWS
+from app.polymarket.bulk import BulkTradeIngest
 from app.polymarket.client import (
+    AsyncPolymarketClient,
     PolymarketClient,
+    trade_id,
     upsert_markets,
     upsert_trades,
     upsert_users,
 )
+from app.services.archive import run_maintenance, snapshot_open_days
+from app.services.rankings import trim_profit_changes
+from app.services.trade_store import refresh_trade_store
+from app.services.whale_feed import trim_whale_alerts, whale_feed
+from app.snapshot import SNAPSHOT_INTERVAL_SECONDS
+from app.time_utils import epoch_or_none
 
 logger = logging.getLogger(__name__)
 
+TRADES_PAGE_SIZE = int(os.getenv("SYNC_TRADES_PAGE_SIZE", "500"))
+TRADES_CONCURRENCY = int(os.getenv("SYNC_TRADES_CONCURRENCY", "4"))
+TRADES_MAX_PAGES = int(os.getenv("SYNC_TRADES_MAX_PAGES", "200"))
+SYNC_TRADES_INTERVAL_SECONDS = float(os.getenv("SYNC_TRADES_INTERVAL_SECONDS", "600"))
+SYNC_TRADES_MIN_INTERVAL_SECONDS = float(
+    os.getenv("SYNC_TRADES_MIN_INTERVAL_SECONDS", "30")
+)
+SYNC_TRADES_MAX_INTERVAL_SECONDS = float(
+    os.getenv("SYNC_TRADES_MAX_INTERVAL_SECONDS", "1800")
+)
+SYNC_MARKETS_INTERVAL_SECONDS = float(
+    os.getenv("SYNC_MARKETS_INTERVAL_SECONDS", "3600")
+)
+MARKETS_PAGE_SIZE = int(os.getenv("SYNC_MARKETS_PAGE_SIZE", "500"))
+MARKETS_MAX_PAGES = int(os.getenv("SYNC_MARKETS_MAX_PAGES", "200"))
+SYNC_USERS_INTERVAL_SECONDS = float(os.getenv("SYNC_USERS_INTERVAL_SECONDS", "21600"))
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", f"{DB_PATH}.scheduler.lock")
+# How often workers try for the leader lock and the leader checks for queued runs.
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "5"))
+
+HIGH_WATER_MARK_KEY = "trades_high_water_mark"
+SYNC_GAPS_KEY = "trades_sync_gaps"
+BACKFILL_OFFSET_KEY = "trades_backfill_offset"
+SYNC_REQUEST_KEY = "sync_requested_at"
+BACKFILL_REQUEST_KEY = "backfill_requested"
+BACKFILL_JOB = "backfill_trades"
+LEADER_KEY = "scheduler_leader"
+JOB_STATE_PREFIX = "scheduler_job:"
+
+
+def _load_high_water_mark() -> Tuple[Optional[int], Set[str]]:
+    raw = get_sync_state(HIGH_WATER_MARK_KEY)
+    if raw is None:
+        return None, set()
+    state = json.loads(raw)
+    return state["ts"], set(state["ids"])
+
+
+def _save_high_water_mark(
+    trades: List[Dict[str, Any]], hwm_ts: Optional[int], hwm_ids: Set[str]
+) -> None:
+    for trade in trades:
+        ts = epoch_or_none(trade.get("timestamp"))
+        if ts is None or (hwm_ts is not None and ts < hwm_ts):
+            continue
+        if hwm_ts is None or ts > hwm_ts:
+            hwm_ts, hwm_ids = ts, set()
+        hwm_ids.add(trade_id(trade))
+    if hwm_ts is not None:
+        set_sync_state(
+            HIGH_WATER_MARK_KEY, json.dumps({"ts": hwm_ts, "ids": sorted(hwm_ids)})
+        )
+
+
+def _is_unseen(trade: Dict[str, Any], hwm_ts: Optional[int], hwm_ids: Set[str]) -> bool:
+    if hwm_ts is None:
+        return True
+    ts = epoch_or_none(trade.get("timestamp"))
+    if ts is None:
+        return True
+    return ts > hwm_ts or (ts == hwm_ts and trade_id(trade) not in hwm_ids)
+
+
+async def _fetch_wave(
+    fetch: Callable[..., Awaitable[List[Dict[str, Any]]]],
+    offset: int,
+    pages: int,
+    page_size: int,
+) -> List[List[Dict[str, Any]]]:
+    return await asyncio.gather(
+        *(
+            fetch(limit=page_size, offset=offset + index * page_size)
+            for index in range(pages)
+        )
+    )
+
+
+class PageRun(NamedTuple):
+    trades: List[Dict[str, Any]]
+    pages: int
+    offset: int
+    reached: bool
+
+
+async def _page_until(
+    client: AsyncPolymarketClient,
+    offset: int,
+    mark_ts: Optional[int],
+    mark_ids: Set[str],
+    max_pages: int,
+    page_size: int,
+    concurrency: int,
+) -> PageRun:
+    """Page from ``offset`` until a trade at or behind the mark, a short page or
+    ``max_pages``; ``offset`` in the result is where an unfinished run resumes."""
+    fresh: List[Dict[str, Any]] = []
+    pages = 0
+    reached = False
+    while not reached and pages < max_pages:
+        wave = min(concurrency, max_pages - pages)
+        for page in await _fetch_wave(client.fetch_trades, offset, wave, page_size):
+            pages += 1
+            unseen = [trade for trade in page if _is_unseen(trade, mark_ts, mark_ids)]
+            fresh.extend(unseen)
+            if len(unseen) < len(page) or len(page) < page_size:
+                reached = True
+                break
+        if not reached:
+            offset += wave * page_size
+    return PageRun(fresh, pages, offset, reached)
+
+
+async def sync_trades_async(
+    client: AsyncPolymarketClient,
+    page_size: int = TRADES_PAGE_SIZE,
+    concurrency: int = TRADES_CONCURRENCY,
+    max_pages: int = TRADES_MAX_PAGES,
+) -> Dict[str, Any]:
+    """Page through the newest trades until reaching the persisted high-water mark.
+
+    Pages are requested ``concurrency`` at a time. Paging stops at the first page
+    that contains an already-seen trade, at a short page, or after ``max_pages``.
+    A sync that runs out of pages first still moves the mark to the newest
+    trade, and records the unread stretch as a gap: its resume offset and the
+    old mark that closes it. Later syncs spend their leftover pages on the gaps
+    until each reaches its mark. Upstream lists newest first, so trades arriving
+    in between only push a gap further down; the overlap is re-read, never
+    skipped, and deduplicated on upsert.
+    """
+    hwm_ts, hwm_ids = _load_high_water_mark()
+    gaps = json.loads(get_sync_state(SYNC_GAPS_KEY) or "[]")
+    head = await _page_until(
+        client, 0, hwm_ts, hwm_ids, max_pages, page_size, concurrency
+    )
+    fresh = list(head.trades)
+    pages = head.pages
+    open_gaps: List[Dict[str, Any]] = []
+    if not head.reached and hwm_ts is not None:
+        open_gaps.append({"offset": head.offset, "ts": hwm_ts, "ids": sorted(hwm_ids)})
+    for gap in gaps:
+        if pages >= max_pages:
+            open_gaps.append(gap)
+            continue
+        run = await _page_until(
+            client,
+            gap["offset"],
+            gap["ts"],
+            set(gap["ids"]),
+            max_pages - pages,
+            page_size,
+            concurrency,
+        )
+        fresh.extend(run.trades)
+        pages += run.pages
+        if not run.reached:
+            open_gaps.append({**gap, "offset": run.offset})
+
+    upsert_trades(fresh)
+    _save_high_water_mark(head.trades, hwm_ts, hwm_ids)
+    set_sync_state(SYNC_GAPS_KEY, json.dumps(open_gaps) if open_gaps else None)
+    if open_gaps:
+        logger.warning(
+            "Trade sync stopped after %d pages with %d unread gaps",
+            pages,
+            len(open_gaps),
+        )
+    return {
+        "pages": pages,
+        "trades": len(fresh),
+        "gaps": len(open_gaps),
+        "caught_up": not open_gaps and head.reached,
+    }
+
+
+async def backfill_trades_async(
+    client: AsyncPolymarketClient,
+    page_size: int = TRADES_PAGE_SIZE,
+    concurrency: int = TRADES_CONCURRENCY,
+    max_pages: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Walk the full trade history, resuming from the last persisted offset.
+
+    Pages go through the bulk ingest pipeline. Progress is saved whenever a
+    batch commits, so an interrupted backfill picks up where it left off. The
+    saved offset is cleared once history is exhausted.
+    """
+    offset = int(get_sync_state(BACKFILL_OFFSET_KEY) or 0)
+    pages = 0
+    trades = 0
+    done = False
+    ingest = BulkTradeIngest()
 
-def sync_trades(client: Optional[PolymarketClient] = None) -> None:
-    client = client or PolymarketClient()
     try:
-        trades = client.fetch_trades()
-        upsert_trades(trades)
+        while not done and (max_pages is None or pages < max_pages):
+            wave = (
+                concurrency
+                if max_pages is None
+                else min(concurrency, max_pages - pages)
+            )
+            results = await _fetch_wave(client.fetch_trades, offset, wave, page_size)
+            batch = [trade for page in results for trade in page]
+            ingest.add(batch)
+            pages += wave
+            trades += len(batch)
+            offset += wave * page_size
+            done = any(len(page) < page_size for page in results)
+            if not ingest.pending:
+                set_sync_state(BACKFILL_OFFSET_KEY, None if done else str(offset))
+    finally:
+        # Even after a failure, replay the ledger for batches already committed.
+        ingest_stats = ingest.close()
+    set_sync_state(BACKFILL_OFFSET_KEY, None if done else str(offset))
+    return {
+        "pages": pages,
+        "trades": trades,
+        "offset": offset,
+        "done": done,
+        "ingest": ingest_stats,
+    }
+
+
+async def sync_markets_async(
+    client: AsyncPolymarketClient,
+    page_size: int = MARKETS_PAGE_SIZE,
+    concurrency: int = TRADES_CONCURRENCY,
+    max_pages: int = MARKETS_MAX_PAGES,
+) -> Dict[str, Any]:
+    """Fetch every active market and store only the new and changed ones.
+
+    Pages are requested ``concurrency`` at a time in a stable order until a
+    short page. Only a sync that saw the whole list marks the stored active
+    markets it did not see as closed.
+    """
+    markets: List[Dict[str, Any]] = []
+    pages = 0
+    complete = False
+    fetch = functools.partial(client.fetch_markets, order="id", ascending=True)
+    while not complete and pages < max_pages:
+        wave = min(concurrency, max_pages - pages)
+        results = await _fetch_wave(fetch, pages * page_size, wave, page_size)
+        for page in results:
+            pages += 1
+            markets.extend(page)
+            if len(page) < page_size:
+                complete = True
+                break
+    if not complete:
+        logger.warning(
+            "Market sync stopped after %d pages; closed markets are not marked",
+            pages,
+        )
+    stats = upsert_markets(markets, close_missing=complete and bool(markets))
+    return {"pages": pages, "markets": len(markets), "complete": complete, **stats}
+
+
+async def _with_client(
+    client: Optional[AsyncPolymarketClient], run: Any, **kwargs: Any
+) -> Dict[str, Any]:
+    if client is not None:
+        return await run(client, **kwargs)
+    async with AsyncPolymarketClient(max_connections=TRADES_CONCURRENCY) as owned:
+        return await run(owned, **kwargs)
+
+
+def sync_trades(
+    client: Optional[AsyncPolymarketClient] = None,
+) -> Optional[Dict[str, Any]]:
+    try:
+        stats = asyncio.run(_with_client(client, sync_trades_async))
+        logger.info("Synced trades: %s", stats)
+        SYNC_ROWS.observe(stats["trades"], job="sync_trades")
+        refresh_trade_store()
+        return stats
     except Exception as exc:
         logger.error("Failed to sync trades: %s", exc)
+        return None
 
 
-def sync_markets(client: Optional[PolymarketClient] = None) -> None:
-    client = client or PolymarketClient()
+def backfill_trades(
+    client: Optional[AsyncPolymarketClient] = None, max_pages: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    try:
+        stats = asyncio.run(
+            _with_client(client, backfill_trades_async, max_pages=max_pages)
+        )
+        logger.info("Backfilled trades: %s", stats)
+        SYNC_ROWS.observe(stats["trades"], job="backfill_trades")
+        refresh_trade_store()
+        return stats
+    except Exception as exc:
+        logger.error("Failed to backfill trades: %s", exc)
+        return None
+
+
+def sync_markets(
+    client: Optional[AsyncPolymarketClient] = None,
+) -> Optional[Dict[str, Any]]:
     try:
-        markets = client.fetch_markets()
-        upsert_markets(markets)
+        stats = asyncio.run(_with_client(client, sync_markets_async))
+        logger.info("Synced markets: %s", stats)
+        SYNC_ROWS.observe(stats["new"] + stats["updated"], job="sync_markets")
+        return stats
     except Exception as exc:
         logger.error("Failed to sync markets: %s", exc)
+        return None
 
 
-def sync_users(client: Optional[PolymarketClient] = None) -> None:
+def sync_users(client: Optional[PolymarketClient] = None) -> Optional[Dict[str, Any]]:
     client = client or PolymarketClient()
     try:
         users = client.fetch_users()
         upsert_users(users)
+        SYNC_ROWS.observe(len(users), job="sync_users")
+        return {"users": len(users)}
     except Exception as exc:
         logger.error("Failed to sync users: %s", exc)
+        return None
+
+
+def maintain_storage() -> Optional[Dict[str, Any]]:
+    try:
+        stats = run_maintenance()
+        stats["trimmed_profit_changes"] = trim_profit_changes()
+        stats["trimmed_whale_alerts"] = trim_whale_alerts()
+        return stats
+    except Exception as exc:
+        logger.error("Failed to maintain trade storage: %s", exc)
+        return None
+
+
+def snapshot_storage() -> Optional[Dict[str, Any]]:
+    try:
+        return snapshot_open_days()
+    except Exception as exc:
+        logger.error("Failed to snapshot open trade days: %s", exc)
+        return None
+
+
+def next_trades_interval(
+    current: float, stats: Optional[Dict[str, Any]], page_size: int = TRADES_PAGE_SIZE
+) -> float:
+    """Poll sooner while trades arrive by the page, back off while idle."""
+    if stats is None:
+        return current
+    if not stats["caught_up"]:
+        return SYNC_TRADES_MIN_INTERVAL_SECONDS
+    if stats["trades"] >= page_size:
+        return max(SYNC_TRADES_MIN_INTERVAL_SECONDS, current / 2)
+    if stats["trades"] == 0:
+        return min(SYNC_TRADES_MAX_INTERVAL_SECONDS, current * 2)
+    return current
+
+
+class Job(NamedTuple):
+    run: Callable[[], Optional[Dict[str, Any]]]
+    interval: float
+    adapt: Optional[Callable[[float, Optional[Dict[str, Any]]], float]] = None
+
+
+JOBS: Dict[str, Job] = {
+    "sync_trades": Job(sync_trades, SYNC_TRADES_INTERVAL_SECONDS, next_trades_interval),
+    "sync_markets": Job(sync_markets, SYNC_MARKETS_INTERVAL_SECONDS),
+    "sync_users": Job(sync_users, SYNC_USERS_INTERVAL_SECONDS),
+    "maintenance": Job(maintain_storage, MAINTENANCE_INTERVAL_SECONDS),
+    "snapshot": Job(snapshot_storage, SNAPSHOT_INTERVAL_SECONDS),
+}
+
+
+class LeaderLock:
+    """Exclusive advisory lock on a file, released by the OS if the holder dies."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[IO[str]] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def request_sync() -> float:
+    """Ask the leader to run every sync job as soon as it is free."""
+    requested_at = time.time()
+    set_sync_state(SYNC_REQUEST_KEY, repr(requested_at))
+    return requested_at
+
+
+def request_backfill(max_pages: Optional[int] = None) -> float:
+    """Ask the leader to run one backfill once no other backfill is running."""
+    requested_at = time.time()
+    set_sync_state(
+        BACKFILL_REQUEST_KEY,
+        json.dumps({"requested_at": requested_at, "max_pages": max_pages}),
+    )
+    return requested_at
+
+
+def job_states() -> Dict[str, Any]:
+    states = {}
+    for job_id in (*JOBS, BACKFILL_JOB):
+        raw = get_sync_state(JOB_STATE_PREFIX + job_id)
+        states[job_id] = json.loads(raw) if raw else None
+    return states
+
+
+class SyncScheduler:
+    """Runs the sync jobs in exactly one process.
+
+    Every worker polls for the leader lock; the one that holds it schedules the
+    jobs. A job never overlaps itself: APScheduler allows one running instance
+    and coalesces missed runs, and queued manual runs wait for a running one to
+    finish. Each job reschedules itself after it runs, so intervals can adapt
+    to the result. Backfills queued through ``request_backfill`` run here too,
+    as one-off jobs. Run stats are kept in ``sync_state`` so any worker can
+    report them.
+    """
+
+    def __init__(self, lock_path: str = SCHEDULER_LOCK_PATH) -> None:
+        self.lock = LeaderLock(lock_path)
+        self.scheduler = BackgroundScheduler(
+            job_defaults={"max_instances": 1, "coalesce": True}
+        )
+        self._intervals: Dict[str, float] = {}
+        self._due: Dict[str, float] = {}
+        self._running: Set[str] = set()
+        self._served: Dict[str, float] = {}
+        self._guard = threading.Lock()
+
+    def start(self) -> None:
+        self.scheduler.add_job(
+            self._poll,
+            "interval",
+            seconds=SCHEDULER_POLL_SECONDS,
+            id="leader",
+            next_run_time=datetime.now(),
+        )
+        self.scheduler.start()
+
+    def shutdown(self) -> None:
+        self.scheduler.shutdown(wait=False)
+        self.lock.release()
+
+    def _poll(self) -> None:
+        if not self.lock.held:
+            if not self.lock.acquire():
+                return
+            logger.info("Became sync leader (pid %d)", os.getpid())
+            set_sync_state(
+                LEADER_KEY,
+                json.dumps(
+                    {
+                        "pid": os.getpid(),
+                        "host": socket.gethostname(),
+                        "since": int(time.time()),
+                    }
+                ),
+            )
+            # Only the leader ingests, so only it tracks the whale window.
+            whale_feed.seed()
+            # Requests made before this worker's last runs are already served.
+            for job_id, state in job_states().items():
+                if state is not None:
+                    self._served[job_id] = state["last_started_at"]
+            for job_id, job in JOBS.items():
+                self._schedule(job_id, job.interval)
+        self._take_requests()
+        self._take_backfill()
+
+    def _schedule(self, job_id: str, seconds: float) -> None:
+        self._intervals[job_id] = seconds
+        self._due[job_id] = time.time() + seconds
+        if self.scheduler.get_job(job_id) is None:
+            self.scheduler.add_job(
+                self._run, "interval", seconds=seconds, id=job_id, args=[job_id]
+            )
+        else:
+            self.scheduler.reschedule_job(job_id, trigger="interval", seconds=seconds)
+
+    def _take_requests(self) -> None:
+        raw = get_sync_state(SYNC_REQUEST_KEY)
+        if raw is None:
+            return
+        requested_at = float(raw)
+        for job_id in JOBS:
+            with self._guard:
+                if (
+                    job_id in self._running
+                    or self._served.get(job_id, 0) >= requested_at
+                ):
+                    continue
+                self._served[job_id] = requested_at
+                self._due[job_id] = requested_at
+            self.scheduler.modify_job(job_id, next_run_time=datetime.now())
+
+    def _take_backfill(self) -> None:
+        raw = get_sync_state(BACKFILL_REQUEST_KEY)
+        if raw is None:
+            return
+        request = json.loads(raw)
+        with self._guard:
+            if (
+                BACKFILL_JOB in self._running
+                or self._served.get(BACKFILL_JOB, 0) >= request["requested_at"]
+            ):
+                return
+            self._served[BACKFILL_JOB] = request["requested_at"]
+            self._running.add(BACKFILL_JOB)
+        self.scheduler.add_job(
+            self._run_backfill,
+            id=BACKFILL_JOB,
+            args=[request],
+            next_run_time=datetime.now(),
+            replace_existing=True,
+        )
+
+    def _run_backfill(self, request: Dict[str, Any]) -> None:
+        started = time.time()
+        lag = max(0.0, started - request["requested_at"])
+        result = None
+        try:
+            result = backfill_trades(max_pages=request["max_pages"])
+        finally:
+            with self._guard:
+                self._running.discard(BACKFILL_JOB)
+            self._record(
+                BACKFILL_JOB, started, time.time() - started, lag, None, result
+            )
+
+    def _run(self, job_id: str) -> None:
+        job = JOBS[job_id]
+        started = time.time()
+        with self._guard:
+            self._running.add(job_id)
+            lag = max(0.0, started - self._due.get(job_id, started))
+        result = None
+        try:
+            result = job.run()
+        finally:
+            duration = time.time() - started
+            interval = self._intervals[job_id]
+            if job.adapt is not None:
+                interval = job.adapt(interval, result)
+            self._schedule(job_id, interval)
+            with self._guard:
+                self._running.discard(job_id)
+            self._record(job_id, started, duration, lag, interval, result)
+
+    def _record(
+        self,
+        job_id: str,
+        started: float,
+        duration: float,
+        lag: float,
+        interval: Optional[float],
+        result: Optional[Dict[str, Any]],
+    ) -> None:
+        JOB_SECONDS.observe(duration, job=job_id)
+        JOB_LAG_SECONDS.observe(lag, job=job_id)
+        if result is None:
+            JOB_FAILURES.inc(job=job_id)
+        key = JOB_STATE_PREFIX + job_id
+        raw = get_sync_state(key)
+        state = json.loads(raw) if raw else {"runs": 0, "failures": 0}
+        state["runs"] += 1
+        state["failures"] += result is None
+        state.update(
+            {
+                "last_started_at": int(started),
+                "last_duration_seconds": round(duration, 3),
+                "lag_seconds": round(lag, 3),
+                "interval_seconds": interval,
+                "next_run_at": (
+                    int(self._due[job_id]) if job_id in self._due else None
+                ),
+                "last_result": result,
+            }
+        )
+        set_sync_state(key, json.dumps(state))
+
+    def status(self) -> Dict[str, Any]:
+        raw = get_sync_state(LEADER_KEY)
+        return {
+            "is_leader": self.lock.held,
+            "leader": json.loads(raw) if raw else None,
+            "jobs": job_states(),
+        }
+
+
+_scheduler: Optional[SyncScheduler] = None
+
+
+def start_scheduler() -> SyncScheduler:
+    global _scheduler
+    _scheduler = SyncScheduler()
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown()
+        _scheduler = None
 
 
-def start_scheduler() -> BackgroundScheduler:
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(sync_trades, "interval", minutes=10, id="sync_trades")
-    scheduler.add_job(sync_markets, "interval", hours=1, id="sync_markets")
-    scheduler.add_job(sync_users, "interval", hours=6, id="sync_users")
-    scheduler.start()
-    return scheduler
+def scheduler_status() -> Dict[str, Any]:
+    if _scheduler is None:
+        return {"is_leader": False, "leader": None, "jobs": job_states()}
+    return _scheduler.status()
@@ -0,0 +1,391 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from app.db import bump_data_generation, db_session, read_session
+from app.services.ledger import TradeRow, fold_history
+from app.services.trade_store import (
+    COLUMN_DTYPES,
+    COLUMNS_SQL,
+    DAY,
+    MANIFEST,
+    SEGMENT_COLUMNS,
+    TRADE_ARCHIVE_DIR,
+    day_of,
+    empty_columns,
+    load_segment,
+    read_manifest,
+    segment_dir,
+)
+
+logger = logging.getLogger(__name__)
+
+# A day is closed, and compacted, once it ended this many days ago.
+TRADE_ARCHIVE_AFTER_DAYS = int(os.getenv("TRADE_ARCHIVE_AFTER_DAYS", "2"))
+# Archived days older than this lose their rows in the trades table; 0 keeps them.
+TRADE_HOT_DAYS = int(os.getenv("TRADE_HOT_DAYS", "0"))
+# Trades older than this are deleted everywhere; 0 keeps all history.
+TRADE_RETENTION_DAYS = int(os.getenv("TRADE_RETENTION_DAYS", "0"))
+VACUUM_MIN_FREE_RATIO = float(os.getenv("VACUUM_MIN_FREE_RATIO", "0.25"))
+
+# Superseded segments stay this long for readers that still have them mapped.
+_GRACE_SECONDS = 600
+
+_lock = threading.Lock()
+_last_run: Dict[str, Any] = {}
+
+
+def _day_name(day: int) -> str:
+    return datetime.fromtimestamp(day * DAY, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def touch_partitions(
+    conn: sqlite3.Connection,
+    changed: Iterable[TradeRow],
+    replaced: Iterable[sqlite3.Row],
+) -> None:
+    """Count a change against every day an ingest batch wrote to, in its transaction.
+
+    A day's segment is current only while its change count matches the one it
+    was compacted at.
+    """
+    days = {day_of(row.ts) for row in changed if row.ts is not None}
+    days.update(day_of(row["ts"]) for row in replaced if row["ts"] is not None)
+    if days:
+        conn.executemany(
+            """
+            INSERT INTO trade_partitions (day, changes) VALUES (?, 1)
+            ON CONFLICT(day) DO UPDATE SET changes = changes + 1
+            """,
+            [(day,) for day in days],
+        )
+
+
+def touch_staged_partitions(conn: sqlite3.Connection, source: str) -> None:
+    """``touch_partitions`` for a batch of new trades held in table ``source``."""
+    conn.execute(
+        f"""
+        INSERT INTO trade_partitions (day, changes)
+        SELECT DISTINCT ts / {DAY}, 1 FROM {source} WHERE ts IS NOT NULL
+        ON CONFLICT(day) DO UPDATE SET changes = changes + 1
+        """
+    )
+
+
+def ensure_partitions() -> None:
+    """Register the days of trades stored before partitions were tracked."""
+    with db_session() as conn:
+        if conn.execute("SELECT 1 FROM trade_partitions LIMIT 1").fetchone():
+            return
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO trade_partitions (day, changes)
+            SELECT DISTINCT ts / {DAY}, 1 FROM trades WHERE ts IS NOT NULL
+            """
+        )
+
+
+def _write_manifest(days: Dict[int, Dict[str, Any]]) -> None:
+    path = os.path.join(TRADE_ARCHIVE_DIR, MANIFEST)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "w") as handle:
+        json.dump(
+            {
+                "format": 1,
+                "columns": list(SEGMENT_COLUMNS),
+                "days": {str(day): days[day] for day in sorted(days)},
+            },
+            handle,
+            indent=1,
+        )
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp, path)
+
+
+def _write_segment(name: str, columns: Dict[str, np.ndarray]) -> None:
+    final = segment_dir(name)
+    temp = f"{final}.{os.getpid()}.tmp"
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+    for column, values in columns.items():
+        with open(os.path.join(temp, f"{column}.npy"), "wb") as handle:
+            np.save(handle, values)
+            handle.flush()
+            os.fsync(handle.fileno())
+    # A same-named segment is left over from a run that died before recording it.
+    shutil.rmtree(final, ignore_errors=True)
+    os.rename(temp, final)
+
+
+def _day_rows(conn: sqlite3.Connection, day: int) -> Dict[str, np.ndarray]:
+    rows = conn.execute(
+        f"""
+        SELECT id, {COLUMNS_SQL}
+        FROM trades INDEXED BY idx_trades_ts
+        WHERE ts >= ? AND ts < ?
+        ORDER BY ts
+        """,
+        (day * DAY, (day + 1) * DAY),
+    ).fetchall()
+    if not rows:
+        return {"id": np.empty(0, dtype="S1"), **empty_columns()._asdict()}
+    ids, *values = zip(*rows)
+    return {
+        "id": np.array([trade_id.encode() for trade_id in ids]),
+        **{
+            name: np.array(column, dtype=dtype)
+            for (name, dtype), column in zip(COLUMN_DTYPES.items(), values)
+        },
+    }
+
+
+def _merge_pruned(
+    stored: Dict[str, np.ndarray], archived: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """Add back archived rows of a pruned day that the trades table no longer has."""
+    keep = ~np.isin(archived["id"], stored["id"])
+    merged = {
+        name: np.concatenate([archived[name][keep], stored[name]])
+        for name in SEGMENT_COLUMNS
+    }
+    order = np.argsort(merged["ts"], kind="stable")
+    return {name: values[order] for name, values in merged.items()}
+
+
+def _compact_day(
+    day: int, manifest: Dict[int, Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Write the segment for one day; returns its manifest entry."""
+    with db_session() as conn:
+        partition = conn.execute(
+            "SELECT changes, pruned_version FROM trade_partitions WHERE day = ?",
+            (day,),
+        ).fetchone()
+        columns = _day_rows(conn, day)
+    if partition["pruned_version"] is not None and day in manifest:
+        columns = _merge_pruned(columns, load_segment(manifest[day], ids=True))
+
+    version = partition["changes"]
+    name = f"{_day_name(day)}.v{version}"
+    rows = len(columns["ts"])
+    if rows:
+        _write_segment(name, columns)
+    entry = {
+        "segment": name,
+        "version": version,
+        "rows": rows,
+        "min_ts": int(columns["ts"][0]) if rows else None,
+        "max_ts": int(columns["ts"][-1]) if rows else None,
+    }
+    return entry if rows else None
+
+
+def _last_closed_day(now: int) -> int:
+    return day_of(now) - TRADE_ARCHIVE_AFTER_DAYS - 1
+
+
+def compact(now: Optional[int] = None, open_days: bool = False) -> Dict[str, int]:
+    """Write a segment for every closed day whose segment is missing or stale.
+
+    With ``open_days`` the days still taking trades are written too. Their
+    segments serve as a snapshot: a restarted worker maps every day that has
+    not changed since and reads only the changed days from SQLite.
+    """
+    now = int(time.time()) if now is None else now
+    last_day = day_of(now) if open_days else _last_closed_day(now)
+    first_kept = _first_kept_day(now)
+    os.makedirs(TRADE_ARCHIVE_DIR, exist_ok=True)
+    manifest = read_manifest()
+    with read_session() as conn:
+        partitions = conn.execute(
+            "SELECT day, changes FROM trade_partitions WHERE day BETWEEN ? AND ?",
+            (first_kept, last_day),
+        ).fetchall()
+
+    stats = {"archived_days": 0, "archived_rows": 0}
+    for partition in partitions:
+        day = partition["day"]
+        current = manifest.get(day)
+        if current is not None and current["version"] == partition["changes"]:
+            continue
+        entry = _compact_day(day, manifest)
+        if entry is None:
+            manifest.pop(day, None)
+        else:
+            manifest[day] = entry
+            stats["archived_rows"] += entry["rows"]
+        # Record each day as it is written so an interrupted run loses nothing.
+        _write_manifest(manifest)
+        stats["archived_days"] += 1
+    return stats
+
+
+def _first_kept_day(now: int) -> int:
+    if TRADE_RETENTION_DAYS <= 0:
+        return 0
+    return day_of(now) - TRADE_RETENTION_DAYS
+
+
+def prune(now: Optional[int] = None) -> Dict[str, int]:
+    """Apply ``TRADE_HOT_DAYS`` and ``TRADE_RETENTION_DAYS`` to stored trades.
+
+    Archived days past the hot window keep only their segment; replays read
+    them from there. Days past the retention horizon are deleted from the
+    trades table and the archive, after their trades are folded into each
+    pair's ``ledger_base`` so replays still start from their positions.
+    """
+    now = int(time.time()) if now is None else now
+    stats = {"pruned_days": 0, "expired_days": 0, "deleted_rows": 0, "folded_pairs": 0}
+    manifest = read_manifest()
+
+    if TRADE_HOT_DAYS > 0:
+        # Snapshots of open days are never pruned, only closed days are.
+        last_cold = min(day_of(now) - TRADE_HOT_DAYS - 1, _last_closed_day(now))
+        with read_session() as conn:
+            candidates = conn.execute(
+                """
+                SELECT day, changes FROM trade_partitions
+                WHERE day <= ? AND (pruned_version IS NULL OR pruned_version != changes)
+                """,
+                (last_cold,),
+            ).fetchall()
+        for partition in candidates:
+            day = partition["day"]
+            entry = manifest.get(day)
+            if entry is None or entry["version"] != partition["changes"]:
+                continue
+            with db_session() as conn:
+                # Only drop rows the segment holds: the day must not have
+                # changed since it was compacted.
+                marked = conn.execute(
+                    """
+                    UPDATE trade_partitions SET pruned_version = changes
+                    WHERE day = ? AND changes = ?
+                    """,
+                    (day, entry["version"]),
+                ).rowcount
+                if marked:
+                    stats["deleted_rows"] += conn.execute(
+                        "DELETE FROM trades WHERE ts >= ? AND ts < ?",
+                        (day * DAY, (day + 1) * DAY),
+                    ).rowcount
+                    stats["pruned_days"] += 1
+
+    if TRADE_RETENTION_DAYS > 0:
+        first_kept = _first_kept_day(now)
+        with db_session() as conn:
+            stats["folded_pairs"] = fold_history(conn, first_kept * DAY)
+            deleted = conn.execute(
+                "DELETE FROM trades WHERE ts < ?", (first_kept * DAY,)
+            ).rowcount
+            stats["expired_days"] = conn.execute(
+                "DELETE FROM trade_partitions WHERE day < ?", (first_kept,)
+            ).rowcount
+            if stats["expired_days"]:
+                bump_data_generation(conn)
+        stats["deleted_rows"] += deleted
+        expired = [day for day in manifest if day < first_kept]
+        if expired:
+            for day in expired:
+                manifest.pop(day)
+            _write_manifest(manifest)
+    return stats
+
+
+def collect_garbage(now: Optional[float] = None) -> int:
+    """Remove segments the manifest no longer lists, after a grace period."""
+    now = time.time() if now is None else now
+    if not os.path.isdir(TRADE_ARCHIVE_DIR):
+        return 0
+    live = {entry["segment"] for entry in read_manifest().values()}
+    removed = 0
+    for entry in os.scandir(TRADE_ARCHIVE_DIR):
+        if not entry.is_dir() or entry.name in live:
+            continue
+        if entry.stat().st_mtime < now - _GRACE_SECONDS:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def vacuum_if_needed(min_free_ratio: float = VACUUM_MIN_FREE_RATIO) -> bool:
+    """VACUUM once enough of the database file is free pages."""
+    with db_session() as conn:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not page_count or free_pages / page_count < min_free_ratio:
+            return False
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return True
+
+
+def run_maintenance() -> Dict[str, Any]:
+    """Compact closed days, apply retention, drop old segments and VACUUM."""
+    with _lock:
+        started = time.perf_counter()
+        now = int(time.time())
+        stats: Dict[str, Any] = {**compact(now), **prune(now)}
+        stats["removed_segments"] = collect_garbage(now)
+        stats["vacuumed"] = bool(stats["deleted_rows"]) and vacuum_if_needed()
+        stats["seconds"] = round(time.perf_counter() - started, 4)
+        _last_run.clear()
+        _last_run.update(stats, finished_at=now)
+    logger.info("Trade storage maintenance: %s", stats)
+    return stats
+
+
+def snapshot_open_days() -> Dict[str, Any]:
+    """Bring every day's segment up to date, open days included."""
+    with _lock:
+        started = time.perf_counter()
+        now = int(time.time())
+        stats: Dict[str, Any] = compact(now, open_days=True)
+        stats["removed_segments"] = collect_garbage(now)
+        stats["seconds"] = round(time.perf_counter() - started, 4)
+    return stats
+
+
+def archive_stats() -> Dict[str, Any]:
+    manifest = read_manifest()
+    with read_session() as conn:
+        partitions = {
+            row["day"]: row
+            for row in conn.execute(
+                "SELECT day, changes, pruned_version FROM trade_partitions"
+            )
+        }
+    stale = sum(
+        1
+        for day, entry in manifest.items()
+        if day in partitions and partitions[day]["changes"] != entry["version"]
+    )
+    size = 0
+    for entry in manifest.values():
+        directory = segment_dir(entry["segment"])
+        if os.path.isdir(directory):
+            size += sum(item.stat().st_size for item in os.scandir(directory))
+    return {
+        "directory": TRADE_ARCHIVE_DIR,
+        "partitions": len(partitions),
+        "archived_days": len(manifest),
+        "archived_rows": sum(entry["rows"] for entry in manifest.values()),
+        "archive_bytes": size,
+        "stale_days": stale,
+        "pruned_days": sum(
+            1 for row in partitions.values() if row["pruned_version"] is not None
+        ),
+        "first_day": _day_name(min(manifest)) if manifest else None,
+        "last_day": _day_name(max(manifest)) if manifest else None,
+        "last_maintenance": dict(_last_run) or None,
+    }
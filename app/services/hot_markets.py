@@ -1,26 +1,22 @@
-from datetime import datetime, timedelta
+import time
 from typing import Dict, List
 
-from app.db import db_session
-
-
-def _parse_time(value: str) -> datetime:
-    if isinstance(value, (int, float)):
-        return datetime.utcfromtimestamp(value)
-    if isinstance(value, str) and value.isdigit():
-        return datetime.utcfromtimestamp(int(value))
-    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+from app.db import read_session
+from app.metrics import SERVICE_ROWS, timed_service
+from app.services.rollups import window_bounds
 
 
+@timed_service
 def hot_markets(limit: int = 20, since_hours: int = 24) -> List[Dict[str, float]]:
-    with db_session() as conn:
+    with read_session() as conn:
         rows = conn.execute(
             """
             SELECT id, question, volume_24h
             FROM markets
-            WHERE volume_24h IS NOT NULL
+            WHERE volume_24h IS NOT NULL AND status = 'active'
             """
         ).fetchall()
+    SERVICE_ROWS.inc(len(rows), service="hot_markets")
 
     if rows:
         markets = [
@@ -34,36 +30,40 @@ def hot_markets(limit: int = 20, since_hours: int = 24) -> List[Dict[str, float]
         markets.sort(key=lambda item: item["volume"] or 0, reverse=True)
         return markets[:limit]
 
-    cutoff = datetime.utcnow() - timedelta(hours=since_hours)
-    totals: Dict[str, float] = {}
-    questions: Dict[str, str] = {}
+    cutoff, boundary = window_bounds(int(time.time()), since_hours)
 
-    with db_session() as conn:
+    with read_session() as conn:
         trade_rows = conn.execute(
             """
-            SELECT market_id, price, size, timestamp
-            FROM trades
-            WHERE timestamp IS NOT NULL
-            """
+            SELECT k.condition_id, m.question, g.total
+            FROM (
+                SELECT market_id, SUM(notional) AS total
+                FROM (
+                    SELECT market_id, notional
+                    FROM market_hourly INDEXED BY idx_market_hourly_hour
+                    WHERE hour >= :boundary
+                    UNION ALL
+                    SELECT market_id, ABS(COALESCE(price, 0) * COALESCE(size, 0))
+                    FROM trades INDEXED BY idx_trades_ts
+                    WHERE ts >= :cutoff AND ts < :boundary AND market_id IS NOT NULL
+                )
+                GROUP BY market_id
+                ORDER BY total DESC
+                LIMIT :limit
+            ) g
+            JOIN market_keys k ON k.id = g.market_id
+            LEFT JOIN markets m ON m.id = k.condition_id
+            ORDER BY g.total DESC
+            """,
+            {"cutoff": cutoff, "boundary": boundary, "limit": limit},
         ).fetchall()
-        market_rows = conn.execute("SELECT id, question FROM markets").fetchall()
-
-    for row in market_rows:
-        questions[row["id"]] = row["question"]
-
-    for row in trade_rows:
-        if _parse_time(row["timestamp"]) < cutoff:
-            continue
-        volume = abs((row["price"] or 0) * (row["size"] or 0))
-        totals[row["market_id"]] = totals.get(row["market_id"], 0.0) + volume
+    SERVICE_ROWS.inc(len(trade_rows), service="hot_markets")
 
-    markets = [
+    return [
         {
-            "market_id": market_id,
-            "question": questions.get(market_id),
-            "volume": round(total, 4),
+            "market_id": row["condition_id"],
+            "question": row["question"],
+            "volume": round(row["total"], 4),
         }
-        for market_id, total in totals.items()
+        for row in trade_rows
     ]
-    markets.sort(key=lambda item: item["volume"], reverse=True)
-    return markets[:limit]
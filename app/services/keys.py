@@ -0,0 +1,87 @@
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+# SQLite caps the number of bound parameters per statement.
+_CHUNK = 500
+
+# Dictionary table -> the string column it encodes.
+KEY_TABLES = {"wallet_keys": "address", "market_keys": "condition_id"}
+
+
+def _chunks(values: List) -> Iterable[List]:
+    for start in range(0, len(values), _CHUNK):
+        yield values[start : start + _CHUNK]
+
+
+def _encode(
+    conn: sqlite3.Connection, table: str, values: Iterable[Optional[str]]
+) -> Dict[str, int]:
+    column = KEY_TABLES[table]
+    distinct = list(dict.fromkeys(value for value in values if value is not None))
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)",
+        [(value,) for value in distinct],
+    )
+    keys: Dict[str, int] = {}
+    for chunk in _chunks(distinct):
+        placeholders = ", ".join("?" for _ in chunk)
+        keys.update(
+            conn.execute(
+                f"SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})",
+                chunk,
+            )
+        )
+    return keys
+
+
+def _resolve(
+    conn: sqlite3.Connection, table: str, keys: Iterable[Optional[int]]
+) -> Dict[int, str]:
+    column = KEY_TABLES[table]
+    distinct = list({key for key in keys if key is not None})
+    values: Dict[int, str] = {}
+    for chunk in _chunks(distinct):
+        placeholders = ", ".join("?" for _ in chunk)
+        values.update(
+            conn.execute(
+                f"SELECT id, {column} FROM {table} WHERE id IN ({placeholders})",
+                chunk,
+            )
+        )
+    return values
+
+
+def encode_wallets(
+    conn: sqlite3.Connection, addresses: Iterable[Optional[str]]
+) -> Dict[str, int]:
+    """Map wallet addresses to integer keys, assigning keys to new addresses.
+
+    Runs inside the caller's write transaction, so keys assigned for a batch
+    that rolls back disappear with it.
+    """
+    return _encode(conn, "wallet_keys", addresses)
+
+
+def encode_markets(
+    conn: sqlite3.Connection, condition_ids: Iterable[Optional[str]]
+) -> Dict[str, int]:
+    return _encode(conn, "market_keys", condition_ids)
+
+
+def resolve_wallets(
+    conn: sqlite3.Connection, keys: Iterable[Optional[int]]
+) -> Dict[int, str]:
+    return _resolve(conn, "wallet_keys", keys)
+
+
+def resolve_markets(
+    conn: sqlite3.Connection, keys: Iterable[Optional[int]]
+) -> Dict[int, str]:
+    return _resolve(conn, "market_keys", keys)
+
+
+def wallet_key(conn: sqlite3.Connection, address: str) -> Optional[int]:
+    row = conn.execute(
+        "SELECT id FROM wallet_keys WHERE address = ?", (address,)
+    ).fetchone()
+    return row[0] if row else None
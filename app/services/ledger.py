@@ -0,0 +1,572 @@
+import functools
+import heapq
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+
+from app.db import DB_PATH, bump_data_generation, db_session
+from app.services.smart_money import apply_trade
+from app.services.trade_store import (
+    HISTORY_START_KEY,
+    ArchivedTrades,
+    HistoryRow,
+    archived_copies,
+    history_start,
+)
+
+# Processes replaying wallets in a full ledger rebuild; 1 replays in-process.
+LEDGER_WORKERS = int(os.getenv("LEDGER_WORKERS", str(os.cpu_count() or 1)))
+
+# (wallet key, market key); see app.services.keys.
+Pair = Tuple[int, int]
+# A pair's position, cost basis and last trade time at the retention horizon.
+Base = Tuple[float, float, int]
+# (id, side, price, size, ts) of one trade, as a pair replays it.
+Replayed = Tuple[str, Any, Any, Any, int]
+
+# SQLite caps the number of bound parameters per statement.
+_ID_CHUNK = 500
+
+# Columns of a stored trade that ``diff_against`` compares and returns.
+STORED_COLUMNS = (
+    "id, market_id, user_id, side, price, size, timestamp, profit, realized, ts"
+)
+
+
+class TradeRow(NamedTuple):
+    id: str
+    # Condition id and wallet address as parsed, integer keys once encoded.
+    market_id: Any
+    user_id: Any
+    side: Optional[str]
+    price: Optional[float]
+    size: Optional[float]
+    timestamp: Any
+    profit: Optional[float]
+    realized: int
+    ts: Optional[int]
+
+
+class TradeDiff(NamedTuple):
+    changed: List[TradeRow]
+    replaced: List[sqlite3.Row]
+    stale: Set[Pair]
+
+
+def _chunks(values: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(values), _ID_CHUNK):
+        yield values[start : start + _ID_CHUNK]
+
+
+def _same_trade(stored: sqlite3.Row, row: TradeRow) -> bool:
+    return (
+        stored["market_id"] == row.market_id
+        and stored["user_id"] == row.user_id
+        and stored["side"] == row.side
+        and stored["price"] == row.price
+        and stored["size"] == row.size
+        and str(stored["timestamp"]) == str(row.timestamp)
+        and stored["profit"] == row.profit
+        and stored["realized"] == row.realized
+    )
+
+
+def diff_trades(conn: sqlite3.Connection, rows: List[TradeRow]) -> TradeDiff:
+    """Split an incoming batch against what is already stored.
+
+    Returns the rows that are new or changed, the stored versions of rows about
+    to be overwritten, and the (user, market) pairs whose history was rewritten
+    and therefore need a full replay. Must run before the batch is written.
+    """
+    latest: Dict[str, TradeRow] = {row.id: row for row in rows}
+    # Trades table rows, plus archived copies of pruned ones (as dicts).
+    stored: List[Any] = []
+    for chunk in _chunks(list(latest)):
+        placeholders = ", ".join("?" for _ in chunk)
+        stored.extend(
+            conn.execute(
+                f"""
+                SELECT {STORED_COLUMNS}
+                FROM trades
+                WHERE id IN ({placeholders})
+                """,
+                chunk,
+            )
+        )
+    found = {row["id"] for row in stored}
+    stored.extend(
+        archived_copies(conn, (row for row in latest.values() if row.id not in found))
+    )
+    return diff_against(latest, stored)
+
+
+def diff_against(
+    latest: Dict[str, TradeRow], stored: Iterable[sqlite3.Row]
+) -> TradeDiff:
+    """Diff deduplicated incoming rows, keyed by id, against their stored versions."""
+    existing = {row["id"]: row for row in stored}
+    changed: List[TradeRow] = []
+    replaced: List[sqlite3.Row] = []
+    stale: Set[Pair] = set()
+    for row in latest.values():
+        stored = existing.get(row.id)
+        if stored is None:
+            changed.append(row)
+            continue
+        if _same_trade(stored, row):
+            continue
+        changed.append(row)
+        replaced.append(stored)
+        stale.add((stored["user_id"], stored["market_id"]))
+        stale.add((row.user_id, row.market_id))
+    return TradeDiff(changed, replaced, stale)
+
+
+def _write_pair(
+    conn: sqlite3.Connection,
+    pair: Pair,
+    position: float,
+    cost: float,
+    last_ts: int,
+    events: List[Tuple[str, int, float]],
+) -> None:
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO positions (user_id, market_id, position, cost, last_ts)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (*pair, position, cost, last_ts),
+    )
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO profit_events (trade_id, user_id, market_id, ts, profit)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [(trade_id, *pair, ts, profit) for trade_id, ts, profit in events],
+    )
+
+
+def _advance(
+    trades: List[Replayed], base: Optional[Base]
+) -> Tuple[float, float, Optional[int], List[Tuple[str, int, float]]]:
+    """Apply a pair's trades in time order on top of ``base``."""
+    position, cost, last_ts = base or (0.0, 0.0, None)
+    events: List[Tuple[str, int, float]] = []
+    for trade_id, side, price, size, ts in sorted(trades, key=lambda item: item[4]):
+        position, cost, profit = apply_trade(position, cost, side, price, size)
+        if profit is not None:
+            events.append((trade_id, ts, profit))
+        last_ts = ts
+    return position, cost, last_ts, events
+
+
+def _replay(
+    conn: sqlite3.Connection,
+    pair: Pair,
+    trades: List[Replayed],
+    base: Optional[Base] = None,
+) -> None:
+    position, cost, last_ts, events = _advance(trades, base)
+    if last_ts is not None:
+        _write_pair(conn, pair, position, cost, last_ts, events)
+
+
+def _base(conn: sqlite3.Connection, pair: Pair) -> Optional[Base]:
+    row = conn.execute(
+        """
+        SELECT position, cost, last_ts FROM ledger_base
+        WHERE user_id = ? AND market_id = ?
+        """,
+        pair,
+    ).fetchone()
+    return tuple(row) if row else None
+
+
+def _bases(conn: sqlite3.Connection) -> Optional[Callable[[Pair], Optional[Base]]]:
+    """Look up retention bases, or None when retention has never folded any."""
+    if conn.execute("SELECT 1 FROM ledger_base LIMIT 1").fetchone() is None:
+        return None
+    return functools.partial(_base, conn)
+
+
+def _pick_pairs(pairs: Iterable[Pair]) -> Callable[[Dict[str, np.ndarray]], np.ndarray]:
+    """Segment row filter for the trades of ``pairs``."""
+    keys = np.array([(user << 32) | market for user, market in pairs], dtype=np.int64)
+    return lambda columns: np.isin(
+        (columns["user_codes"].astype(np.int64) << 32) | columns["market_codes"], keys
+    )
+
+
+def _replay_pair(
+    conn: sqlite3.Connection, pair: Pair, archived: List[Replayed], start: int
+) -> None:
+    conn.execute(
+        "DELETE FROM profit_events WHERE user_id = ? AND market_id = ? AND ts >= ?",
+        (*pair, start),
+    )
+    conn.execute("DELETE FROM positions WHERE user_id = ? AND market_id = ?", pair)
+    trades = conn.execute(
+        """
+        SELECT id, side, price, size, ts
+        FROM trades
+        WHERE user_id = ? AND market_id = ? AND ts >= ?
+        ORDER BY rowid
+        """,
+        (*pair, start),
+    ).fetchall()
+    _replay(
+        conn, pair, [*archived, *(tuple(trade) for trade in trades)], _base(conn, pair)
+    )
+
+
+def log_profit_changes(
+    conn: sqlite3.Connection, users: Iterable[Optional[int]]
+) -> None:
+    """Record wallets whose profit events were rewritten, for the leaderboards."""
+    conn.executemany(
+        "INSERT INTO profit_changes (user_id) VALUES (?)",
+        [(user_id,) for user_id in sorted(set(users))],
+    )
+
+
+def update_ledger(
+    conn: sqlite3.Connection, rows: List[TradeRow], stale: Set[Pair]
+) -> None:
+    """Fold new trades into the position ledger for just the touched pairs.
+
+    Trades arriving in time order are applied on top of the stored position.
+    Pairs that received a late trade, or whose history was rewritten, are
+    replayed from the trades table and the archive. Trades older than the
+    retention horizon are left out, as replays would leave them out.
+    """
+    start = history_start(conn)
+    incoming: Dict[Pair, List[TradeRow]] = defaultdict(list)
+    for row in rows:
+        if row.user_id is None or row.market_id is None or row.ts is None:
+            continue
+        if row.ts < start:
+            continue
+        incoming[(row.user_id, row.market_id)].append(row)
+
+    replay = {pair for pair in stale if None not in pair}
+    for pair, trades in incoming.items():
+        if pair in replay:
+            continue
+        timed = sorted(trades, key=lambda trade: trade.ts)
+        state = conn.execute(
+            """
+            SELECT position, cost, last_ts
+            FROM positions
+            WHERE user_id = ? AND market_id = ?
+            """,
+            pair,
+        ).fetchone()
+        if state is not None and timed[0].ts < state["last_ts"]:
+            replay.add(pair)
+            continue
+
+        position = state["position"] if state else 0.0
+        cost = state["cost"] if state else 0.0
+        events: List[Tuple[str, int, float]] = []
+        for trade in timed:
+            position, cost, profit = apply_trade(
+                position, cost, trade.side, trade.price, trade.size
+            )
+            if profit is not None:
+                events.append((trade.id, trade.ts, profit))
+        _write_pair(conn, pair, position, cost, timed[-1].ts, events)
+
+    archived: Dict[Pair, List[Replayed]] = {}
+    if replay:
+        pruned = ArchivedTrades(conn)
+        if pruned:
+            archived = {
+                pair: [row[2:] for row in group]
+                for pair, group in groupby(
+                    pruned.rows(_pick_pairs(replay)), key=lambda row: row[:2]
+                )
+            }
+    for pair in replay:
+        _replay_pair(conn, pair, archived.get(pair, []), start)
+    log_profit_changes(conn, (user_id for user_id, _ in (*incoming, *replay)))
+
+
+_REPLAY_SQL = """
+    SELECT user_id, market_id, id, side, price, size, ts
+    FROM trades INDEXED BY idx_trades_user_market
+    WHERE user_id IS NOT NULL
+      AND market_id IS NOT NULL
+      AND ts >= :start
+      AND (:until IS NULL OR ts < :until)
+      {shard}
+    ORDER BY user_id, market_id, rowid
+"""
+
+
+def _history(
+    conn: sqlite3.Connection,
+    start: int,
+    until: Optional[int] = None,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Iterator[HistoryRow]:
+    """Every replayable trade from ``start``, ordered by pair.
+
+    Pruned days come from their archive segments and the rest from SQLite. A
+    pair's archived trades come first; replays order them by time.
+    """
+    params = {"start": start, "until": until, "shards": None, "shard": None}
+    where = ""
+    if shard is not None:
+        params["shards"], params["shard"] = shard
+        where = "AND user_id % :shards = :shard"
+    stored = conn.execute(_REPLAY_SQL.format(shard=where), params)
+    archived = ArchivedTrades(conn)
+    if not archived:
+        return stored
+
+    def pick(columns: Dict[str, np.ndarray]) -> np.ndarray:
+        users = columns["user_codes"]
+        mask = (users != 0) & (columns["market_codes"] != 0)
+        if until is not None:
+            mask &= columns["ts"] < until
+        if shard is not None:
+            mask &= users % shard[0] == shard[1]
+        return mask
+
+    return heapq.merge(archived.rows(pick), stored, key=lambda row: (row[0], row[1]))
+
+
+def _replay_rows(
+    conn: sqlite3.Connection,
+    cursor: Iterable[Any],
+    bases: Optional[Callable[[Pair], Optional[Base]]] = None,
+) -> None:
+    for pair, trades in groupby(cursor, key=lambda row: (row[0], row[1])):
+        _replay(
+            conn,
+            pair,
+            [tuple(trade)[2:] for trade in trades],
+            bases(pair) if bases else None,
+        )
+
+
+def replay_marked_pairs(conn: sqlite3.Connection) -> int:
+    """Replay every pair listed in ``ledger_dirty`` in one ordered scan.
+
+    Used after bulk ingest, where a batch can touch thousands of pairs: the
+    stale positions and events go in two set-wise deletes, and the pairs'
+    trades are read through one join rather than a query per pair.
+    """
+    pairs = conn.execute("SELECT COUNT(*) FROM ledger_dirty").fetchone()[0]
+    if not pairs:
+        return 0
+    start = history_start(conn)
+    conn.execute(
+        """
+        DELETE FROM profit_events
+        WHERE (user_id, market_id) IN (SELECT user_id, market_id FROM ledger_dirty)
+          AND ts >= ?
+        """,
+        (start,),
+    )
+    conn.execute(
+        """
+        DELETE FROM positions
+        WHERE (user_id, market_id) IN (SELECT user_id, market_id FROM ledger_dirty)
+        """
+    )
+    # Pairs with no trades past the horizon keep their base position.
+    conn.execute(
+        """
+        INSERT INTO positions (user_id, market_id, position, cost, last_ts)
+        SELECT b.user_id, b.market_id, b.position, b.cost, b.last_ts
+        FROM ledger_dirty d
+        JOIN ledger_base b ON b.user_id = d.user_id AND b.market_id = d.market_id
+        """
+    )
+    rows: Iterable[Any] = conn.execute(
+        """
+        SELECT t.user_id, t.market_id, t.id, t.side, t.price, t.size, t.ts
+        FROM ledger_dirty d
+        JOIN trades t INDEXED BY idx_trades_user_market
+          ON t.user_id = d.user_id AND t.market_id = d.market_id
+        WHERE t.ts >= ?
+        ORDER BY d.user_id, d.market_id, t.rowid
+        """,
+        (start,),
+    )
+    archived = ArchivedTrades(conn)
+    if archived:
+        dirty = conn.execute("SELECT user_id, market_id FROM ledger_dirty").fetchall()
+        rows = heapq.merge(
+            archived.rows(_pick_pairs(tuple(pair) for pair in dirty)),
+            rows,
+            key=lambda row: (row[0], row[1]),
+        )
+    _replay_rows(conn, rows, _bases(conn))
+    log_profit_changes(
+        conn, (row[0] for row in conn.execute("SELECT user_id FROM ledger_dirty"))
+    )
+    return pairs
+
+
+def _replay_shard(db_path: str, out_path: str, shard: int, shards: int) -> int:
+    """Replay the wallets with ``user_id % shards == shard`` into ``out_path``.
+
+    Runs in a worker process. Trades are read straight from the database and
+    the results written to a scratch SQLite file, so nothing is pickled.
+    """
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    out = sqlite3.connect(out_path, isolation_level=None)
+    try:
+        out.execute("PRAGMA journal_mode = OFF")
+        out.execute("PRAGMA synchronous = OFF")
+        out.execute(
+            """
+            CREATE TABLE positions
+            (user_id INTEGER, market_id INTEGER, position REAL, cost REAL, last_ts INTEGER)
+            """
+        )
+        out.execute(
+            """
+            CREATE TABLE profit_events
+            (trade_id TEXT, user_id INTEGER, market_id INTEGER, ts INTEGER, profit REAL)
+            """
+        )
+        out.execute("BEGIN")
+        _replay_rows(
+            out,
+            _history(source, history_start(source), shard=(shards, shard)),
+            _bases(source),
+        )
+        out.execute("COMMIT")
+        return out.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+    finally:
+        source.close()
+        out.close()
+
+
+def _replay_sharded(conn: sqlite3.Connection, workers: int) -> None:
+    with tempfile.TemporaryDirectory(prefix="ledger-") as workdir:
+        paths = [os.path.join(workdir, f"shard-{shard}.db") for shard in range(workers)]
+        # Spawn, as for the analytics pool: the caller holds live connections.
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            for _ in pool.map(
+                _replay_shard,
+                [DB_PATH] * workers,
+                paths,
+                range(workers),
+                [workers] * workers,
+            ):
+                pass
+        for path in paths:
+            shard = sqlite3.connect(path)
+            try:
+                # Replayed pairs replace the base positions copied in first.
+                conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO positions
+                    (user_id, market_id, position, cost, last_ts)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    shard.execute("SELECT * FROM positions"),
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO profit_events (trade_id, user_id, market_id, ts, profit)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    shard.execute("SELECT * FROM profit_events"),
+                )
+            finally:
+                shard.close()
+
+
+def rebuild_ledger(workers: int = LEDGER_WORKERS) -> None:
+    """Recompute every position and profit event from the stored trades.
+
+    Pruned days are read from the archive. Replays start from the retention
+    bases, and profit events before the retention horizon are kept. With
+    more than one worker, wallets are split by ``user_id`` modulo the
+    worker count and replayed in parallel processes. Every pair belongs to one
+    wallet, so the shards are independent. Trades cannot change underneath the
+    workers: the write transaction is open from the first delete.
+    """
+    with db_session() as conn:
+        start = history_start(conn)
+        conn.execute("DELETE FROM profit_events WHERE ts >= ?", (start,))
+        conn.execute("DELETE FROM positions")
+        conn.execute(
+            """
+            INSERT INTO positions (user_id, market_id, position, cost, last_ts)
+            SELECT user_id, market_id, position, cost, last_ts FROM ledger_base
+            """
+        )
+        if workers > 1:
+            _replay_sharded(conn, workers)
+        else:
+            _replay_rows(conn, _history(conn, start), _bases(conn))
+        log_profit_changes(conn, [None])
+        bump_data_generation(conn)
+
+
+def ensure_ledger() -> None:
+    """Build the ledger from existing trades when it has never been populated."""
+    with db_session() as conn:
+        has_positions = conn.execute("SELECT 1 FROM positions LIMIT 1").fetchone()
+        has_trades = conn.execute("SELECT 1 FROM trades LIMIT 1").fetchone()
+    if has_trades and not has_positions:
+        rebuild_ledger()
+
+
+def fold_history(conn: sqlite3.Connection, until_ts: int) -> int:
+    """Fold trades before ``until_ts`` into ``ledger_base``; returns pairs folded.
+
+    Runs in retention's transaction, before it deletes those trades. Their
+    profit events stay, and replays start from each pair's base, so the ledger
+    still counts the deleted trades.
+    """
+    start = history_start(conn)
+    if until_ts <= start:
+        return 0
+    folded = 0
+    for pair, trades in groupby(
+        _history(conn, start, until=until_ts), key=lambda row: (row[0], row[1])
+    ):
+        position, cost, last_ts, _ = _advance(
+            [tuple(trade)[2:] for trade in trades], _base(conn, pair)
+        )
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO ledger_base
+            (user_id, market_id, position, cost, last_ts)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (*pair, position, cost, last_ts),
+        )
+        folded += 1
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+        (HISTORY_START_KEY, str(until_ts)),
+    )
+    return folded
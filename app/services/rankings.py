@@ -1,33 +1,272 @@
-from datetime import datetime, timedelta
-from typing import Any, Dict, List
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from app.db import db_session
-from app.services.smart_money import compute_realized_profits, load_trades
+from sortedcontainers import SortedList
 
+from app.db import db_session, read_session
+from app.metrics import SERVICE_ROWS, timed_service
+from app.services.keys import resolve_wallets, wallet_key
 
-def _parse_time(value: str) -> datetime:
-    if isinstance(value, (int, float)):
-        return datetime.utcfromtimestamp(value)
-    if isinstance(value, str) and value.isdigit():
-        return datetime.utcfromtimestamp(int(value))
-    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+# Trailing span of each leaderboard in seconds; ``None`` ranks all history.
+WINDOWS: Dict[str, Optional[int]] = {
+    "1d": 86400,
+    "7d": 7 * 86400,
+    "30d": 30 * 86400,
+    "all": None,
+}
+DEFAULT_WINDOW = "30d"
+# Entries of the profit change log kept for workers that are catching up.
+PROFIT_CHANGES_KEEP = int(os.getenv("PROFIT_CHANGES_KEEP", "100000"))
 
+_CHUNK = 500
+# Requests within this many seconds of a refresh reuse it.
+_REFRESH_SECONDS = 1.0
 
-def top_profit(limit: int = 20, since_days: int = 30) -> List[Dict[str, float]]:
-    cutoff = datetime.utcnow() - timedelta(days=since_days)
-    totals: Dict[str, float] = {}
 
-    trades = load_trades()
-    profits = compute_realized_profits(trades)
+def _profit_totals(
+    conn: sqlite3.Connection, cutoff: Optional[int], users: Optional[List[int]] = None
+) -> Dict[int, float]:
+    """Realized profit per wallet since ``cutoff``, for ``users`` or every wallet."""
+    if users is None:
+        rows = conn.execute(
+            f"""
+            SELECT user_id, SUM(profit)
+            FROM profit_events {"INDEXED BY idx_profit_events_ts" if cutoff else ""}
+            WHERE user_id IS NOT NULL AND (:cutoff IS NULL OR ts >= :cutoff)
+            GROUP BY user_id
+            """,
+            {"cutoff": cutoff},
+        )
+        return dict(rows.fetchall())
+    totals: Dict[int, float] = {}
+    for start in range(0, len(users), _CHUNK):
+        chunk = users[start : start + _CHUNK]
+        rows = conn.execute(
+            f"""
+            SELECT user_id, SUM(profit)
+            FROM profit_events INDEXED BY idx_profit_events_user_ts
+            WHERE user_id IN ({",".join("?" * len(chunk))})
+              AND ts >= ?
+            GROUP BY user_id
+            """,
+            (*chunk, cutoff or 0),
+        )
+        totals.update(rows.fetchall())
+    return totals
 
-    for entry in profits:
-        if entry["timestamp"] < cutoff:
-            continue
-        totals[entry["user_id"]] = totals.get(entry["user_id"], 0.0) + entry["profit"]
 
-    rankings = [
-        {"user_id": user_id, "profit": round(total, 4)}
-        for user_id, total in totals.items()
+class Leaderboard:
+    """Wallets ordered by realized profit over one trailing window.
+
+    Entries sit in a ``SortedList`` keyed by negated profit, so a wallet's rank
+    and any page of the board cost O(log n) plus the page size.
+    """
+
+    def __init__(self, span: Optional[int]) -> None:
+        self.span = span
+        self.cutoff: Optional[int] = None
+        self.totals: Dict[int, float] = {}
+        self.ordered: SortedList = SortedList()
+
+    def __len__(self) -> int:
+        return len(self.ordered)
+
+    def set_total(self, user_id: int, total: Optional[float]) -> None:
+        current = self.totals.pop(user_id, None)
+        if current is not None:
+            self.ordered.remove((-current, user_id))
+        if total is not None:
+            self.totals[user_id] = total
+            self.ordered.add((-total, user_id))
+
+    def rebuild(self, conn: sqlite3.Connection, now: int) -> None:
+        self.cutoff = None if self.span is None else now - self.span
+        self.totals = _profit_totals(conn, self.cutoff)
+        self.ordered = SortedList((-total, user) for user, total in self.totals.items())
+
+    def advance(self, conn: sqlite3.Connection, now: int, changed: Set[int]) -> None:
+        """Recompute the wallets that changed or had events fall out of the window."""
+        dirty = set(changed)
+        cutoff = self.cutoff
+        if self.span is not None:
+            cutoff = now - self.span
+            if self.cutoff is not None and cutoff > self.cutoff:
+                dirty.update(
+                    user_id
+                    for (user_id,) in conn.execute(
+                        """
+                        SELECT DISTINCT user_id
+                        FROM profit_events INDEXED BY idx_profit_events_ts
+                        WHERE ts >= ? AND ts < ? AND user_id IS NOT NULL
+                        """,
+                        (self.cutoff, cutoff),
+                    )
+                )
+            self.cutoff = cutoff
+        if not dirty:
+            return
+        totals = _profit_totals(conn, cutoff, sorted(dirty))
+        for user_id in dirty:
+            self.set_total(user_id, totals.get(user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Zero-based position of ``user_id``, or ``None`` when it is not ranked."""
+        total = self.totals.get(user_id)
+        if total is None:
+            return None
+        return self.ordered.index((-total, user_id))
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, float]]:
+        return [
+            (user_id, -negated)
+            for negated, user_id in self.ordered.islice(offset, offset + limit)
+        ]
+
+
+class Leaderboards:
+    """Every window's leaderboard, caught up from the profit change log.
+
+    Ingest records each wallet whose profit events it rewrote in
+    ``profit_changes``. A refresh recomputes only those wallets and the ones
+    whose events aged out of a window, so every worker stays current without
+    re-ranking everyone. A worker that fell behind the trimmed log, or a
+    ledger rebuild, triggers a full rebuild.
+    """
+
+    def __init__(self) -> None:
+        self.boards = {name: Leaderboard(span) for name, span in WINDOWS.items()}
+        self.seq: Optional[int] = None
+        self.refreshed_at = 0.0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, now: Optional[int] = None) -> None:
+        with self._lock:
+            if now is None:
+                if time.monotonic() - self.refreshed_at < _REFRESH_SECONDS:
+                    return
+                now = int(time.time())
+            with read_session() as conn:
+                # The log is read before the totals: a change landing in
+                # between is applied twice, and recomputing a wallet is
+                # idempotent.
+                first_seq, last_seq = conn.execute(
+                    "SELECT MIN(seq), COALESCE(MAX(seq), 0) FROM profit_changes"
+                ).fetchone()
+                changes = (
+                    conn.execute(
+                        "SELECT user_id FROM profit_changes WHERE seq > ?",
+                        (self.seq,),
+                    ).fetchall()
+                    if self.seq is not None
+                    else []
+                )
+                changed = {row[0] for row in changes}
+                if (
+                    self.seq is None
+                    or None in changed
+                    or (first_seq is not None and first_seq > self.seq + 1)
+                ):
+                    for board in self.boards.values():
+                        board.rebuild(conn, now)
+                    self.rebuilds += 1
+                else:
+                    for board in self.boards.values():
+                        board.advance(conn, now, changed)
+            self.seq = last_seq
+            self.refreshed_at = time.monotonic()
+
+    @contextmanager
+    def board(self, window: str) -> Iterator[Leaderboard]:
+        """Yield a current board; it is not refreshed while the caller reads it."""
+        self.refresh()
+        with self._lock:
+            yield self.boards[window]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seq": self.seq,
+            "rebuilds": self.rebuilds,
+            "wallets": {name: len(board) for name, board in self.boards.items()},
+        }
+
+
+leaderboards = Leaderboards()
+
+
+def _rows(
+    conn: sqlite3.Connection, entries: Iterable[Tuple[int, float]], first_rank: int
+) -> List[Dict[str, Any]]:
+    entries = list(entries)
+    addresses = resolve_wallets(conn, (user_id for user_id, _ in entries))
+    return [
+        {
+            "rank": first_rank + position,
+            "user_id": addresses.get(user_id),
+            "profit": round(total, 4),
+        }
+        for position, (user_id, total) in enumerate(entries)
     ]
-    rankings.sort(key=lambda item: item["profit"], reverse=True)
-    return rankings[:limit]
+
+
+@timed_service
+def top_profit(
+    window: str = DEFAULT_WINDOW, limit: int = 20, offset: int = 0
+) -> Dict[str, Any]:
+    """One page of a window's leaderboard, with 1-based ranks."""
+    with leaderboards.board(window) as board, read_session() as conn:
+        rows = _rows(conn, board.page(offset, limit), offset + 1)
+        total = len(board)
+    SERVICE_ROWS.inc(len(rows), service="top_profit")
+    return {"window": window, "total": total, "data": rows}
+
+
+@timed_service
+def wallet_rank(
+    address: str, window: str = DEFAULT_WINDOW, neighbors: int = 5
+) -> Optional[Dict[str, Any]]:
+    """A wallet's rank in a window and the wallets ranked around it.
+
+    Returns ``None`` for an unknown wallet; a known wallet without profit
+    events in the window has no rank.
+    """
+    with leaderboards.board(window) as board, read_session() as conn:
+        user_id = wallet_key(conn, address)
+        if user_id is None:
+            return None
+        rank = board.rank(user_id)
+        result: Dict[str, Any] = {
+            "user_id": address,
+            "window": window,
+            "total": len(board),
+            "rank": None,
+            "profit": None,
+            "neighbors": [],
+        }
+        if rank is None:
+            return result
+        start = max(rank - neighbors, 0)
+        result.update(
+            rank=rank + 1,
+            profit=round(board.totals[user_id], 4),
+            neighbors=_rows(
+                conn, board.page(start, rank + neighbors + 1 - start), start + 1
+            ),
+        )
+    return result
+
+
+def trim_profit_changes(keep: int = PROFIT_CHANGES_KEEP) -> int:
+    """Drop all but the newest ``keep`` change log entries."""
+    with db_session() as conn:
+        return conn.execute(
+            """
+            DELETE FROM profit_changes
+            WHERE seq <= (SELECT COALESCE(MAX(seq), 0) FROM profit_changes) - ?
+            """,
+            (keep,),
+        ).rowcount
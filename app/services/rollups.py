@@ -0,0 +1,200 @@
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.db import bump_data_generation, db_session
+from app.services.ledger import TradeRow
+from app.services.trade_store import ArchivedTrades, history_start
+
+HOUR = 3600
+
+# Rollup table -> the trades column it is keyed by. The order matches the
+# (user_id, market_id) leading fields of the entries built in update_rollups.
+ROLLUPS = {"user_hourly": "user_id", "market_hourly": "market_id"}
+# Rollup key column -> the archive segment column holding it.
+SEGMENT_KEYS = {"user_id": "user_codes", "market_id": "market_codes"}
+
+
+def hour_of(ts: int) -> int:
+    return ts - ts % HOUR
+
+
+def update_rollups(
+    conn: sqlite3.Connection,
+    added: Sequence[TradeRow],
+    removed: Iterable[sqlite3.Row],
+) -> None:
+    """Apply trade inserts and overwrites to the hourly rollup tables.
+
+    ``added`` holds the new versions of inserted or changed trades and
+    ``removed`` the stored versions they overwrite, so a replaced trade id moves
+    its notional out of its old bucket before the new one is counted.
+    """
+    removed = list(removed)
+    # (user_id, market_id, hour, signed notional, signed count) per trade.
+    entries: List[Tuple[Optional[str], Optional[str], int, float, int]] = [
+        (
+            row["user_id"],
+            row["market_id"],
+            row["ts"] - row["ts"] % HOUR,
+            -abs((row["price"] or 0) * (row["size"] or 0)),
+            -1,
+        )
+        for row in removed
+        if row["ts"] is not None
+    ]
+    entries.extend(
+        (
+            row.user_id,
+            row.market_id,
+            row.ts - row.ts % HOUR,
+            abs((row.price or 0) * (row.size or 0)),
+            1,
+        )
+        for row in added
+        if row.ts is not None
+    )
+
+    for position, (table, column) in enumerate(ROLLUPS.items()):
+        deltas: Dict[Tuple[str, int], List[float]] = {}
+        for entry in entries:
+            key = entry[position]
+            if key is None:
+                continue
+            delta = deltas.get((key, entry[2]))
+            if delta is None:
+                deltas[(key, entry[2])] = [entry[3], entry[4]]
+            else:
+                delta[0] += entry[3]
+                delta[1] += entry[4]
+        if not deltas:
+            continue
+
+        conn.executemany(
+            f"""
+            INSERT INTO {table} ({column}, hour, notional, trade_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT({column}, hour) DO UPDATE SET
+                notional = notional + excluded.notional,
+                trade_count = trade_count + excluded.trade_count
+            """,
+            [(key, hour, delta[0], delta[1]) for (key, hour), delta in deltas.items()],
+        )
+        if removed:
+            conn.executemany(
+                f"DELETE FROM {table} WHERE {column} = ? AND hour = ? AND trade_count <= 0",
+                list(deltas),
+            )
+
+
+def add_staged_rollups(conn: sqlite3.Connection, source: str) -> None:
+    """Count every trade in table ``source`` into the rollups, set-wise.
+
+    For batches known to hold only new trades, so nothing is moved out of an
+    older bucket.
+    """
+    for table, column in ROLLUPS.items():
+        conn.execute(
+            f"""
+            INSERT INTO {table} ({column}, hour, notional, trade_count)
+            SELECT {column},
+                   ts - ts % {HOUR},
+                   SUM(ABS(COALESCE(price, 0) * COALESCE(size, 0))),
+                   COUNT(*)
+            FROM {source}
+            WHERE {column} IS NOT NULL AND ts IS NOT NULL
+            GROUP BY {column}, ts - ts % {HOUR}
+            ON CONFLICT({column}, hour) DO UPDATE SET
+                notional = notional + excluded.notional,
+                trade_count = trade_count + excluded.trade_count
+            """
+        )
+
+
+def _add_archived_rollups(
+    conn: sqlite3.Connection, archived: ArchivedTrades, table: str, column: str
+) -> None:
+    """Count the trades of pruned days, read from their segments, into ``table``."""
+    code = SEGMENT_KEYS[column]
+    columns = archived.select(lambda segment: segment[code] != 0)
+    if not len(columns["ts"]):
+        return
+    buckets, inverse = np.unique(
+        np.stack([columns[code].astype(np.int64), columns["ts"] // HOUR * HOUR]),
+        axis=1,
+        return_inverse=True,
+    )
+    inverse = inverse.reshape(-1)
+    notional = np.bincount(inverse, weights=np.abs(columns["price"] * columns["size"]))
+    counts = np.bincount(inverse)
+    conn.executemany(
+        f"""
+        INSERT INTO {table} ({column}, hour, notional, trade_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT({column}, hour) DO UPDATE SET
+            notional = notional + excluded.notional,
+            trade_count = trade_count + excluded.trade_count
+        """,
+        zip(
+            buckets[0].tolist(),
+            buckets[1].tolist(),
+            notional.tolist(),
+            counts.tolist(),
+        ),
+    )
+
+
+def rebuild_rollups() -> None:
+    """Recompute the rollups from the trades table and the archive.
+
+    Pruned days are read from their segments. Buckets before the retention
+    horizon are kept as they are, since their trades are gone.
+    """
+    with db_session() as conn:
+        start = history_start(conn)
+        archived = ArchivedTrades(conn)
+        for table, column in ROLLUPS.items():
+            conn.execute(f"DELETE FROM {table} WHERE hour >= ?", (start,))
+            if archived:
+                _add_archived_rollups(conn, archived, table, column)
+            conn.execute(
+                f"""
+                INSERT INTO {table} ({column}, hour, notional, trade_count)
+                SELECT {column},
+                       ts - ts % {HOUR},
+                       SUM(ABS(COALESCE(price, 0) * COALESCE(size, 0))),
+                       COUNT(*)
+                FROM trades
+                WHERE {column} IS NOT NULL AND ts >= ?
+                GROUP BY {column}, ts - ts % {HOUR}
+                ON CONFLICT({column}, hour) DO UPDATE SET
+                    notional = notional + excluded.notional,
+                    trade_count = trade_count + excluded.trade_count
+                """,
+                (start,),
+            )
+        bump_data_generation(conn)
+
+
+def ensure_rollups() -> None:
+    """Build the rollups from existing trades when they have never been populated."""
+    with db_session() as conn:
+        has_rollups = conn.execute("SELECT 1 FROM user_hourly LIMIT 1").fetchone()
+        has_trades = conn.execute(
+            "SELECT 1 FROM trades WHERE ts IS NOT NULL LIMIT 1"
+        ).fetchone()
+    if has_trades and not has_rollups:
+        rebuild_rollups()
+
+
+def window_bounds(now: int, since_hours: int) -> Tuple[int, int]:
+    """Split a trailing window into a raw-trade head and whole-hour buckets.
+
+    Trades in ``[cutoff, boundary)`` are read from the trades table and every
+    bucket starting at or after ``boundary`` from the rollups, which keeps the
+    window exact while touching at most one hour of raw rows.
+    """
+    cutoff = now - since_hours * HOUR
+    boundary = hour_of(cutoff) if cutoff % HOUR == 0 else hour_of(cutoff) + HOUR
+    return cutoff, boundary
@@ -1,13 +1,35 @@
+import calendar
+import heapq
+import sqlite3
 from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Any, DefaultDict, Dict, List, Optional, Tuple, TypedDict
-
-from app.db import db_session
+from itertools import groupby
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypedDict,
+)
+
+import numpy as np
+
+from app.db import read_session
+from app.metrics import SERVICE_ROWS, timed_service
+from app.profiling import phase_clock
+from app.services.keys import resolve_markets, resolve_wallets
+from app.services.trade_store import ArchivedTrades, HistoryRow, get_trade_store
 
 
 class TradeEntry(TypedDict):
-    user_id: str
-    market_id: str
+    user_id: int
+    market_id: int
     side: str
     price: float
     size: float
@@ -15,262 +37,429 @@ class TradeEntry(TypedDict):
 
 
 class ProfitEntry(TypedDict):
-    user_id: str
-    market_id: str
+    user_id: int
+    market_id: int
     timestamp: datetime
     profit: float
 
 
-class ReinvestTrade(TypedDict):
-    trade: TradeEntry
+class UserActivity(TypedDict):
     stake: float
+    trade_count: int
 
 
-def _parse_time(value: str) -> datetime:
-    if isinstance(value, (int, float)):
-        return datetime.utcfromtimestamp(value)
-    if isinstance(value, str) and value.isdigit():
-        return datetime.utcfromtimestamp(int(value))
-    return datetime.fromisoformat(value.replace("Z", "+00:00"))
-
-
-def load_trades() -> List[TradeEntry]:
-    with db_session() as conn:
-        rows = conn.execute(
-            """
-            SELECT user_id, market_id, side, price, size, timestamp
-            FROM trades
-            WHERE timestamp IS NOT NULL
-            """
-        ).fetchall()
-
-    trades: List[TradeEntry] = []
-    for row in rows:
-        trade_time = _parse_time(row["timestamp"])
-        trades.append(
-            {
-                "user_id": row["user_id"],
-                "market_id": row["market_id"],
-                "side": row["side"],
-                "price": row["price"],
-                "size": row["size"],
-                "timestamp": trade_time,
-            }
-        )
-    return trades
-
-
-def compute_realized_profits(
-    trades: List[TradeEntry],
-) -> List[ProfitEntry]:
-    grouped: Dict[Tuple[str, str], List[TradeEntry]] = defaultdict(list)
-    for trade in trades:
-        grouped[(trade["user_id"], trade["market_id"])].append(trade)
-
-    profits: List[ProfitEntry] = []
-    for (user_id, market_id), market_trades in grouped.items():
-        market_trades.sort(key=lambda item: item["timestamp"])
-        position = 0.0
-        cost = 0.0
-
-        for trade in market_trades:
-            side = (trade.get("side") or "").upper()
-            price = trade.get("price") or 0
-            size = trade.get("size") or 0
-            if size <= 0:
-                continue
-
-            if side == "BUY":
-                position += size
-                cost += price * size
-                continue
-
-            if side != "SELL":
-                continue
+class WalletState(NamedTuple):
+    first_trade_at: datetime
+    early_large_bets: int
+    # Cumulative profit realized in the early window, up to the threshold hit.
+    early_profit: float
+    profit_hit_at: Optional[datetime]
 
-            if position <= 0:
-                continue
 
-            cost_per_unit = cost / position if position else 0
-            realized_size = min(size, position)
-            profit = (price - cost_per_unit) * realized_size
-            if realized_size > 0:
-                profits.append(
-                    {
-                        "user_id": user_id,
-                        "market_id": market_id,
-                        "timestamp": trade["timestamp"],
-                        "profit": profit,
-                    }
-                )
-            position -= realized_size
-            cost = cost_per_unit * position
-
-    return profits
-
-
-def compute_smart_money(
+class Finding(NamedTuple):
+    reason: str
+    market_id: Optional[int]
+    timestamp: datetime
+    stake: float
+    profit_hit_at: Optional[datetime]
+
+
+# Trade columns in the order of an archived HistoryRow.
+HISTORY_COLUMNS = "user_id, market_id, id, side, price, size, ts"
+
+
+def _trade_entry(row: Sequence[Any]) -> TradeEntry:
+    user_id, market_id, _, side, price, size, ts = row
+    return {
+        "user_id": user_id,
+        "market_id": market_id,
+        "side": side,
+        "price": price,
+        "size": size,
+        "timestamp": datetime.utcfromtimestamp(ts),
+    }
+
+
+def _profit_entry(row: sqlite3.Row) -> ProfitEntry:
+    return {
+        "user_id": row["user_id"],
+        "market_id": row["market_id"],
+        "timestamp": datetime.utcfromtimestamp(row["ts"]),
+        "profit": row["profit"],
+    }
+
+
+@timed_service
+def load_profit_events(since_ts: Optional[int] = None) -> List[ProfitEntry]:
+    with read_session() as conn:
+        if since_ts is None:
+            rows = conn.execute(
+                """
+                SELECT user_id, market_id, ts, profit
+                FROM profit_events
+                """
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                """
+                SELECT user_id, market_id, ts, profit
+                FROM profit_events INDEXED BY idx_profit_events_ts
+                WHERE ts >= ?
+                """,
+                (since_ts,),
+            ).fetchall()
+    SERVICE_ROWS.inc(len(rows), service="load_profit_events")
+    return [_profit_entry(row) for row in rows]
+
+
+def apply_trade(
+    position: float, cost: float, side: Optional[str], price: float, size: float
+) -> Tuple[float, float, Optional[float]]:
+    """Advance an average-cost position by one trade.
+
+    Returns the new position and cost basis, plus the realized profit when the
+    trade is a sell that closes part of the position.
+    """
+    side = (side or "").upper()
+    price = price or 0
+    size = size or 0
+    if size <= 0:
+        return position, cost, None
+
+    if side == "BUY":
+        return position + size, cost + price * size, None
+
+    if side != "SELL" or position <= 0:
+        return position, cost, None
+
+    cost_per_unit = cost / position if position else 0
+    realized_size = min(size, position)
+    profit = (price - cost_per_unit) * realized_size
+    position -= realized_size
+    return position, cost_per_unit * position, profit
+
+
+def rank_smart_money(
+    activity: Dict[int, UserActivity],
+    profits: Iterable[ProfitEntry],
+    cutoff: datetime,
     min_roi: float = 0.2,
     min_win_rate: float = 0.6,
     min_trades: int = 5,
-    since_days: int = 30,
+    limit: Optional[int] = None,
 ) -> List[Dict[str, float]]:
-    cutoff = datetime.utcnow() - timedelta(days=since_days)
-    user_market_profit: DefaultDict[Tuple[str, str], float] = defaultdict(float)
-    user_stats: DefaultDict[str, Dict[str, float]] = defaultdict(
-        lambda: {"profit": 0.0, "stake": 0.0, "trade_count": 0}
+    """Score users from their window activity and realized-profit events.
+
+    Profit events are indexed per user as they are read, so ROI, win rate and
+    profit for every user come out of a single O(users + events) pass. With a
+    ``limit`` only the top results by ROI are selected instead of sorting all.
+    """
+    user_profit: DefaultDict[int, float] = defaultdict(float)
+    user_market_profit: DefaultDict[int, DefaultDict[int, float]] = defaultdict(
+        lambda: defaultdict(float)
     )
-
-    trades = load_trades()
-    profits = compute_realized_profits(trades)
-
-    for trade in trades:
-        if trade["timestamp"] < cutoff:
-            continue
-        stake = (trade["price"] or 0) * (trade["size"] or 0)
-        user_stats[trade["user_id"]]["stake"] += abs(stake)
-        user_stats[trade["user_id"]]["trade_count"] += 1
-
     for entry in profits:
         if entry["timestamp"] < cutoff:
             continue
-        user_stats[entry["user_id"]]["profit"] += entry["profit"]
-        user_market_profit[(entry["user_id"], entry["market_id"])] += entry["profit"]
+        user_profit[entry["user_id"]] += entry["profit"]
+        user_market_profit[entry["user_id"]][entry["market_id"]] += entry["profit"]
 
     results = []
-    for user_id, stats in user_stats.items():
+    for user_id, stats in activity.items():
         if stats["trade_count"] < min_trades or stats["stake"] <= 0:
             continue
-        market_profits = [
-            profit for (uid, _), profit in user_market_profit.items() if uid == user_id
-        ]
+        market_profits = user_market_profit.get(user_id)
         if not market_profits:
             continue
-        wins = sum(1 for profit in market_profits if profit > 0)
+        wins = sum(1 for profit in market_profits.values() if profit > 0)
         win_rate = wins / len(market_profits)
-        roi = stats["profit"] / stats["stake"] if stats["stake"] else 0
+        profit = user_profit[user_id]
+        roi = profit / stats["stake"]
         if roi >= min_roi and win_rate >= min_win_rate:
             results.append(
                 {
                     "user_id": user_id,
                     "roi": round(roi, 4),
                     "win_rate": round(win_rate, 4),
-                    "profit": round(stats["profit"], 4),
+                    "profit": round(profit, 4),
                     "trade_count": stats["trade_count"],
                 }
             )
 
+    if limit is not None:
+        return heapq.nlargest(limit, results, key=lambda item: item["roi"])
     results.sort(key=lambda item: item["roi"], reverse=True)
     return results
 
 
-def compute_suspicious_wallets(
-    account_age_days: int = 30,
-    large_stake: float = 10000.0,
-    profit_threshold: float = 10000.0,
-    reinvest_min_days: int = 1,
-    reinvest_max_days: int = 30,
-) -> List[Dict[str, Any]]:
-    trades = load_trades()
-    if not trades:
-        return []
-
-    trades_by_user: DefaultDict[str, List[TradeEntry]] = defaultdict(list)
-    first_trade_time: Dict[str, datetime] = {}
-
-    for trade in trades:
-        trades_by_user[trade["user_id"]].append(trade)
-        current_first = first_trade_time.get(trade["user_id"])
-        if current_first is None or trade["timestamp"] < current_first:
-            first_trade_time[trade["user_id"]] = trade["timestamp"]
-
-    for user_trades in trades_by_user.values():
-        user_trades.sort(key=lambda item: item["timestamp"])
-
-    profits = compute_realized_profits(trades)
-    profits_by_user: DefaultDict[str, List[ProfitEntry]] = defaultdict(list)
-    for entry in profits:
-        profits_by_user[entry["user_id"]].append(entry)
-
-    for user_profits in profits_by_user.values():
-        user_profits.sort(key=lambda item: item["timestamp"])
+@timed_service
+def compute_smart_money(
+    min_roi: float = 0.2,
+    min_win_rate: float = 0.6,
+    min_trades: int = 5,
+    since_days: int = 30,
+    limit: Optional[int] = None,
+) -> List[Dict[str, float]]:
+    cutoff = datetime.utcnow() - timedelta(days=since_days)
+    clock = phase_clock()
+
+    cutoff_ts = calendar.timegm(cutoff.utctimetuple())
+    store = get_trade_store(cutoff_ts)
+    stakes = store.sum_by_user(cutoff_ts)
+    counts = store.count_by_user(cutoff_ts)
+    SERVICE_ROWS.inc(int(counts.sum()), service="compute_smart_money")
+    activity: Dict[int, UserActivity] = {
+        int(code): {
+            "stake": float(stakes[code]),
+            "trade_count": int(counts[code]),
+        }
+        for code in np.flatnonzero(counts)
+        if code
+    }
+    if clock:
+        clock.lap("group")
+
+    profits = load_profit_events(cutoff_ts)
+    if clock:
+        clock.lap("fetch")
+    results = rank_smart_money(
+        activity,
+        profits,
+        cutoff,
+        min_roi=min_roi,
+        min_win_rate=min_win_rate,
+        min_trades=min_trades,
+        limit=limit,
+    )
+    if clock:
+        clock.lap("compute")
+    with read_session() as conn:
+        addresses = resolve_wallets(conn, (item["user_id"] for item in results))
+    for item in results:
+        item["user_id"] = addresses[item["user_id"]]
+    if clock:
+        clock.lap("serialize")
+    return results
 
-    results: List[Dict[str, Any]] = []
 
-    for user_id, user_trades in trades_by_user.items():
-        first_time = first_trade_time[user_id]
-        early_cutoff = first_time + timedelta(days=account_age_days)
+def evaluate_wallet(
+    user_trades: List[TradeEntry],
+    user_profits: List[ProfitEntry],
+    account_age_days: int,
+    large_stake: float,
+    profit_threshold: float,
+    reinvest_min_days: int,
+    reinvest_max_days: int,
+) -> Tuple[WalletState, List[Finding]]:
+    """Detection state and findings for one wallet from its time-ordered history."""
+    first_time = user_trades[0]["timestamp"]
+    early_cutoff = first_time + timedelta(days=account_age_days)
+
+    findings: List[Finding] = []
+    for trade in user_trades:
+        if trade["timestamp"] > early_cutoff:
+            break
+        stake = abs((trade.get("price") or 0) * (trade.get("size") or 0))
+        if stake >= large_stake:
+            findings.append(
+                Finding(
+                    "new_account_large_bet",
+                    trade.get("market_id"),
+                    trade["timestamp"],
+                    round(stake, 4),
+                    None,
+                )
+            )
 
-        early_large_trades: List[Dict[str, Any]] = []
-        for trade in user_trades:
-            if trade["timestamp"] > early_cutoff:
+    cumulative_profit = 0.0
+    profit_hit_time = None
+    if findings:
+        for profit_entry in user_profits:
+            if profit_entry["timestamp"] > early_cutoff:
                 break
-            stake = abs((trade.get("price") or 0) * (trade.get("size") or 0))
-            if stake >= large_stake:
-                early_large_trades.append({"trade": trade, "stake": stake})
+            cumulative_profit += profit_entry["profit"]
+            if cumulative_profit >= profit_threshold:
+                profit_hit_time = profit_entry["timestamp"]
+                break
+    state = WalletState(first_time, len(findings), cumulative_profit, profit_hit_time)
+    if profit_hit_time is None:
+        return state, findings
 
-        for entry in early_large_trades:
-            trade = entry["trade"]
-            results.append(
-                {
-                    "user_id": user_id,
-                    "reason": "new_account_large_bet",
-                    "market_id": trade.get("market_id"),
-                    "timestamp": trade["timestamp"].isoformat(),
-                    "stake": round(entry["stake"], 4),
-                    "first_trade_at": first_time.isoformat(),
-                }
-            )
+    reinvest_start = profit_hit_time + timedelta(days=reinvest_min_days)
+    reinvest_end = profit_hit_time + timedelta(days=reinvest_max_days)
 
-        if not early_large_trades:
+    for trade in user_trades:
+        if trade["timestamp"] < reinvest_start:
             continue
+        if trade["timestamp"] > reinvest_end:
+            break
+        stake = abs((trade.get("price") or 0) * (trade.get("size") or 0))
+        if stake >= large_stake:
+            findings.append(
+                Finding(
+                    "profitable_early_reinvest",
+                    trade.get("market_id"),
+                    trade["timestamp"],
+                    round(stake, 4),
+                    profit_hit_time,
+                )
+            )
+            break
+    return state, findings
+
+
+def finding_entry(
+    address: Optional[str],
+    condition_id: Optional[str],
+    finding: Finding,
+    first_trade_at: datetime,
+    profit_threshold: float,
+) -> Dict[str, Any]:
+    entry = {
+        "user_id": address,
+        "reason": finding.reason,
+        "market_id": condition_id,
+        "timestamp": finding.timestamp.isoformat(),
+        "stake": finding.stake,
+        "first_trade_at": first_trade_at.isoformat(),
+    }
+    if finding.profit_hit_at is not None:
+        entry["profit_hit_at"] = finding.profit_hit_at.isoformat()
+        entry["profit_threshold"] = round(profit_threshold, 4)
+    return entry
+
+
+def iter_wallet_histories(
+    conn: sqlite3.Connection, start_user: int = 0
+) -> Iterator[Tuple[int, List[TradeEntry], List[ProfitEntry]]]:
+    """Yield ``(wallet key, trades, profits)`` for every trading wallet in key order.
+
+    Trades and profit events are both read ordered by wallet and time and merged
+    one wallet at a time, so only a single wallet's history is held in memory.
+    Trades of pruned days come from their archive segments.
+    """
+    trade_rows: Iterable[Any] = conn.execute(
+        f"""
+        SELECT {HISTORY_COLUMNS}
+        FROM trades INDEXED BY idx_trades_user_ts
+        WHERE user_id >= ? AND ts IS NOT NULL
+        ORDER BY user_id, ts
+        """,
+        (start_user,),
+    )
+    archived = ArchivedTrades(conn)
+    if archived:
+        first = max(start_user, 1)
+        trade_rows = heapq.merge(
+            archived.rows(lambda columns: columns["user_codes"] >= first, False),
+            trade_rows,
+            key=lambda row: (row[0], row[6]),
+        )
+    profit_rows = conn.execute(
+        """
+        SELECT user_id, market_id, ts, profit
+        FROM profit_events INDEXED BY idx_profit_events_user_ts
+        WHERE user_id >= ?
+        ORDER BY user_id, ts
+        """,
+        (start_user,),
+    )
 
-        profit_entries = [
-            entry
-            for entry in profits_by_user.get(user_id, [])
-            if entry["timestamp"] <= early_cutoff
+    profit_groups = groupby(profit_rows, key=lambda row: row["user_id"])
+    pending = next(profit_groups, None)
+    for user_id, rows in groupby(trade_rows, key=lambda row: row[0]):
+        while pending is not None and pending[0] < user_id:
+            pending = next(profit_groups, None)
+        user_profits: List[ProfitEntry] = []
+        if pending is not None and pending[0] == user_id:
+            user_profits = [_profit_entry(row) for row in pending[1]]
+        yield user_id, [_trade_entry(row) for row in rows], user_profits
+
+
+def load_wallet_histories(
+    conn: sqlite3.Connection, user_ids: Sequence[int]
+) -> Iterator[Tuple[int, List[TradeEntry], List[ProfitEntry]]]:
+    """``iter_wallet_histories`` for just ``user_ids``, in the order given.
+
+    Pruned days are scanned once for all the wallets, not once per wallet.
+    """
+    pruned: Dict[int, List[HistoryRow]] = {}
+    archived = ArchivedTrades(conn) if user_ids else None
+    if archived:
+        wanted = np.array(user_ids)
+        pruned = {
+            user_id: list(rows)
+            for user_id, rows in groupby(
+                archived.rows(
+                    lambda columns: np.isin(columns["user_codes"], wanted), False
+                ),
+                key=lambda row: row[0],
+            )
+        }
+    for user_id in user_ids:
+        trades = conn.execute(
+            f"""
+            SELECT {HISTORY_COLUMNS}
+            FROM trades INDEXED BY idx_trades_user_ts
+            WHERE user_id = ? AND ts IS NOT NULL
+            ORDER BY ts
+            """,
+            (user_id,),
+        )
+        profits = conn.execute(
+            """
+            SELECT user_id, market_id, ts, profit
+            FROM profit_events INDEXED BY idx_profit_events_user_ts
+            WHERE user_id = ?
+            ORDER BY ts
+            """,
+            (user_id,),
+        )
+        merged = heapq.merge(pruned.get(user_id, ()), trades, key=lambda row: row[6])
+        yield user_id, [_trade_entry(row) for row in merged], [
+            _profit_entry(row) for row in profits
         ]
-        if not profit_entries:
-            continue
 
-        cumulative_profit = 0.0
-        profit_hit_time = None
-        for entry in profit_entries:
-            cumulative_profit += entry["profit"]
-            if cumulative_profit >= profit_threshold:
-                profit_hit_time = entry["timestamp"]
-                break
-
-        if profit_hit_time is None:
-            continue
 
-        reinvest_start = profit_hit_time + timedelta(days=reinvest_min_days)
-        reinvest_end = profit_hit_time + timedelta(days=reinvest_max_days)
+@timed_service
+def compute_suspicious_wallets(
+    account_age_days: int = 30,
+    large_stake: float = 10000.0,
+    profit_threshold: float = 10000.0,
+    reinvest_min_days: int = 1,
+    reinvest_max_days: int = 30,
+) -> List[Dict[str, Any]]:
+    """Evaluate every wallet from scratch; the API serves stored findings instead.
 
-        reinvest_trade: Optional[ReinvestTrade] = None
-        for trade in user_trades:
-            if trade["timestamp"] < reinvest_start:
+    Addresses and condition ids are resolved only for the findings emitted.
+    """
+    results: List[Dict[str, Any]] = []
+    scanned = 0
+    with read_session() as conn:
+        for user_id, user_trades, user_profits in iter_wallet_histories(conn):
+            scanned += len(user_trades) + len(user_profits)
+            state, findings = evaluate_wallet(
+                user_trades,
+                user_profits,
+                account_age_days,
+                large_stake,
+                profit_threshold,
+                reinvest_min_days,
+                reinvest_max_days,
+            )
+            if not findings:
                 continue
-            if trade["timestamp"] > reinvest_end:
-                break
-            stake = abs((trade.get("price") or 0) * (trade.get("size") or 0))
-            if stake >= large_stake:
-                reinvest_trade = {"trade": trade, "stake": stake}
-                break
-
-        if reinvest_trade is not None:
-            trade = reinvest_trade["trade"]
-            results.append(
-                {
-                    "user_id": user_id,
-                    "reason": "profitable_early_reinvest",
-                    "market_id": trade.get("market_id"),
-                    "timestamp": trade["timestamp"].isoformat(),
-                    "stake": round(reinvest_trade["stake"], 4),
-                    "first_trade_at": first_time.isoformat(),
-                    "profit_hit_at": profit_hit_time.isoformat(),
-                    "profit_threshold": round(profit_threshold, 4),
-                }
+            address = resolve_wallets(conn, [user_id])[user_id]
+            markets = resolve_markets(conn, (finding.market_id for finding in findings))
+            results.extend(
+                finding_entry(
+                    address,
+                    markets.get(finding.market_id),
+                    finding,
+                    state.first_trade_at,
+                    profit_threshold,
+                )
+                for finding in findings
             )
-
+    SERVICE_ROWS.inc(scanned, service="compute_suspicious_wallets")
     return results
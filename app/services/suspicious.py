@@ -0,0 +1,552 @@
+import calendar
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain, groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.db import bump_data_generation, db_session, read_session, stream_session
+from app.metrics import SERVICE_ROWS, timed_service
+from app.profiling import phase_clock
+from app.services.ledger import TradeRow
+from app.services.smart_money import (
+    Finding,
+    WalletState,
+    evaluate_wallet,
+    finding_entry,
+    iter_wallet_histories,
+    load_wallet_histories,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS: Dict[str, Any] = {
+    "account_age_days": int(os.getenv("SUSPICIOUS_ACCOUNT_AGE_DAYS", "30")),
+    "large_stake": float(os.getenv("SUSPICIOUS_LARGE_STAKE", "10000")),
+    "profit_threshold": float(os.getenv("SUSPICIOUS_PROFIT_THRESHOLD", "10000")),
+    "reinvest_min_days": int(os.getenv("SUSPICIOUS_REINVEST_MIN_DAYS", "1")),
+    "reinvest_max_days": int(os.getenv("SUSPICIOUS_REINVEST_MAX_DAYS", "30")),
+}
+SUSPICIOUS_MAX_CONFIGS = int(os.getenv("SUSPICIOUS_MAX_CONFIGS", "8"))
+
+THRESHOLD_COLUMNS = tuple(DEFAULT_THRESHOLDS)
+DAY = 86400
+# Wallets evaluated per write transaction during a rebuild.
+_REBUILD_BATCH = 1000
+# Requests refresh a config's last-used time at most this often.
+_TOUCH_SECONDS = 60
+# A build claim not renewed for this long is taken to be from a dead process.
+_CLAIM_SECONDS = 300
+
+# (wallet key, findings already returned for that wallet) to resume from.
+SuspiciousPosition = Tuple[int, int]
+WalletResult = Tuple[int, Optional[WalletState], List[Finding]]
+
+_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suspicious")
+_building: Set[int] = set()
+_lock = threading.Lock()
+_stopping = threading.Event()
+_stats: Dict[str, int] = {"evaluated": 0, "skipped": 0, "rebuilds": 0}
+
+
+def _epoch(value: Optional[datetime]) -> Optional[int]:
+    return None if value is None else calendar.timegm(value.utctimetuple())
+
+
+def _thresholds(config: sqlite3.Row) -> Dict[str, Any]:
+    return {column: config[column] for column in THRESHOLD_COLUMNS}
+
+
+def _find_config(
+    conn: sqlite3.Connection, thresholds: Dict[str, Any]
+) -> Optional[sqlite3.Row]:
+    where = " AND ".join(f"{column} = ?" for column in THRESHOLD_COLUMNS)
+    return conn.execute(
+        f"SELECT * FROM suspicious_configs WHERE {where}",
+        [thresholds[column] for column in THRESHOLD_COLUMNS],
+    ).fetchone()
+
+
+def _drop_config(conn: sqlite3.Connection, config_id: int) -> None:
+    for table in ("suspicious_findings", "wallet_detection_state", "suspicious_dirty"):
+        conn.execute(f"DELETE FROM {table} WHERE config_id = ?", (config_id,))
+    conn.execute("DELETE FROM suspicious_configs WHERE id = ?", (config_id,))
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    """Drop least recently used configs to make room for one more."""
+    configs = conn.execute(
+        "SELECT * FROM suspicious_configs ORDER BY last_used_at"
+    ).fetchall()
+    excess = len(configs) - SUSPICIOUS_MAX_CONFIGS + 1
+    if excess <= 0:
+        return
+    expired = int(time.time()) - _CLAIM_SECONDS
+    candidates = [
+        config
+        for config in configs
+        if (config["claimed_at"] or 0) < expired
+        and _thresholds(config) != DEFAULT_THRESHOLDS
+    ]
+    for config in candidates[:excess]:
+        logger.info("Evicting suspicious-wallet config %d", config["id"])
+        _drop_config(conn, config["id"])
+
+
+def _store_results(
+    conn: sqlite3.Connection, config_id: int, results: List[WalletResult]
+) -> None:
+    keys = [(config_id, user_id) for user_id, _, _ in results]
+    conn.executemany(
+        "DELETE FROM suspicious_findings WHERE config_id = ? AND user_id = ?", keys
+    )
+    conn.executemany(
+        "DELETE FROM wallet_detection_state WHERE config_id = ? AND user_id = ?", keys
+    )
+    conn.executemany(
+        """
+        INSERT INTO wallet_detection_state
+        (config_id, user_id, first_ts, early_large_bets, early_profit, profit_hit_ts)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                config_id,
+                user_id,
+                _epoch(state.first_trade_at),
+                state.early_large_bets,
+                state.early_profit,
+                _epoch(state.profit_hit_at),
+            )
+            for user_id, state, _ in results
+            if state is not None
+        ],
+    )
+    conn.executemany(
+        """
+        INSERT INTO suspicious_findings
+        (config_id, user_id, idx, reason, market_id, ts, stake, profit_hit_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                config_id,
+                user_id,
+                index,
+                finding.reason,
+                finding.market_id,
+                _epoch(finding.timestamp),
+                finding.stake,
+                _epoch(finding.profit_hit_at),
+            )
+            for user_id, _, findings in results
+            for index, finding in enumerate(findings)
+        ],
+    )
+
+
+def _horizon(state: sqlite3.Row, thresholds: Dict[str, Any]) -> int:
+    """Latest trade time that can still change a wallet's findings."""
+    horizon = state["first_ts"] + thresholds["account_age_days"] * DAY
+    if state["profit_hit_ts"] is not None:
+        horizon = max(
+            horizon, state["profit_hit_ts"] + thresholds["reinvest_max_days"] * DAY
+        )
+    return horizon
+
+
+def touched_wallets(
+    changed: Iterable[TradeRow], replaced: Iterable[sqlite3.Row]
+) -> Dict[int, int]:
+    """Earliest changed trade time per wallet.
+
+    Replaced rows count under the wallet they were stored with, so a trade that
+    moved between wallets re-evaluates both.
+    """
+    touched: Dict[int, int] = {}
+    for user_id, ts in chain(
+        ((row.user_id, row.ts) for row in changed),
+        ((row["user_id"], row["ts"]) for row in replaced),
+    ):
+        if user_id is None or ts is None:
+            continue
+        if user_id not in touched or ts < touched[user_id]:
+            touched[user_id] = ts
+    return touched
+
+
+def mark_wallets_dirty(conn: sqlite3.Connection, touched: Dict[int, int]) -> None:
+    """Queue wallets for re-evaluation under every stored config."""
+    conn.executemany(
+        """
+        INSERT INTO suspicious_dirty (config_id, user_id, since_ts)
+        SELECT id, ?, ? FROM suspicious_configs WHERE true
+        ON CONFLICT (config_id, user_id)
+        DO UPDATE SET since_ts = MIN(since_ts, excluded.since_ts)
+        """,
+        touched.items(),
+    )
+
+
+def refresh_dirty(conn: sqlite3.Connection) -> int:
+    """Re-evaluate queued wallets for every ready config; returns wallets evaluated.
+
+    Runs in the caller's write transaction, after the ledger has been updated.
+    A wallet whose earliest changed trade falls after the window its stored
+    state depends on keeps its findings without reading its history. Configs
+    still building keep their queue until the build finishes.
+    """
+    evaluated = 0
+    configs = conn.execute(
+        "SELECT * FROM suspicious_configs WHERE status = 'ready'"
+    ).fetchall()
+    for config in configs:
+        thresholds = _thresholds(config)
+        dirty = conn.execute(
+            "SELECT user_id, since_ts FROM suspicious_dirty WHERE config_id = ?",
+            (config["id"],),
+        ).fetchall()
+        stale: List[int] = []
+        for user_id, since_ts in dirty:
+            state = conn.execute(
+                """
+                SELECT first_ts, profit_hit_ts
+                FROM wallet_detection_state
+                WHERE config_id = ? AND user_id = ?
+                """,
+                (config["id"], user_id),
+            ).fetchone()
+            if state is not None and since_ts > _horizon(state, thresholds):
+                _stats["skipped"] += 1
+                continue
+            stale.append(user_id)
+        results: List[WalletResult] = []
+        for user_id, trades, profits in load_wallet_histories(conn, stale):
+            if trades:
+                results.append(
+                    (user_id, *evaluate_wallet(trades, profits, **thresholds))
+                )
+            else:
+                results.append((user_id, None, []))
+        _store_results(conn, config["id"], results)
+        conn.execute(
+            "DELETE FROM suspicious_dirty WHERE config_id = ?", (config["id"],)
+        )
+        evaluated += len(results)
+    _stats["evaluated"] += evaluated
+    return evaluated
+
+
+def update_suspicious(
+    conn: sqlite3.Connection,
+    changed: Iterable[TradeRow],
+    replaced: Iterable[sqlite3.Row],
+) -> None:
+    """Re-evaluate the wallets an ingest batch touched, in its transaction."""
+    mark_wallets_dirty(conn, touched_wallets(changed, replaced))
+    refresh_dirty(conn)
+
+
+def _claim(conn: sqlite3.Connection, config_id: int) -> bool:
+    """Take or renew this process's claim on building ``config_id``.
+
+    Every uvicorn worker schedules builds, so the claim in the config row is
+    what keeps one build per config. It fails while another live process
+    holds the claim, and once the config is ready.
+    """
+    now = int(time.time())
+    return (
+        conn.execute(
+            """
+            UPDATE suspicious_configs SET claimed_by = :owner, claimed_at = :now
+            WHERE id = :id
+              AND status != 'ready'
+              AND (
+                claimed_by IS NULL
+                OR claimed_by = :owner
+                OR claimed_at < :expired
+              )
+            """,
+            {
+                "owner": f"{socket.gethostname()}:{os.getpid()}",
+                "now": now,
+                "id": config_id,
+                "expired": now - _CLAIM_SECONDS,
+            },
+        ).rowcount
+        == 1
+    )
+
+
+def rebuild_config(config_id: int) -> None:
+    """Evaluate every wallet for one config, committing in batches.
+
+    Runs only while this process holds the config's build claim, which each
+    batch renews. Wallets touched by ingest while the build runs are queued
+    for the config and re-evaluated once it is marked ready.
+    """
+    started = time.perf_counter()
+    with db_session() as conn:
+        config = conn.execute(
+            "SELECT * FROM suspicious_configs WHERE id = ?", (config_id,)
+        ).fetchone()
+        if config is None or not _claim(conn, config_id):
+            return
+        for table in (
+            "suspicious_findings",
+            "wallet_detection_state",
+            "suspicious_dirty",
+        ):
+            conn.execute(f"DELETE FROM {table} WHERE config_id = ?", (config_id,))
+    thresholds = _thresholds(config)
+
+    batch: List[WalletResult] = []
+    with read_session() as reader:
+        for user_id, trades, profits in iter_wallet_histories(reader):
+            batch.append((user_id, *evaluate_wallet(trades, profits, **thresholds)))
+            if len(batch) >= _REBUILD_BATCH:
+                if _stopping.is_set():
+                    return
+                with db_session() as conn:
+                    if not _claim(conn, config_id):
+                        return
+                    _store_results(conn, config_id, batch)
+                batch = []
+    with db_session() as conn:
+        if not _claim(conn, config_id):
+            return
+        _store_results(conn, config_id, batch)
+        conn.execute(
+            """
+            UPDATE suspicious_configs
+            SET status = 'ready', built_at = ?, claimed_by = NULL, claimed_at = NULL
+            WHERE id = ?
+            """,
+            (int(time.time()), config_id),
+        )
+        refresh_dirty(conn)
+        bump_data_generation(conn)
+    _stats["rebuilds"] += 1
+    logger.info(
+        "Built suspicious-wallet config %d in %.2fs",
+        config_id,
+        time.perf_counter() - started,
+    )
+
+
+def _run_rebuild(config_id: int) -> None:
+    try:
+        rebuild_config(config_id)
+    except Exception:
+        logger.exception("Suspicious-wallet rebuild failed for config %d", config_id)
+    finally:
+        with _lock:
+            _building.discard(config_id)
+
+
+def _schedule(config_id: int) -> None:
+    with _lock:
+        if config_id in _building or _stopping.is_set():
+            return
+        _building.add(config_id)
+    _builder.submit(_run_rebuild, config_id)
+
+
+def request_config(thresholds: Dict[str, Any]) -> Tuple[int, str]:
+    """Return the id and status of the stored findings for ``thresholds``.
+
+    Thresholds seen for the first time get a config that builds in the
+    background; the caller does not wait for it.
+    """
+    now = int(time.time())
+    with read_session() as conn:
+        config = _find_config(conn, thresholds)
+    if config is None or (config["last_used_at"] or 0) < now - _TOUCH_SECONDS:
+        with db_session() as conn:
+            config = _find_config(conn, thresholds)
+            if config is None:
+                _evict(conn)
+                conn.execute(
+                    f"""
+                    INSERT INTO suspicious_configs
+                    ({", ".join(THRESHOLD_COLUMNS)}, last_used_at)
+                    VALUES ({", ".join("?" for _ in THRESHOLD_COLUMNS)}, ?)
+                    """,
+                    [*(thresholds[column] for column in THRESHOLD_COLUMNS), now],
+                )
+                config = _find_config(conn, thresholds)
+            else:
+                conn.execute(
+                    "UPDATE suspicious_configs SET last_used_at = ? WHERE id = ?",
+                    (now, config["id"]),
+                )
+    if config["status"] != "ready":
+        _schedule(config["id"])
+    return config["id"], config["status"]
+
+
+def ensure_suspicious() -> None:
+    """Schedule builds for the default thresholds and any unfinished configs."""
+    request_config(DEFAULT_THRESHOLDS)
+    with read_session() as conn:
+        pending = conn.execute(
+            "SELECT id FROM suspicious_configs WHERE status != 'ready'"
+        ).fetchall()
+    for row in pending:
+        _schedule(row["id"])
+
+
+def shutdown_suspicious() -> None:
+    """Stop background builds; unfinished ones resume on the next startup."""
+    _stopping.set()
+    _builder.shutdown(wait=False, cancel_futures=True)
+
+
+def _finding_rows(
+    conn: sqlite3.Connection,
+    config_id: int,
+    after: Optional[SuspiciousPosition] = None,
+    limit: Optional[int] = None,
+) -> sqlite3.Cursor:
+    after_user, skip = after if after else (-1, 0)
+    return conn.execute(
+        """
+        SELECT f.user_id AS user_key, f.idx, w.address, m.condition_id,
+               f.reason, f.ts, f.stake, f.profit_hit_ts, s.first_ts,
+               c.profit_threshold
+        FROM suspicious_findings f
+        JOIN suspicious_configs c ON c.id = f.config_id
+        JOIN wallet_detection_state s
+          ON s.config_id = f.config_id AND s.user_id = f.user_id
+        JOIN wallet_keys w ON w.id = f.user_id
+        LEFT JOIN market_keys m ON m.id = f.market_id
+        WHERE f.config_id = :config_id
+          AND (f.user_id > :after_user OR (f.user_id = :after_user AND f.idx >= :skip))
+        ORDER BY f.user_id, f.idx
+        LIMIT :limit
+        """,
+        {
+            "config_id": config_id,
+            "after_user": after_user,
+            "skip": skip,
+            "limit": -1 if limit is None else limit,
+        },
+    )
+
+
+def _from_epoch(value: Optional[int]) -> Optional[datetime]:
+    return None if value is None else datetime.utcfromtimestamp(value)
+
+
+def _finding_entry(row: sqlite3.Row) -> Dict[str, Any]:
+    return finding_entry(
+        row["address"],
+        row["condition_id"],
+        Finding(
+            row["reason"],
+            None,
+            datetime.utcfromtimestamp(row["ts"]),
+            row["stake"],
+            _from_epoch(row["profit_hit_ts"]),
+        ),
+        datetime.utcfromtimestamp(row["first_ts"]),
+        row["profit_threshold"],
+    )
+
+
+@timed_service
+def stored_findings(config_id: int) -> List[Dict[str, Any]]:
+    clock = phase_clock()
+    with read_session() as conn:
+        rows = _finding_rows(conn, config_id).fetchall()
+    SERVICE_ROWS.inc(len(rows), service="stored_findings")
+    if clock:
+        clock.lap("fetch")
+    entries = [_finding_entry(row) for row in rows]
+    if clock:
+        clock.lap("serialize")
+    return entries
+
+
+@timed_service
+def findings_page(
+    config_id: int, limit: int, after: Optional[SuspiciousPosition] = None
+) -> Dict[str, Any]:
+    """One page of stored findings plus the position to resume from."""
+    clock = phase_clock()
+    with read_session() as conn:
+        rows = _finding_rows(conn, config_id, after, limit + 1).fetchall()
+    SERVICE_ROWS.inc(len(rows), service="findings_page")
+    if clock:
+        clock.lap("fetch")
+    next_position = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_position = (last["user_key"], last["idx"] + 1)
+    entries = [_finding_entry(row) for row in rows[:limit]]
+    if clock:
+        clock.lap("serialize")
+    return {"data": entries, "next_cursor": next_position}
+
+
+def wallet_flags(conn: sqlite3.Connection, user_id: int) -> List[Dict[str, Any]]:
+    """One wallet's stored findings, grouped by ready threshold set."""
+    rows = conn.execute(
+        """
+        SELECT c.id AS config_id, c.account_age_days, c.large_stake,
+               c.profit_threshold, c.reinvest_min_days, c.reinvest_max_days,
+               w.address, m.condition_id, f.reason, f.ts, f.stake,
+               f.profit_hit_ts, s.first_ts
+        FROM suspicious_findings f
+        JOIN suspicious_configs c ON c.id = f.config_id
+        JOIN wallet_detection_state s
+          ON s.config_id = f.config_id AND s.user_id = f.user_id
+        JOIN wallet_keys w ON w.id = f.user_id
+        LEFT JOIN market_keys m ON m.id = f.market_id
+        WHERE f.user_id = ? AND c.status = 'ready'
+        ORDER BY c.id, f.idx
+        """,
+        (user_id,),
+    ).fetchall()
+    flags: List[Dict[str, Any]] = []
+    for _, group in groupby(rows, key=lambda row: row["config_id"]):
+        findings = list(group)
+        flags.append(
+            {
+                "thresholds": _thresholds(findings[0]),
+                "findings": [_finding_entry(row) for row in findings],
+            }
+        )
+    return flags
+
+
+def iter_findings(
+    config_id: int, after: Optional[SuspiciousPosition] = None
+) -> Iterator[Dict[str, Any]]:
+    with stream_session() as conn:
+        for row in _finding_rows(conn, config_id, after):
+            yield _finding_entry(row)
+
+
+def detection_stats() -> Dict[str, Any]:
+    with read_session() as conn:
+        configs = [
+            dict(row)
+            for row in conn.execute(
+                """
+                SELECT c.*, (
+                    SELECT COUNT(*) FROM suspicious_dirty d WHERE d.config_id = c.id
+                ) AS dirty_wallets
+                FROM suspicious_configs c
+                ORDER BY c.id
+                """
+            )
+        ]
+    with _lock:
+        building = sorted(_building)
+    return {**_stats, "building": building, "configs": configs}
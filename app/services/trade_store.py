@@ -0,0 +1,438 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+
+from app.db import DB_PATH, get_data_generation, read_session
+
+TRADE_ARCHIVE_DIR = os.getenv("TRADE_ARCHIVE_DIR", f"{DB_PATH}.archive")
+
+DAY = 86400
+MANIFEST = "manifest.json"
+
+SIDE_BUY = 1
+SIDE_SELL = -1
+_SIDE_NAMES = {SIDE_BUY: "BUY", SIDE_SELL: "SELL"}
+
+# Trades before this time were deleted by retention; see ledger_base.
+HISTORY_START_KEY = "trades_history_start"
+
+
+class TradeColumns(NamedTuple):
+    """Trades of one stretch of time as parallel arrays, ordered by ``ts``.
+
+    Wallets and markets are their integer keys, with 0 for a missing value.
+    """
+
+    user_codes: np.ndarray
+    market_codes: np.ndarray
+    side: np.ndarray
+    price: np.ndarray
+    size: np.ndarray
+    ts: np.ndarray
+
+
+COLUMN_DTYPES = {
+    "user_codes": np.int32,
+    "market_codes": np.int32,
+    "side": np.int8,
+    "price": np.float64,
+    "size": np.float64,
+    "ts": np.int64,
+}
+
+# Trade ids are archived alongside so late trades for a pruned day merge by id.
+SEGMENT_COLUMNS = ("id", *TradeColumns._fields)
+
+COLUMNS_SQL = f"""
+    COALESCE(user_id, 0), COALESCE(market_id, 0),
+    CASE UPPER(side)
+        WHEN 'BUY' THEN {SIDE_BUY}
+        WHEN 'SELL' THEN {SIDE_SELL}
+        ELSE 0
+    END,
+    COALESCE(price, 0), COALESCE(size, 0), ts
+"""
+_FETCH_SIZE = 50_000
+
+
+def day_of(ts: int) -> int:
+    return ts // DAY
+
+
+def empty_columns() -> TradeColumns:
+    return TradeColumns(*(np.empty(0, dtype=dtype) for dtype in COLUMN_DTYPES.values()))
+
+
+def read_columns(
+    conn: sqlite3.Connection, start: int, end: Optional[int] = None
+) -> TradeColumns:
+    """Trades with ``start <= ts < end`` from the trades table, as columns."""
+    cursor = conn.execute(
+        f"""
+        SELECT {COLUMNS_SQL}
+        FROM trades INDEXED BY idx_trades_ts
+        WHERE ts >= :start AND (:end IS NULL OR ts < :end)
+        ORDER BY ts
+        """,
+        {"start": start, "end": end},
+    )
+    chunks: List[List[np.ndarray]] = [[] for _ in COLUMN_DTYPES]
+    while True:
+        rows = cursor.fetchmany(_FETCH_SIZE)
+        if not rows:
+            break
+        for chunk, values, dtype in zip(chunks, zip(*rows), COLUMN_DTYPES.values()):
+            chunk.append(np.array(values, dtype=dtype))
+    if not chunks[0]:
+        return empty_columns()
+    return TradeColumns(*(np.concatenate(chunk) for chunk in chunks))
+
+
+def segment_dir(name: str) -> str:
+    return os.path.join(TRADE_ARCHIVE_DIR, name)
+
+
+def read_manifest() -> Dict[int, Dict[str, Any]]:
+    """Archived days and their segments, keyed by day number."""
+    try:
+        with open(os.path.join(TRADE_ARCHIVE_DIR, MANIFEST)) as handle:
+            manifest = json.load(handle)
+    except FileNotFoundError:
+        return {}
+    return {int(day): entry for day, entry in manifest["days"].items()}
+
+
+def load_segment(entry: Dict[str, Any], ids: bool = False) -> Dict[str, np.ndarray]:
+    """Memory-map a segment's columns; nothing is read until it is touched."""
+    directory = segment_dir(entry["segment"])
+    names = SEGMENT_COLUMNS if ids else TradeColumns._fields
+    return {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        for name in names
+    }
+
+
+def segment_columns(entry: Dict[str, Any]) -> TradeColumns:
+    return TradeColumns(**load_segment(entry))
+
+
+def history_start(conn: sqlite3.Connection) -> int:
+    """Time before which retention has deleted every trade; 0 if it never ran."""
+    row = conn.execute(
+        "SELECT value FROM sync_state WHERE key = ?", (HISTORY_START_KEY,)
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def _unstored_mask(
+    conn: sqlite3.Connection, segment_ids: np.ndarray, day: int
+) -> Optional[np.ndarray]:
+    """Mask of a pruned day's segment rows SQLite does not hold again.
+
+    None when SQLite holds no rows of that day, so every segment row counts.
+    """
+    stored = [
+        row[0].encode()
+        for row in conn.execute(
+            """
+            SELECT id FROM trades INDEXED BY idx_trades_ts
+            WHERE ts >= ? AND ts < ?
+            """,
+            (day * DAY, (day + 1) * DAY),
+        )
+    ]
+    return ~np.isin(segment_ids, np.array(stored)) if stored else None
+
+
+# (wallet key, market key, id, side, price, size, ts), as replays read trades.
+HistoryRow = Tuple[int, int, str, Optional[str], float, float, int]
+
+
+class ArchivedTrades:
+    """Trades of pruned days, which only their archive segments still hold.
+
+    Anything that replays history (the ledger, rollups, suspicious-wallet
+    detection) reads these alongside the trades table. Rows a pruned day later
+    received again in SQLite are left out, so SQLite's version wins.
+    """
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.parts: List[Tuple[Dict[str, np.ndarray], Optional[np.ndarray]]] = []
+        days = [
+            row[0]
+            for row in conn.execute(
+                """
+                SELECT day FROM trade_partitions
+                WHERE pruned_version IS NOT NULL AND day >= ?
+                ORDER BY day
+                """,
+                (day_of(history_start(conn)),),
+            )
+        ]
+        if not days:
+            return
+        manifest = read_manifest()
+        for day in days:
+            entry = manifest.get(day)
+            if entry is None:
+                continue
+            columns = load_segment(entry, ids=True)
+            self.parts.append((columns, _unstored_mask(conn, columns["id"], day)))
+
+    def __bool__(self) -> bool:
+        return bool(self.parts)
+
+    def select(
+        self, where: Callable[[Dict[str, np.ndarray]], np.ndarray]
+    ) -> Dict[str, np.ndarray]:
+        """Columns of the rows ``where`` picks from each segment, in time order."""
+        picked: List[Dict[str, np.ndarray]] = []
+        for columns, keep in self.parts:
+            mask = where(columns)
+            if keep is not None:
+                mask &= keep
+            if mask.any():
+                picked.append({name: columns[name][mask] for name in SEGMENT_COLUMNS})
+        if not picked:
+            return {
+                "id": np.empty(0, dtype="S1"),
+                **empty_columns()._asdict(),
+            }
+        return {
+            name: np.concatenate([part[name] for part in picked])
+            for name in SEGMENT_COLUMNS
+        }
+
+    def rows(
+        self,
+        where: Callable[[Dict[str, np.ndarray]], np.ndarray],
+        by_market: bool = True,
+    ) -> Iterator[HistoryRow]:
+        """Picked rows ordered by wallet (and market), then time, as replays read them."""
+        columns = self.select(where)
+        keys = (columns["user_codes"],)
+        if by_market:
+            keys = (columns["market_codes"], *keys)
+        # lexsort is stable, so each group stays in time order.
+        order = np.lexsort(keys)
+        return zip(
+            columns["user_codes"][order].tolist(),
+            columns["market_codes"][order].tolist(),
+            [trade_id.decode() for trade_id in columns["id"][order].tolist()],
+            [_SIDE_NAMES.get(side) for side in columns["side"][order].tolist()],
+            columns["price"][order].tolist(),
+            columns["size"][order].tolist(),
+            columns["ts"][order].tolist(),
+        )
+
+
+def archived_copies(
+    conn: sqlite3.Connection, rows: Iterable[Any]
+) -> List[Dict[str, Any]]:
+    """Archived versions of incoming trades whose day was pruned from SQLite.
+
+    Ingest diffs against these as well as the trades table, so a re-sent
+    pruned trade replaces its archived copy instead of counting twice. The
+    archive does not keep ``timestamp``, ``profit`` or ``realized``, so a copy
+    never compares equal and the incoming row is always written.
+    """
+    wanted: Dict[int, List[bytes]] = {}
+    for row in rows:
+        if row.ts is not None:
+            wanted.setdefault(day_of(row.ts), []).append(row.id.encode())
+    if not wanted:
+        return []
+    days = [
+        row[0]
+        for row in conn.execute(
+            "SELECT day FROM trade_partitions WHERE pruned_version IS NOT NULL"
+        )
+        if row[0] in wanted
+    ]
+    if not days:
+        return []
+    manifest = read_manifest()
+    copies: List[Dict[str, Any]] = []
+    for day in days:
+        entry = manifest.get(day)
+        if entry is None:
+            continue
+        columns = load_segment(entry, ids=True)
+        for index in np.flatnonzero(np.isin(columns["id"], wanted[day])).tolist():
+            copies.append(
+                {
+                    "id": columns["id"][index].decode(),
+                    "market_id": int(columns["market_codes"][index]) or None,
+                    "user_id": int(columns["user_codes"][index]) or None,
+                    "side": _SIDE_NAMES.get(int(columns["side"][index])),
+                    "price": float(columns["price"][index]),
+                    "size": float(columns["size"][index]),
+                    "timestamp": None,
+                    "profit": None,
+                    "realized": None,
+                    "ts": int(columns["ts"][index]),
+                }
+            )
+    return copies
+
+
+# Windows kept built at once; each holds only its own days.
+_MAX_STORES = 4
+
+
+class TradeStore:
+    """Column-oriented view of the trades in a window, one part per stretch of days.
+
+    Closed days come from their memory-mapped archive segments, so only the
+    pages a computation touches are read; the rest, and days whose segment is
+    stale, are read from the trades table. Each part is ordered by ``ts``, so
+    a cutoff is one binary search per part rather than a scan.
+    """
+
+    def __init__(self, parts: List[TradeColumns], user_count: int) -> None:
+        self.parts = parts
+        self.user_count = user_count
+
+    def __len__(self) -> int:
+        return sum(len(part.ts) for part in self.parts)
+
+    @classmethod
+    def for_window(cls, start_ts: int) -> "TradeStore":
+        """Trades with ``ts >= start_ts``, reading only the days the window covers."""
+        start_day = day_of(start_ts)
+        manifest = read_manifest()
+        parts: List[TradeColumns] = []
+        with read_session() as conn:
+            partitions = conn.execute(
+                """
+                SELECT day, changes, pruned_version
+                FROM trade_partitions
+                WHERE day >= ?
+                ORDER BY day
+                """,
+                (start_day,),
+            ).fetchall()
+            # Stretches of days read from the trades table: [first, last + 1).
+            runs: List[Tuple[int, Optional[int]]] = []
+            for partition in partitions:
+                day = partition["day"]
+                entry = manifest.get(day)
+                if entry is not None and entry["version"] == partition["changes"]:
+                    parts.append(segment_columns(entry))
+                    continue
+                if entry is not None and partition["pruned_version"] is not None:
+                    # Pruned day with late trades: the segment, less the ids
+                    # SQLite holds again, plus every SQLite row of the day.
+                    columns = load_segment(entry, ids=True)
+                    keep = _unstored_mask(conn, columns["id"], day)
+                    parts.append(
+                        TradeColumns(
+                            *(
+                                columns[name] if keep is None else columns[name][keep]
+                                for name in TradeColumns._fields
+                            )
+                        )
+                    )
+                if runs and runs[-1][1] == day:
+                    runs[-1] = (runs[-1][0], day + 1)
+                else:
+                    runs.append((day, day + 1))
+            # Trades newer than the last registered day belong to an open tail.
+            tail = partitions[-1]["day"] + 1 if partitions else start_day
+            if runs and runs[-1][1] == tail:
+                runs[-1] = (runs[-1][0], None)
+            else:
+                runs.append((tail, None))
+            for first, end in runs:
+                parts.append(
+                    read_columns(
+                        conn,
+                        max(first * DAY, start_ts),
+                        None if end is None else end * DAY,
+                    )
+                )
+            user_count = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM wallet_keys"
+            ).fetchone()[0]
+        return cls([part for part in parts if len(part.ts)], user_count)
+
+    def _since(self, since_ts: int) -> List[TradeColumns]:
+        sliced = []
+        for part in self.parts:
+            start = int(np.searchsorted(part.ts, since_ts))
+            if start < len(part.ts):
+                sliced.append(TradeColumns(*(column[start:] for column in part)))
+        return sliced
+
+    def _bincount(self, since_ts: int, weighted: bool) -> np.ndarray:
+        total = np.zeros(self.user_count, dtype=np.float64 if weighted else np.int64)
+        for part in self._since(since_ts):
+            weights = np.abs(part.price * part.size) if weighted else None
+            counts = np.bincount(
+                part.user_codes, weights=weights, minlength=self.user_count
+            )
+            if len(counts) > len(total):
+                # A wallet registered after the store was built.
+                total = np.pad(total, (0, len(counts) - len(total)))
+            total[: len(counts)] += counts
+        return total
+
+    def sum_by_user(self, since_ts: int) -> np.ndarray:
+        """Traded notional per wallet key since ``since_ts``."""
+        return self._bincount(since_ts, weighted=True)
+
+    def count_by_user(self, since_ts: int) -> np.ndarray:
+        """Trade count per wallet key since ``since_ts``."""
+        return self._bincount(since_ts, weighted=False)
+
+
+_stores: Dict[int, Tuple[int, TradeStore]] = {}
+_store_lock = threading.Lock()
+
+
+def get_trade_store(since_ts: int) -> TradeStore:
+    """Return a store covering ``since_ts`` onwards, rebuilt when the data changes.
+
+    Stores are kept per starting day, so a trailing window reuses its store
+    until the day rolls over. Checking the generation rather than relying on an
+    explicit refresh keeps stores in analytics worker processes current too.
+    """
+    start_day = day_of(since_ts)
+    generation = get_data_generation()
+    cached = _stores.get(start_day)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    with _store_lock:
+        cached = _stores.get(start_day)
+        if cached is None or cached[0] != generation:
+            try:
+                store = TradeStore.for_window(start_day * DAY)
+            except FileNotFoundError:
+                # A segment replaced between reading the manifest and mapping it.
+                store = TradeStore.for_window(start_day * DAY)
+            _stores.pop(start_day, None)
+            _stores[start_day] = (generation, store)
+            while len(_stores) > _MAX_STORES:
+                _stores.pop(next(iter(_stores)))
+            cached = _stores[start_day]
+        return cached[1]
+
+
+def refresh_trade_store() -> None:
+    """Rebuild the stores after a sync; windows nobody has asked for stay unbuilt."""
+    for start_day in list(_stores):
+        get_trade_store(start_day * DAY)
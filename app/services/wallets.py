@@ -0,0 +1,243 @@
+import heapq
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.db import read_session
+from app.metrics import SERVICE_ROWS, timed_service
+from app.services.keys import resolve_markets, wallet_key
+from app.services.suspicious import wallet_flags
+from app.services.trade_store import ArchivedTrades, history_start
+
+DAY = 86400
+
+# (ts, id) of the last trade returned; pages run newest first.
+TradePosition = Tuple[int, str]
+
+
+def _archived_page(
+    conn: sqlite3.Connection,
+    user_id: int,
+    limit: int,
+    after: Optional[TradePosition],
+    since: Optional[int],
+    until: Optional[int],
+) -> List[Dict[str, Any]]:
+    """The wallet's newest ``limit`` trades that only pruned days' segments hold."""
+    archived = ArchivedTrades(conn)
+    if not archived:
+        return []
+
+    def where(columns: Dict[str, np.ndarray]) -> np.ndarray:
+        mask = columns["user_codes"] == user_id
+        if since is not None:
+            mask &= columns["ts"] >= since
+        if until is not None:
+            mask &= columns["ts"] < until
+        return mask
+
+    rows = (
+        {
+            "id": trade_id,
+            "market_id": market_id,
+            "side": side,
+            "price": price,
+            "size": size,
+            "ts": ts,
+        }
+        for _, market_id, trade_id, side, price, size, ts in archived.rows(
+            where, by_market=False
+        )
+        if after is None or (ts, trade_id) < after
+    )
+    return heapq.nlargest(limit, rows, key=_trade_order)
+
+
+def _trade_order(row: Dict[str, Any]) -> TradePosition:
+    return row["ts"], row["id"]
+
+
+def _trade_page(
+    conn: sqlite3.Connection,
+    user_id: int,
+    limit: int,
+    after: Optional[TradePosition],
+    since: Optional[int],
+    until: Optional[int],
+) -> List[Dict[str, Any]]:
+    after_ts, after_id = after if after else (None, None)
+    rows = [
+        dict(row)
+        for row in conn.execute(
+            """
+            SELECT id, market_id, side, price, size, ts
+            FROM trades INDEXED BY idx_trades_user_ts
+            WHERE user_id = :user_id
+              AND ts >= COALESCE(:since, 0)
+              AND (:until IS NULL OR ts < :until)
+              AND (
+                :after_ts IS NULL
+                OR ts < :after_ts
+                OR (ts = :after_ts AND id < :after_id)
+              )
+            ORDER BY ts DESC, id DESC
+            LIMIT :limit
+            """,
+            {
+                "user_id": user_id,
+                "since": since,
+                "until": until,
+                "after_ts": after_ts,
+                "after_id": after_id,
+                "limit": limit,
+            },
+        )
+    ]
+    # Pruned days live on in their segments; they only matter once the page
+    # reaches back past the newest of them.
+    pruned_until = conn.execute(
+        "SELECT (MAX(day) + 1) * ? FROM trade_partitions "
+        "WHERE pruned_version IS NOT NULL",
+        (DAY,),
+    ).fetchone()[0]
+    if pruned_until is None or (len(rows) == limit and rows[-1]["ts"] >= pruned_until):
+        return rows
+    archived = _archived_page(conn, user_id, limit, after, since, until)
+    return heapq.nlargest(limit, rows + archived, key=_trade_order)
+
+
+def _positions(conn: sqlite3.Connection, user_id: int) -> List[sqlite3.Row]:
+    return conn.execute(
+        """
+        SELECT p.market_id, p.position, p.cost, p.last_ts,
+               COALESCE(r.realized, 0) AS realized
+        FROM positions p
+        LEFT JOIN (
+            SELECT market_id, SUM(profit) AS realized
+            FROM profit_events INDEXED BY idx_profit_events_user_ts
+            WHERE user_id = :user_id
+            GROUP BY market_id
+        ) r ON r.market_id = p.market_id
+        WHERE p.user_id = :user_id
+        ORDER BY p.last_ts DESC
+        """,
+        {"user_id": user_id},
+    ).fetchall()
+
+
+def _pnl_series(
+    conn: sqlite3.Connection,
+    user_id: int,
+    since: Optional[int],
+    until: Optional[int],
+) -> List[Dict[str, Any]]:
+    """Realized profit per UTC day, with the running total since the first trade."""
+    cumulative = 0.0
+    if since is not None:
+        cumulative = conn.execute(
+            """
+            SELECT COALESCE(SUM(profit), 0)
+            FROM profit_events INDEXED BY idx_profit_events_user_ts
+            WHERE user_id = ? AND ts < ?
+            """,
+            (user_id, since),
+        ).fetchone()[0]
+    rows = conn.execute(
+        """
+        SELECT ts / :day AS day, SUM(profit) AS profit
+        FROM profit_events INDEXED BY idx_profit_events_user_ts
+        WHERE user_id = :user_id
+          AND ts >= COALESCE(:since, 0)
+          AND (:until IS NULL OR ts < :until)
+        GROUP BY day
+        ORDER BY day
+        """,
+        {"day": DAY, "user_id": user_id, "since": since, "until": until},
+    )
+    series = []
+    for row in rows:
+        cumulative += row["profit"]
+        series.append(
+            {
+                "date": datetime.utcfromtimestamp(row["day"] * DAY).date().isoformat(),
+                "profit": round(row["profit"], 4),
+                "cumulative": round(cumulative, 4),
+            }
+        )
+    return series
+
+
+@timed_service
+def wallet_detail(
+    address: str,
+    limit: int,
+    after: Optional[TradePosition] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """One wallet's trades, newest first, for ``since <= ts < until``.
+
+    The first page also carries the wallet's per-market positions, its daily
+    realized PnL over the range and its stored suspicious-wallet findings.
+    Every query is a range of one wallet's entries in a covering index, so the
+    cost follows the wallet's activity, not the size of the tables. Pages that
+    reach pruned days also scan those days' archive segments. Trades before
+    ``history_starts_at`` were deleted by retention and are not listed,
+    though positions and PnL still include them. Returns ``None`` for an
+    unknown wallet.
+    """
+    with read_session() as conn:
+        user_id = wallet_key(conn, address)
+        if user_id is None:
+            return None
+        trades = _trade_page(conn, user_id, limit + 1, after, since, until)
+        positions = _positions(conn, user_id) if after is None else []
+        markets = resolve_markets(
+            conn, [row["market_id"] for row in (*trades[:limit], *positions)]
+        )
+        start = history_start(conn)
+        result: Dict[str, Any] = {
+            "user_id": address,
+            "history_starts_at": (
+                datetime.utcfromtimestamp(start).isoformat() if start else None
+            ),
+            "trades": [
+                {
+                    "id": row["id"],
+                    "market_id": markets.get(row["market_id"]),
+                    "side": row["side"],
+                    "price": row["price"],
+                    "size": row["size"],
+                    "timestamp": datetime.utcfromtimestamp(row["ts"]).isoformat(),
+                }
+                for row in trades[:limit]
+            ],
+        }
+        if after is None:
+            result["positions"] = [
+                {
+                    "market_id": markets.get(row["market_id"]),
+                    "position": round(row["position"], 6),
+                    "cost": round(row["cost"], 4),
+                    "avg_price": (
+                        round(row["cost"] / row["position"], 6)
+                        if row["position"] > 1e-9
+                        else None
+                    ),
+                    "realized_profit": round(row["realized"], 4),
+                    "last_trade_at": datetime.utcfromtimestamp(
+                        row["last_ts"]
+                    ).isoformat(),
+                }
+                for row in positions
+            ]
+            result["pnl"] = _pnl_series(conn, user_id, since, until)
+            result["flags"] = wallet_flags(conn, user_id)
+    SERVICE_ROWS.inc(len(trades) + len(positions), service="wallet_detail")
+    next_position = None
+    if len(trades) > limit:
+        last = trades[limit - 1]
+        next_position = _trade_order(last)
+    return {"data": result, "next_cursor": next_position}
@@ -0,0 +1,299 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from app.db import db_session, read_session
+from app.services.keys import resolve_wallets
+from app.services.ledger import TradeRow
+
+logger = logging.getLogger(__name__)
+
+WHALE_FEED_THRESHOLD = float(os.getenv("WHALE_FEED_THRESHOLD", "10000"))
+WHALE_FEED_WINDOW_HOURS = int(os.getenv("WHALE_FEED_WINDOW_HOURS", "24"))
+WHALE_FEED_QUEUE_SIZE = int(os.getenv("WHALE_FEED_QUEUE_SIZE", "1000"))
+WHALE_FEED_POLL_SECONDS = float(os.getenv("WHALE_FEED_POLL_SECONDS", "1"))
+WHALE_ALERTS_KEEP = int(os.getenv("WHALE_ALERTS_KEEP", "10000"))
+
+# Trades are summed into per-minute buckets; a whole bucket expires at once.
+BUCKET_SECONDS = 60
+
+Subscriber = Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[Dict[str, Any]]"]
+
+
+class WhaleFeed:
+    """Sliding-window notional per wallet, updated as trades are ingested.
+
+    Each trade is an O(1) update of its wallet total and minute bucket. Buckets
+    fall out of the window in time order, so expiry touches every trade once.
+    A wallet alerts when its total crosses the threshold. It alerts again only
+    after falling back below it. A corrected trade takes its old notional out
+    of the window before the new one is counted.
+
+    Only the worker that ingests trades (the scheduler leader) tracks the
+    window; it writes alerts to ``whale_alerts``. Every worker polls that table
+    and streams new alerts to its own subscribers.
+    """
+
+    def __init__(
+        self,
+        threshold: float = WHALE_FEED_THRESHOLD,
+        window_hours: int = WHALE_FEED_WINDOW_HOURS,
+    ) -> None:
+        self.threshold = threshold
+        self.window = window_hours * 3600
+        self.tracking = False
+        # Wallets are tracked by integer key; see app.services.keys.
+        self._totals: DefaultDict[int, float] = defaultdict(float)
+        self._buckets: Dict[int, DefaultDict[int, float]] = {}
+        self._bucket_heap: List[int] = []
+        self._above: Set[int] = set()
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._last_seq = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "trades": 0,
+            "replaced": 0,
+            "alerts": 0,
+            "delivered": 0,
+            "dropped": 0,
+        }
+
+    def _add(self, user_id: int, ts: int, notional: float) -> Optional[float]:
+        start = ts - ts % BUCKET_SECONDS
+        bucket = self._buckets.get(start)
+        if bucket is None:
+            bucket = self._buckets[start] = defaultdict(float)
+            heapq.heappush(self._bucket_heap, start)
+        bucket[user_id] += notional
+        total = self._totals[user_id] + notional
+        self._totals[user_id] = total
+        if total >= self.threshold and user_id not in self._above:
+            self._above.add(user_id)
+            return total
+        return None
+
+    def _remove(self, user_id: int, ts: int, notional: float) -> None:
+        """Take a trade back out of the window; a no-op once its bucket expired."""
+        bucket = self._buckets.get(ts - ts % BUCKET_SECONDS)
+        if bucket is None or user_id not in bucket:
+            return
+        bucket[user_id] -= notional
+        if bucket[user_id] <= 1e-9:
+            del bucket[user_id]
+        total = self._totals[user_id] - notional
+        if total <= 1e-9:
+            del self._totals[user_id]
+        else:
+            self._totals[user_id] = total
+
+    def _expire(self, now: int) -> None:
+        cutoff = now - self.window
+        while self._bucket_heap and self._bucket_heap[0] + BUCKET_SECONDS <= cutoff:
+            for user_id, notional in self._buckets.pop(
+                heapq.heappop(self._bucket_heap)
+            ).items():
+                total = self._totals[user_id] - notional
+                if total <= 1e-9:
+                    del self._totals[user_id]
+                    self._above.discard(user_id)
+                    continue
+                self._totals[user_id] = total
+                if total < self.threshold:
+                    self._above.discard(user_id)
+
+    def seed(self, now: Optional[int] = None) -> None:
+        """Start tracking, seeding the window from stored trades without alerts."""
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            self._totals.clear()
+            self._buckets.clear()
+            self._bucket_heap.clear()
+            self._above.clear()
+        with read_session() as conn:
+            rows = conn.execute(
+                """
+                SELECT user_id, ts, ABS(COALESCE(price, 0) * COALESCE(size, 0))
+                FROM trades INDEXED BY idx_trades_ts
+                WHERE ts >= ? AND user_id IS NOT NULL
+                """,
+                (now - self.window,),
+            )
+            with self._lock:
+                for user_id, ts, notional in rows:
+                    self._add(user_id, ts, notional)
+                self.tracking = True
+
+    def observe(
+        self,
+        rows: Iterable[TradeRow],
+        replaced: Iterable[Mapping[str, Any]] = (),
+        now: Optional[int] = None,
+    ) -> None:
+        """Feed ingested trades and publish any threshold crossings.
+
+        ``replaced`` holds the stored versions of trades ``rows`` overwrite.
+        They are subtracted first, so a correction is tested on its net effect.
+        """
+        if not self.tracking:
+            return
+        now = int(time.time()) if now is None else now
+        cutoff = now - self.window
+        alerts = []
+        with self._lock:
+            self._expire(now)
+            corrected = set()
+            for old in replaced:
+                if old["user_id"] is None or old["ts"] is None or old["ts"] < cutoff:
+                    continue
+                self._stats["replaced"] += 1
+                self._remove(
+                    old["user_id"],
+                    old["ts"],
+                    abs((old["price"] or 0) * (old["size"] or 0)),
+                )
+                corrected.add(old["user_id"])
+            for row in rows:
+                if row.user_id is None or row.ts is None or row.ts < cutoff:
+                    continue
+                self._stats["trades"] += 1
+                total = self._add(
+                    row.user_id, row.ts, abs((row.price or 0) * (row.size or 0))
+                )
+                if total is not None:
+                    alerts.append(
+                        {
+                            "user_id": row.user_id,
+                            "net_invested": round(total, 4),
+                            "window_hours": self.window // 3600,
+                            "trade_id": row.id,
+                            "trade_ts": row.ts,
+                            "detected_at": now,
+                        }
+                    )
+            for user_id in corrected & self._above:
+                if self._totals.get(user_id, 0.0) < self.threshold:
+                    self._above.discard(user_id)
+            self._stats["alerts"] += len(alerts)
+        if not alerts:
+            return
+        with db_session() as conn:
+            addresses = resolve_wallets(conn, (alert["user_id"] for alert in alerts))
+            for alert in alerts:
+                alert["user_id"] = addresses.get(alert["user_id"])
+            conn.executemany(
+                "INSERT INTO whale_alerts (payload) VALUES (?)",
+                ((json.dumps(alert),) for alert in alerts),
+            )
+
+    def start(self) -> None:
+        """Stream alerts published from now on to this worker's subscribers."""
+        if self._thread is not None:
+            return
+        with read_session() as conn:
+            self._last_seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM whale_alerts"
+            ).fetchone()[0]
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll_loop, name="whale-feed", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(WHALE_FEED_POLL_SECONDS):
+            try:
+                self.poll()
+            except Exception as exc:
+                logger.error("Failed to poll whale alerts: %s", exc)
+
+    def poll(self) -> int:
+        """Deliver alerts published since the last poll; returns how many."""
+        with read_session() as conn:
+            rows = conn.execute(
+                "SELECT seq, payload FROM whale_alerts WHERE seq > ? ORDER BY seq",
+                (self._last_seq,),
+            ).fetchall()
+        if not rows:
+            return 0
+        self._last_seq = rows[-1][0]
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats["delivered"] += len(rows)
+        for _, payload in rows:
+            alert = json.loads(payload)
+            for loop, queue in subscribers:
+                loop.call_soon_threadsafe(self._offer, queue, alert)
+        return len(rows)
+
+    def _offer(
+        self, queue: "asyncio.Queue[Dict[str, Any]]", alert: Dict[str, Any]
+    ) -> None:
+        # A slow client loses its oldest alerts rather than stalling ingest.
+        if queue.full():
+            queue.get_nowait()
+            self._stats["dropped"] += 1
+        queue.put_nowait(alert)
+
+    def subscribe(self) -> Subscriber:
+        subscriber: Subscriber = (
+            asyncio.get_running_loop(),
+            asyncio.Queue(maxsize=WHALE_FEED_QUEUE_SIZE),
+        )
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "tracking": self.tracking,
+                "last_seq": self._last_seq,
+                "wallets": len(self._totals),
+                "above_threshold": len(self._above),
+                "buckets": len(self._buckets),
+                "subscribers": len(self._subscribers),
+            }
+
+
+def trim_whale_alerts(keep: int = WHALE_ALERTS_KEEP) -> int:
+    """Drop all but the newest ``keep`` published alerts."""
+    with db_session() as conn:
+        return conn.execute(
+            """
+            DELETE FROM whale_alerts
+            WHERE seq <= (SELECT COALESCE(MAX(seq), 0) FROM whale_alerts) - ?
+            """,
+            (keep,),
+        ).rowcount
+
+
+whale_feed = WhaleFeed()
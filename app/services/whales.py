@@ -1,43 +1,102 @@
-from datetime import datetime, timedelta
-from typing import Dict, List
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from app.db import db_session
+from app.db import read_session, stream_session
+from app.metrics import SERVICE_ROWS, timed_service
+from app.services.rollups import window_bounds
 
+# (total, wallet key) of the last whale returned, in ``total DESC, key`` order.
+WhalePosition = Tuple[float, int]
 
-def _parse_time(value: str) -> datetime:
-    if isinstance(value, (int, float)):
-        return datetime.utcfromtimestamp(value)
-    if isinstance(value, str) and value.isdigit():
-        return datetime.utcfromtimestamp(int(value))
-    return datetime.fromisoformat(value.replace("Z", "+00:00"))
 
+def _whale_rows(
+    conn: sqlite3.Connection,
+    min_net_invested: float,
+    since_hours: int,
+    after: Optional[WhalePosition] = None,
+    limit: Optional[int] = None,
+) -> sqlite3.Cursor:
+    cutoff, boundary = window_bounds(int(time.time()), since_hours)
+    after_total, after_user = after if after else (None, None)
+    return conn.execute(
+        """
+        SELECT g.user_id AS user_key, w.address, g.total
+        FROM (
+            SELECT user_id, SUM(notional) AS total
+            FROM (
+                SELECT user_id, notional
+                FROM user_hourly INDEXED BY idx_user_hourly_hour
+                WHERE hour >= :boundary
+                UNION ALL
+                SELECT user_id, ABS(COALESCE(price, 0) * COALESCE(size, 0))
+                FROM trades INDEXED BY idx_trades_ts
+                WHERE ts >= :cutoff AND ts < :boundary AND user_id IS NOT NULL
+            )
+            GROUP BY user_id
+            HAVING total >= :minimum
+               AND (:after_total IS NULL
+                    OR total < :after_total
+                    OR (total = :after_total AND user_id > :after_user))
+            ORDER BY total DESC, user_id
+            LIMIT :limit
+        ) g
+        JOIN wallet_keys w ON w.id = g.user_id
+        ORDER BY g.total DESC, g.user_id
+        """,
+        {
+            "cutoff": cutoff,
+            "boundary": boundary,
+            "minimum": min_net_invested,
+            "after_total": after_total,
+            "after_user": after_user,
+            "limit": -1 if limit is None else limit,
+        },
+    )
 
+
+def _whale_entry(row: sqlite3.Row) -> Dict[str, Any]:
+    return {"user_id": row["address"], "net_invested": round(row["total"], 4)}
+
+
+@timed_service
 def compute_whales(
     min_net_invested: float = 10000.0, since_hours: int = 24
-) -> List[Dict[str, float]]:
-    cutoff = datetime.utcnow() - timedelta(hours=since_hours)
-    totals: Dict[str, float] = {}
-
-    with db_session() as conn:
-        rows = conn.execute(
-            """
-            SELECT user_id, price, size, timestamp
-            FROM trades
-            WHERE timestamp IS NOT NULL
-            """
+) -> List[Dict[str, Any]]:
+    with read_session() as conn:
+        rows = _whale_rows(conn, min_net_invested, since_hours).fetchall()
+    SERVICE_ROWS.inc(len(rows), service="compute_whales")
+    return [_whale_entry(row) for row in rows]
+
+
+@timed_service
+def whales_page(
+    limit: int,
+    after: Optional[WhalePosition] = None,
+    min_net_invested: float = 10000.0,
+    since_hours: int = 24,
+) -> Dict[str, Any]:
+    """One page of whales plus the position to resume from."""
+    with read_session() as conn:
+        rows = _whale_rows(
+            conn, min_net_invested, since_hours, after, limit + 1
         ).fetchall()
+    SERVICE_ROWS.inc(len(rows), service="whales_page")
+    next_position = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_position = (last["total"], last["user_key"])
+    return {
+        "data": [_whale_entry(row) for row in rows[:limit]],
+        "next_cursor": next_position,
+    }
+
 
-    for row in rows:
-        trade_time = _parse_time(row["timestamp"])
-        if trade_time < cutoff:
-            continue
-        stake = abs((row["price"] or 0) * (row["size"] or 0))
-        totals[row["user_id"]] = totals.get(row["user_id"], 0.0) + stake
-
-    whales = [
-        {"user_id": user_id, "net_invested": round(total, 4)}
-        for user_id, total in totals.items()
-        if total >= min_net_invested
-    ]
-    whales.sort(key=lambda item: item["net_invested"], reverse=True)
-    return whales
+def iter_whales(
+    after: Optional[WhalePosition] = None,
+    min_net_invested: float = 10000.0,
+    since_hours: int = 24,
+) -> Iterator[Dict[str, Any]]:
+    with stream_session() as conn:
+        for row in _whale_rows(conn, min_net_invested, since_hours, after):
+            yield _whale_entry(row)
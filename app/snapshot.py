@@ -0,0 +1,200 @@
+import fcntl
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.cache import MISSING, CacheKey, result_cache
+from app.db import DB_PATH, get_data_generation
+
+logger = logging.getLogger(__name__)
+
+RESULT_SNAPSHOT_PATH = os.getenv("RESULT_SNAPSHOT_PATH", f"{DB_PATH}.results")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+# Magic, data generation, index offset, index length.
+_HEADER = struct.Struct("<8sqQQ")
+_MAGIC = b"PMRSNAP1"
+
+Index = Dict[CacheKey, Tuple[int, int]]
+
+
+class _Mapped:
+    def __init__(self, identity: Tuple[int, int], buffer: mmap.mmap) -> None:
+        self.identity = identity
+        self.buffer = buffer
+        magic, self.generation, offset, length = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("not a result snapshot")
+        self._index_span = (offset, length)
+        self._index: Optional[Index] = None
+
+    @property
+    def index(self) -> Index:
+        # Unpickled on first lookup, so opening a snapshot costs one mmap.
+        if self._index is None:
+            offset, length = self._index_span
+            self._index = pickle.loads(self.buffer[offset : offset + length])
+        return self._index
+
+    def blob(self, key: CacheKey) -> Optional[bytes]:
+        span = self.index.get(key)
+        if span is None:
+            return None
+        return self.buffer[span[0] : span[0] + span[1]]
+
+
+class ResultSnapshot:
+    """Endpoint results of one data generation, persisted across restarts.
+
+    The file is a header, the pickled results back to back and an index of
+    their offsets; it is memory-mapped and a result is only unpickled when
+    asked for. Every worker merges its own results into the file, which is
+    replaced atomically, so a fresh worker serves what any worker computed for
+    the current generation. Results of an older generation are never served.
+    """
+
+    def __init__(self, path: str = RESULT_SNAPSHOT_PATH) -> None:
+        self.path = path
+        self.hits = 0
+        self.saves = 0
+        self._mapped: Optional[_Mapped] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> Optional[_Mapped]:
+        """The mapping of the file as it is now, reopened after a replace."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._mapped = None
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if self._mapped is None or self._mapped.identity != identity:
+                try:
+                    with open(self.path, "rb") as handle:
+                        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._mapped = _Mapped(identity, buffer)
+                except (OSError, ValueError, struct.error) as exc:
+                    logger.warning("Ignoring result snapshot %s: %s", self.path, exc)
+                    self._mapped = None
+            return self._mapped
+
+    def get(self, key: CacheKey, generation: int) -> Any:
+        """Return the stored result for ``key`` at ``generation``, or ``MISSING``."""
+        mapped = self._open()
+        if mapped is None or mapped.generation != generation:
+            return MISSING
+        blob = mapped.blob(key)
+        if blob is None:
+            return MISSING
+        self.hits += 1
+        return pickle.loads(blob)
+
+    def save(self) -> int:
+        """Merge this process's current results into the file; returns entries written."""
+        generation = get_data_generation()
+        fresh = {
+            key: value
+            for key, entry_generation, value in result_cache.entries()
+            if entry_generation == generation
+        }
+        if not fresh:
+            return 0
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            mapped = self._open()
+            kept: Dict[CacheKey, bytes] = {}
+            if mapped is not None and mapped.generation == generation:
+                if fresh.keys() <= mapped.index.keys():
+                    return 0
+                kept = {
+                    key: mapped.blob(key) for key in mapped.index if key not in fresh
+                }
+            elif mapped is not None and mapped.generation > generation:
+                return 0
+
+            index: Index = {}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as handle:
+                handle.write(b"\0" * _HEADER.size)
+                blobs = [
+                    *kept.items(),
+                    *(
+                        (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                        for key, value in fresh.items()
+                    ),
+                ]
+                for key, blob in blobs:
+                    index[key] = (handle.tell(), len(blob))
+                    handle.write(blob)
+                index_offset = handle.tell()
+                encoded = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+                handle.write(encoded)
+                handle.seek(0)
+                handle.write(
+                    _HEADER.pack(_MAGIC, generation, index_offset, len(encoded))
+                )
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self.path)
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self.saves += 1
+        return len(index)
+
+    def stats(self) -> Dict[str, Any]:
+        mapped = self._open()
+        return {
+            "path": self.path,
+            "generation": mapped.generation if mapped is not None else None,
+            "entries": len(mapped.index) if mapped is not None else 0,
+            "bytes": len(mapped.buffer) if mapped is not None else 0,
+            "hits": self.hits,
+            "saves": self.saves,
+        }
+
+
+result_snapshot = ResultSnapshot()
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _save_quietly() -> None:
+    try:
+        result_snapshot.save()
+    except Exception as exc:
+        logger.error("Failed to save result snapshot: %s", exc)
+
+
+def _save_loop() -> None:
+    while not _stop.wait(SNAPSHOT_INTERVAL_SECONDS):
+        _save_quietly()
+
+
+def start_snapshots() -> None:
+    """Save this worker's results every ``SNAPSHOT_INTERVAL_SECONDS``."""
+    global _thread
+    if _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_save_loop, name="result-snapshot", daemon=True)
+    _thread.start()
+
+
+def stop_snapshots() -> None:
+    """Stop the saver and save once more, so a restart finds the latest results."""
+    global _thread
+    if _thread is not None:
+        _stop.set()
+        _thread.join()
+        _thread = None
+    _save_quietly()
@@ -0,0 +1,39 @@
+import calendar
+import math
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+def parse_time(value: Any) -> datetime:
+    """Parse an epoch number, digit string or ISO-8601 string into naive UTC."""
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    if isinstance(value, str) and value.isdigit():
+        return datetime.utcfromtimestamp(int(value))
+    if not isinstance(value, str):
+        raise ValueError(f"Unsupported time value: {value!r}")
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def to_epoch(value: Any) -> Optional[int]:
+    if value is None:
+        return None
+    # Epoch forms are by far the most common on ingest; skip building a datetime.
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return math.floor(value)
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return calendar.timegm(parse_time(value).utctimetuple())
+
+
+def epoch_or_none(value: Any) -> Optional[int]:
+    """``to_epoch`` for API payloads: None rather than an error if unreadable."""
+    try:
+        return to_epoch(value)
+    except (ValueError, OverflowError):
+        return None
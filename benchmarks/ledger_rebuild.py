@@ -0,0 +1,69 @@
+"""Benchmark the full position-ledger rebuild across worker counts.
+
+Fills one throwaway database through the bulk ingest path, then rebuilds the
+ledger once per ``--workers`` value and reports wall time and speedup over the
+first value. Each rebuild's positions and profit events are checked against
+the first one::
+
+    python -m benchmarks.ledger_rebuild --trades 2m --workers 1,2,4,8,16
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Tuple
+
+from benchmarks.run import parse_size, populate
+
+
+def _checksum() -> Tuple[int, int, float, float]:
+    from app.db import read_session
+
+    with read_session() as conn:
+        positions, position_total = conn.execute(
+            "SELECT COUNT(*), ROUND(TOTAL(position + cost), 4) FROM positions"
+        ).fetchone()
+        events, profit_total = conn.execute(
+            "SELECT COUNT(*), ROUND(TOTAL(profit), 4) FROM profit_events"
+        ).fetchone()
+    return positions, events, position_total, profit_total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", default="1m")
+    parser.add_argument("--wallets", type=int, default=50_000)
+    parser.add_argument("--markets", type=int, default=2_000)
+    parser.add_argument(
+        "--workers",
+        default="1,2,4,8",
+        help="comma-separated worker counts; the first is the baseline",
+    )
+    args = parser.parse_args()
+    worker_counts = [int(value) for value in args.workers.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="polymarket-bench-") as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        loaded = populate(
+            db_path, parse_size(args.trades), args.wallets, args.markets, bulk=True
+        )
+        from app.services.ledger import rebuild_ledger
+
+        print(f"{loaded['rows']} trades, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+        baseline = expected = None
+        for workers in worker_counts:
+            started = time.perf_counter()
+            rebuild_ledger(workers)
+            elapsed = time.perf_counter() - started
+            checksum = _checksum()
+            if expected is None:
+                baseline, expected = elapsed, checksum
+            elif checksum != expected:
+                raise SystemExit(f"ledger mismatch with {workers} workers")
+            print(f"{workers:>8} {elapsed:>9.3f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
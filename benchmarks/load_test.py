@@ -0,0 +1,406 @@
+"""End-to-end load test of the API against the stub Polymarket API.
+
+Starts the stub with a live trade stream, runs the app under uvicorn on a
+throwaway database pointed at the stub, seeds it with a backfill and then
+drives concurrent requests at the ``/monitor``, ``/rankings``, ``/markets``
+and ``/wallets`` read endpoints while the scheduler keeps syncing. Reports
+p50/p95/p99 latency and throughput per route, and ingest lag: the time from a
+trade appearing upstream to it being stored::
+
+    python -m benchmarks.load_test --trades 50k --rate 50 --concurrency 32 --duration 60
+
+Everything listens on 127.0.0.1, so the run needs no network access.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.run import _git_revision, parse_size
+from benchmarks.stub_api import StubState, make_trades, start_server, stream_trades
+from benchmarks.synthetic import make_markets, make_wallets
+
+# Every fifth streamed trade is tracked for ingest lag.
+LAG_SAMPLE_EVERY = 5
+LAG_POLL_SECONDS = 0.2
+# Set by the first incremental trade sync (app.scheduler); the app is not
+# imported here so this process never touches its database settings.
+_HIGH_WATER_MARK_KEY = "trades_high_water_mark"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _routes(wallets: List[str]) -> List[Tuple[str, Any]]:
+    """(route label, path or path factory) for every endpoint under load."""
+    return [
+        ("/monitor/smart-money", "/monitor/smart-money"),
+        ("/monitor/whales", "/monitor/whales"),
+        ("/monitor/whales?limit", "/monitor/whales?limit=100"),
+        ("/monitor/suspicious-wallets", "/monitor/suspicious-wallets"),
+        ("/monitor/suspicious-wallets?limit", "/monitor/suspicious-wallets?limit=100"),
+        *(
+            (
+                f"/rankings/top-profit?window={window}",
+                f"/rankings/top-profit?window={window}",
+            )
+            for window in ("1d", "7d", "30d", "all")
+        ),
+        (
+            "/rankings/wallets/{address}",
+            lambda rng: f"/rankings/wallets/{rng.choice(wallets)}",
+        ),
+        ("/markets/hot", "/markets/hot"),
+        ("/wallets/{address}", lambda rng: f"/wallets/{rng.choice(wallets)}?limit=50"),
+    ]
+
+
+def _start_app(
+    port: int, db_path: str, stub_url: str, args: argparse.Namespace, log: Any
+) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": db_path,
+        "POLYMARKET_GAMMA_URL": stub_url,
+        "POLYMARKET_DATA_URL": stub_url,
+        "SYNC_TRADES_INTERVAL_SECONDS": str(args.sync_interval),
+        "SYNC_TRADES_MIN_INTERVAL_SECONDS": str(args.sync_interval),
+        "SYNC_TRADES_MAX_INTERVAL_SECONDS": str(args.sync_interval),
+        "SCHEDULER_POLL_SECONDS": "1",
+        "PROFILE_DIR": os.path.join(os.path.dirname(db_path), "profiles"),
+    }
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, app: subprocess.Popen) -> None:
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if app.poll() is not None:
+            raise SystemExit("app exited during startup; see its log")
+        try:
+            if (await client.get("/demo")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit("app did not start within 120s")
+
+
+async def _wait_backfilled(client: httpx.AsyncClient, requested_at: float) -> None:
+    """Wait for the leader to finish the backfill queued at ``requested_at``."""
+    while True:
+        response = await client.get("/admin/scheduler")
+        response.raise_for_status()
+        state = response.json()["data"]["jobs"].get("backfill_trades")
+        if state is not None and state["last_started_at"] >= int(requested_at):
+            if state["last_result"] is None:
+                raise SystemExit("backfill failed; see the app log")
+            return
+        await asyncio.sleep(0.5)
+
+
+async def _wait_synced(db_path: str) -> None:
+    """Wait for the first incremental trade sync to record its high-water mark."""
+    while True:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute(
+                "SELECT 1 FROM sync_state WHERE key = ?", (_HIGH_WATER_MARK_KEY,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row:
+            return
+        await asyncio.sleep(0.5)
+
+
+async def _track_lag(
+    state: StubState,
+    db_path: str,
+    drain: asyncio.Event,
+    grace: float,
+    lags: List[float],
+) -> int:
+    """Record stored-minus-published seconds for sampled streamed trades.
+
+    Once ``drain`` is set no new trades are sampled, and the sampled ones get
+    ``grace`` more seconds to land. Returns how many were still not stored.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    seen = len(state.published)
+    pending: Dict[str, float] = {}
+    give_up: Optional[float] = None
+    try:
+        while give_up is None or (pending and time.monotonic() < give_up):
+            if drain.is_set():
+                give_up = give_up or time.monotonic() + grace
+            else:
+                with state.lock:
+                    fresh = state.published[seen:]
+                seen += len(fresh)
+                pending.update(fresh[::LAG_SAMPLE_EVERY])
+            if pending:
+                ids = list(pending)
+                stored = set()
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start : start + 500]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    rows = conn.execute(
+                        f"SELECT id FROM trades WHERE id IN ({placeholders})", chunk
+                    )
+                    stored.update(row[0] for row in rows)
+                now = time.time()
+                for trade_id in stored:
+                    lags.append(now - pending.pop(trade_id))
+            await asyncio.sleep(LAG_POLL_SECONDS)
+    finally:
+        conn.close()
+    return len(pending)
+
+
+async def _worker(
+    client: httpx.AsyncClient,
+    routes: List[Tuple[str, Any]],
+    rng: random.Random,
+    deadline: float,
+    samples: Dict[str, List[float]],
+    statuses: Dict[str, Dict[str, int]],
+) -> None:
+    while time.monotonic() < deadline:
+        label, target = rng.choice(routes)
+        path = target(rng) if callable(target) else target
+        started = time.perf_counter()
+        try:
+            status = str((await client.get(path)).status_code)
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        samples[label].append(time.perf_counter() - started)
+        statuses[label][status] = statuses[label].get(status, 0) + 1
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(max(values)), 4),
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+async def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    markets = make_markets(args.markets)
+    wallets = make_wallets(args.wallets)
+    state = StubState(make_trades(args.trades, markets, args.wallets), markets)
+    stub = start_server(state, _free_port())
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    stop_stream = stream_trades(state, args.rate, wallets) if args.rate > 0 else None
+
+    db_path = os.path.join(workdir, "load.db")
+    port = _free_port()
+    log_path = os.path.join(workdir, "app.log")
+    with open(log_path, "w") as log:
+        app = _start_app(port, db_path, stub_url, args, log)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}",
+            timeout=args.timeout,
+            trust_env=False,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        ) as client:
+            await _wait_ready(client, app)
+            started = time.monotonic()
+            response = await client.post("/admin/backfill")
+            response.raise_for_status()
+            await _wait_backfilled(client, response.json()["requested_at"])
+            await client.post("/admin/sync")
+            await _wait_synced(db_path)
+            print(
+                f"seeded {args.trades} trades in {time.monotonic() - started:.1f}s",
+                file=sys.stderr,
+            )
+
+            # Wallets with history, so the per-wallet routes mostly find them.
+            active = sorted({trade["proxyWallet"] for trade in state.trades})
+            routes = _routes(active)
+            samples: Dict[str, List[float]] = {label: [] for label, _ in routes}
+            statuses: Dict[str, Dict[str, int]] = {label: {} for label, _ in routes}
+            lags: List[float] = []
+            drain = asyncio.Event()
+            lag_task = asyncio.create_task(
+                _track_lag(state, db_path, drain, args.sync_interval * 3, lags)
+            )
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(
+                *(
+                    _worker(
+                        client,
+                        routes,
+                        random.Random(index),
+                        deadline,
+                        samples,
+                        statuses,
+                    )
+                    for index in range(args.concurrency)
+                )
+            )
+            elapsed = time.monotonic() - started
+            drain.set()
+            unstored = await lag_task
+    finally:
+        app.terminate()
+        try:
+            app.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            app.kill()
+        if stop_stream is not None:
+            stop_stream.set()
+        stub.shutdown()
+
+    requests = sum(len(values) for values in samples.values())
+    return {
+        "duration_seconds": round(elapsed, 2),
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 1),
+        "overall": _percentiles(
+            [value for values in samples.values() for value in values]
+        ),
+        "routes": {
+            label: {
+                "requests": len(samples[label]),
+                "statuses": statuses[label],
+                **_percentiles(samples[label]),
+            }
+            for label, _ in routes
+        },
+        "ingest_lag": {
+            "streamed": len(state.published),
+            "sampled": len(lags) + unstored,
+            "unstored": unstored,
+            **_percentiles(lags),
+        },
+    }
+
+
+def _report(result: Dict[str, Any]) -> None:
+    print(
+        f"{'route':<40} {'reqs':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses"
+    )
+    for label, route in result["routes"].items():
+        print(
+            f"{label:<40} {route['requests']:>7} {_ms(route['p50']):>8} "
+            f"{_ms(route['p95']):>8} {_ms(route['p99']):>8}  "
+            + ",".join(
+                f"{status}:{count}"
+                for status, count in sorted(route["statuses"].items())
+            )
+        )
+    overall = result["overall"]
+    print(
+        f"{'all':<40} {result['requests']:>7} {_ms(overall['p50']):>8} "
+        f"{_ms(overall['p95']):>8} {_ms(overall['p99']):>8}"
+    )
+    print(
+        f"throughput: {result['throughput_rps']} req/s "
+        f"over {result['duration_seconds']}s"
+    )
+    lag = result["ingest_lag"]
+    print(
+        f"ingest lag: p50 {_ms(lag['p50'])} ms, p95 {_ms(lag['p95'])} ms, "
+        f"p99 {_ms(lag['p99'])} ms over {lag['sampled']} sampled trades "
+        f"({lag['unstored']} not stored)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", default="50k", help="history served by the stub")
+    parser.add_argument("--markets", type=int, default=500)
+    parser.add_argument("--wallets", type=int, default=5000)
+    parser.add_argument(
+        "--rate", type=float, default=20.0, help="streamed trades per second"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument(
+        "--sync-interval",
+        type=float,
+        default=2.0,
+        help="seconds between incremental trade syncs",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="also write the results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args()
+    args.trades = parse_size(args.trades)
+
+    workdir = tempfile.mkdtemp(prefix="polymarket-load-")
+    try:
+        result = asyncio.run(run(args, workdir))
+    finally:
+        if args.keep:
+            print(f"work directory kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    _report(result)
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(
+                {
+                    "revision": _git_revision(),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": sys.version.split()[0],
+                    "config": vars(args),
+                    "result": result,
+                },
+                handle,
+                indent=2,
+            )
+        print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Benchmark the analytics services against synthetic databases.
+
+For every requested size a fresh SQLite database is filled through
+``upsert_trades`` (timed as its own benchmark), then each service runs in a
+separate child process so wall time and peak RSS are measured in isolation::
+
+    python -m benchmarks.run --sizes 10k,1m,10m --output benchmark-results.json
+    python -m benchmarks.run --compare old.json new.json
+
+Results are written as JSON tagged with the git revision, so runs from two
+revisions can be diffed with ``--compare``.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+SERVICES: Dict[str, str] = {
+    "compute_smart_money": "app.services.smart_money:compute_smart_money",
+    "compute_suspicious_wallets": "app.services.smart_money:compute_suspicious_wallets",
+    "compute_whales": "app.services.whales:compute_whales",
+    "top_profit": "app.services.rankings:top_profit",
+    "hot_markets": "app.services.hot_markets:hot_markets",
+}
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    for suffix, factor in (("k", 1_000), ("m", 1_000_000)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _load(target: str) -> Callable[[], Any]:
+    module_name, attr = target.split(":")
+    module = __import__(module_name, fromlist=[attr])
+    return getattr(module, attr)
+
+
+def populate(
+    db_path: str, trades: int, wallets: int, markets: int, bulk: bool = False
+) -> Dict[str, Any]:
+    """Fill ``db_path`` with synthetic data through the real ingest path."""
+    os.environ["DATABASE_URL"] = db_path
+    from app.db import db_session, init_db
+    from app.polymarket.bulk import BulkTradeIngest
+    from app.polymarket.client import upsert_markets, upsert_trades
+    from benchmarks.synthetic import iter_trades, make_markets, make_wallets
+
+    init_db()
+    market_rows = make_markets(markets, with_volume=False)
+    upsert_markets(market_rows)
+
+    ingest = BulkTradeIngest() if bulk else None
+    elapsed = 0.0
+    for batch in iter_trades(trades, market_rows, make_wallets(wallets)):
+        started = time.perf_counter()
+        if ingest is not None:
+            ingest.add(batch)
+        else:
+            upsert_trades(batch)
+        elapsed += time.perf_counter() - started
+    extra: Dict[str, Any] = {}
+    if ingest is not None:
+        started = time.perf_counter()
+        extra["ingest"] = ingest.close()
+        elapsed += time.perf_counter() - started
+
+    with db_session() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+    return {
+        **extra,
+        "service": "bulk_upsert_trades" if bulk else "upsert_trades",
+        "rows": rows,
+        "wall_seconds": round(elapsed, 4),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def run_child(db_path: str, service: str) -> Dict[str, Any]:
+    os.environ["DATABASE_URL"] = db_path
+    from app.db import read_session
+
+    with read_session() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+    fn = _load(SERVICES[service])
+    baseline_rss = _peak_rss_mb()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    return {
+        "service": service,
+        "rows": rows,
+        # Paged services return {"data": [...], ...}; count rows, not keys.
+        "results": len(result["data"]) if isinstance(result, dict) else len(result),
+        "wall_seconds": round(elapsed, 4),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "baseline_rss_mb": round(baseline_rss, 1),
+    }
+
+
+def run_size(size: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory(prefix="polymarket-bench-") as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        wallets = max(100, size // args.trades_per_wallet)
+        # Ingest runs in its own process too, so its RSS does not leak into reads.
+        ingest = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.run",
+                "--populate",
+                db_path,
+                "--trades",
+                str(size),
+                "--wallets",
+                str(wallets),
+                "--markets",
+                str(args.markets),
+                *(["--bulk"] if args.bulk else []),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results = [json.loads(ingest.stdout)]
+        for service in args.services:
+            child = subprocess.run(
+                [sys.executable, "-m", "benchmarks.run", "--child", db_path, service],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            results.append(json.loads(child.stdout))
+        for result in results:
+            result["size"] = size
+            print(
+                f"{size:>10} {result['service']:<28} {result['wall_seconds']:>9.3f}s "
+                f"{result['peak_rss_mb']:>8.1f}MB {result['rows_per_second'] or 0:>12.0f} rows/s",
+                file=sys.stderr,
+            )
+        return results
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as handle:
+        old = {(r["size"], r["service"]): r for r in json.load(handle)["results"]}
+    with open(new_path) as handle:
+        new = json.load(handle)["results"]
+    print(f"{'size':>10} {'service':<28} {'old_s':>9} {'new_s':>9} {'change':>8}")
+    for result in new:
+        before = old.get((result["size"], result["service"]))
+        if before is None or not before["wall_seconds"]:
+            continue
+        change = result["wall_seconds"] / before["wall_seconds"] - 1
+        print(
+            f"{result['size']:>10} {result['service']:<28} "
+            f"{before['wall_seconds']:>9.3f} {result['wall_seconds']:>9.3f} {change:>+8.1%}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10k,1m,10m")
+    parser.add_argument("--services", default=",".join(SERVICES))
+    parser.add_argument("--markets", type=int, default=2000)
+    parser.add_argument("--trades-per-wallet", type=int, default=50)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--child", nargs=2, metavar=("DB", "SERVICE"))
+    parser.add_argument("--populate", metavar="DB")
+    parser.add_argument("--trades", type=int)
+    parser.add_argument("--wallets", type=int)
+    parser.add_argument(
+        "--bulk", action="store_true", help="ingest through BulkTradeIngest"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.child:
+        print(json.dumps(run_child(*args.child)))
+        return
+    if args.populate:
+        print(
+            json.dumps(
+                populate(
+                    args.populate, args.trades, args.wallets, args.markets, args.bulk
+                )
+            )
+        )
+        return
+
+    args.services = [name for name in args.services.split(",") if name]
+    results: List[Dict[str, Any]] = []
+    for size in (parse_size(value) for value in args.sizes.split(",")):
+        results.extend(run_size(size, args))
+
+    with open(args.output, "w") as handle:
+        json.dump(
+            {
+                "revision": _git_revision(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": sys.version.split()[0],
+                "results": results,
+            },
+            handle,
+            indent=2,
+        )
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Regression benchmark for the smart-money win-rate aggregation.
+
+Compares ``rank_smart_money`` (one pass over per-user indexes) with the
+previous implementation, which rescanned every (user, market) profit for each
+user. The old version is quadratic, so it only runs up to ``--legacy-max``
+users and its 100k-user time is extrapolated from the largest measured size::
+
+    python -m benchmarks.smart_money_win_rate --users 100000
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, DefaultDict, Dict, List, Tuple
+
+from app.services.smart_money import ProfitEntry, UserActivity, rank_smart_money
+
+
+def make_inputs(
+    users: int, seed: int = 3
+) -> Tuple[Dict[str, UserActivity], List[ProfitEntry], datetime]:
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    activity: Dict[str, UserActivity] = {}
+    profits: List[ProfitEntry] = []
+    for index in range(users):
+        user_id = f"0x{index:040x}"
+        activity[user_id] = {
+            "stake": rng.uniform(100, 10000),
+            "trade_count": rng.randint(1, 40),
+        }
+        for market in range(rng.randint(1, 5)):
+            for _ in range(rng.randint(1, 3)):
+                profits.append(
+                    {
+                        "user_id": user_id,
+                        "market_id": f"0x{market:064x}",
+                        "timestamp": now - timedelta(days=rng.uniform(0, 40)),
+                        "profit": rng.gauss(200, 800),
+                    }
+                )
+    return activity, profits, now - timedelta(days=30)
+
+
+def legacy_rank(
+    activity: Dict[str, UserActivity],
+    profits: List[ProfitEntry],
+    cutoff: datetime,
+    min_roi: float = 0.2,
+    min_win_rate: float = 0.6,
+    min_trades: int = 5,
+) -> List[Dict[str, Any]]:
+    user_market_profit: DefaultDict[Tuple[str, str], float] = defaultdict(float)
+    user_profit: DefaultDict[str, float] = defaultdict(float)
+    for entry in profits:
+        if entry["timestamp"] < cutoff:
+            continue
+        user_profit[entry["user_id"]] += entry["profit"]
+        user_market_profit[(entry["user_id"], entry["market_id"])] += entry["profit"]
+
+    results = []
+    for user_id, stats in activity.items():
+        if stats["trade_count"] < min_trades or stats["stake"] <= 0:
+            continue
+        market_profits = [
+            profit for (uid, _), profit in user_market_profit.items() if uid == user_id
+        ]
+        if not market_profits:
+            continue
+        wins = sum(1 for profit in market_profits if profit > 0)
+        win_rate = wins / len(market_profits)
+        roi = user_profit[user_id] / stats["stake"]
+        if roi >= min_roi and win_rate >= min_win_rate:
+            results.append(
+                {
+                    "user_id": user_id,
+                    "roi": round(roi, 4),
+                    "win_rate": round(win_rate, 4),
+                    "profit": round(user_profit[user_id], 4),
+                    "trade_count": stats["trade_count"],
+                }
+            )
+    results.sort(key=lambda item: item["roi"], reverse=True)
+    return results
+
+
+def _timed(fn: Any, *args: Any, **kwargs: Any) -> Tuple[float, Any]:
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--legacy-max", type=int, default=4000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    legacy_sizes = [
+        size for size in (1000, 2000, 4000, 8000) if size <= args.legacy_max
+    ]
+    print(f"{'users':>8} {'legacy_s':>10} {'linear_s':>10} {'top_k_s':>10}")
+    for size in legacy_sizes:
+        activity, profits, cutoff = make_inputs(size)
+        legacy_s, expected = _timed(legacy_rank, activity, profits, cutoff)
+        linear_s, actual = _timed(rank_smart_money, activity, profits, cutoff)
+        top_s, top = _timed(
+            rank_smart_money, activity, profits, cutoff, limit=args.limit
+        )
+        if actual != expected or top != expected[: args.limit]:
+            raise SystemExit(f"result mismatch at {size} users")
+        print(f"{size:>8} {legacy_s:>10.3f} {linear_s:>10.3f} {top_s:>10.3f}")
+
+    activity, profits, cutoff = make_inputs(args.users)
+    linear_s, _ = _timed(rank_smart_money, activity, profits, cutoff)
+    top_s, _ = _timed(rank_smart_money, activity, profits, cutoff, limit=args.limit)
+    if legacy_sizes:
+        base = legacy_sizes[-1]
+        activity, profits, cutoff = make_inputs(base)
+        base_s, _ = _timed(legacy_rank, activity, profits, cutoff)
+        projected = base_s * (args.users / base) ** 2
+        print(
+            f"{args.users:>8} {projected:>9.1f}* {linear_s:>10.3f} {top_s:>10.3f}"
+            "   (* extrapolated, quadratic)"
+        )
+    else:
+        print(f"{args.users:>8} {'-':>10} {linear_s:>10.3f} {top_s:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Local stand-in for the Polymarket Gamma and Data APIs.
+
+Serves ``/trades`` (newest first, ``limit``/``offset`` paging) and ``/markets``
+from a deterministic synthetic data set so the sync path can be exercised
+offline. Point the app at it with::
+
+    python -m benchmarks.stub_api --port 8900 --trades 20000
+    POLYMARKET_DATA_URL=http://127.0.0.1:8900 POLYMARKET_GAMMA_URL=http://127.0.0.1:8900 ...
+
+``--throttle-every N`` answers every Nth request with ``429`` and a
+``Retry-After`` header to exercise client backoff. ``--rate R`` keeps
+publishing ``R`` new trades per second, stamped with the current time, on top
+of the synthetic history.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import iter_trades, make_markets, make_trade, make_wallets
+
+# How often the live stream publishes the trades that came due.
+_STREAM_TICK_SECONDS = 0.05
+
+
+def make_trades(
+    count: int, markets: List[Dict[str, Any]], wallets: int = 2000
+) -> List[Dict[str, Any]]:
+    """Synthetic trades ordered newest first, as the Data API returns them."""
+    trades = [
+        trade
+        for batch in iter_trades(
+            count, markets, make_wallets(wallets), mixed_formats=False
+        )
+        for trade in batch
+    ]
+    trades.reverse()
+    return trades
+
+
+class StubState:
+    def __init__(
+        self,
+        trades: List[Dict[str, Any]],
+        markets: List[Dict[str, Any]],
+        throttle_every: int = 0,
+    ) -> None:
+        self.trades = trades
+        self.markets = markets
+        self.throttle_every = throttle_every
+        self.requests = 0
+        # (trade id, wall-clock time it became visible) for streamed trades.
+        self.published: List[Tuple[str, float]] = []
+        self.lock = threading.Lock()
+
+    def should_throttle(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            return (
+                bool(self.throttle_every) and self.requests % self.throttle_every == 0
+            )
+
+    def publish(self, trades: List[Dict[str, Any]]) -> None:
+        """Put ``trades`` (oldest first) at the head of the newest-first list."""
+        with self.lock:
+            self.trades[0:0] = trades[::-1]
+            published_at = time.time()
+            self.published.extend(
+                (trade["transactionHash"], published_at) for trade in trades
+            )
+
+    def page(self, rows: List[Dict[str, Any]], offset: int, limit: int) -> List[Any]:
+        with self.lock:
+            return rows[offset : offset + limit]
+
+
+def stream_trades(
+    state: StubState, rate: float, wallets: List[str], seed: int = 29
+) -> threading.Event:
+    """Publish ``rate`` trades per second until the returned event is set."""
+    stop = threading.Event()
+    rng = random.Random(seed)
+    first_index = len(state.trades)
+
+    def run() -> None:
+        started = time.monotonic()
+        sent = 0
+        while not stop.wait(_STREAM_TICK_SECONDS):
+            due = int((time.monotonic() - started) * rate)
+            if due <= sent:
+                continue
+            now = int(time.time())
+            state.publish(
+                [
+                    make_trade(
+                        rng,
+                        first_index + index,
+                        state.markets,
+                        wallets,
+                        now,
+                        mixed_formats=False,
+                    )
+                    for index in range(sent, due)
+                ]
+            )
+            sent = due
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
+
+
+def make_handler(state: StubState) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Any, headers: Dict[str, str]) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            limit = int(params.get("limit", ["100"])[0])
+            offset = int(params.get("offset", ["0"])[0])
+
+            if state.should_throttle():
+                self._send(429, {"error": "rate limited"}, {"Retry-After": "0.05"})
+                return
+            if url.path == "/trades":
+                rows = state.trades
+            elif url.path == "/markets":
+                rows = state.markets
+            else:
+                self._send(404, {"error": "not found"}, {})
+                return
+            self._send(200, state.page(rows, offset, limit), {})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    return Handler
+
+
+def start_server(state: StubState, port: int) -> ThreadingHTTPServer:
+    """Serve ``state`` on a background thread and return the running server."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve(
+    port: int,
+    trades: int,
+    markets: int,
+    throttle_every: int = 0,
+    rate: float = 0.0,
+    wallets: int = 2000,
+) -> ThreadingHTTPServer:
+    """Start the stub, streaming ``rate`` trades per second when positive."""
+    market_rows = make_markets(markets)
+    state = StubState(
+        make_trades(trades, market_rows, wallets), market_rows, throttle_every
+    )
+    if rate > 0:
+        stream_trades(state, rate, make_wallets(wallets))
+    return start_server(state, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--trades", type=int, default=20000)
+    parser.add_argument("--markets", type=int, default=200)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.trades, args.markets, args.throttle_every, args.rate)
+    print(f"Stub Polymarket API listening on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Deterministic generator of Polymarket-shaped markets and trades.
+
+Rows mirror the Gamma ``/markets`` and Data API ``/trades`` payloads. Wallet
+activity is heavy-tailed (a few wallets place most trades), sides are a
+BUY-leaning mix, and timestamps come in the mix of formats seen upstream:
+epoch integers, digit strings and ISO-8601 with ``Z`` or an offset.
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def make_markets(
+    count: int, seed: int = 7, with_volume: bool = True
+) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": str(index),
+            "conditionId": f"0x{rng.getrandbits(256):064x}",
+            "question": f"Synthetic market #{index}?",
+            "volume24hr": (
+                round(rng.paretovariate(1.2) * 1000, 2) if with_volume else None
+            ),
+            "volume": round(rng.paretovariate(1.2) * 50000, 2),
+            "active": True,
+            "closed": False,
+            "createdAt": "2024-01-01T00:00:00Z",
+        }
+        for index in range(count)
+    ]
+
+
+def make_wallets(count: int, seed: int = 5) -> List[str]:
+    rng = random.Random(seed)
+    return [f"0x{rng.getrandbits(160):040x}" for _ in range(count)]
+
+
+def _format_timestamp(rng: random.Random, ts: int) -> Any:
+    roll = rng.random()
+    if roll < 0.7:
+        return ts
+    if roll < 0.8:
+        return str(ts)
+    moment = datetime.fromtimestamp(ts, tz=timezone.utc)
+    if roll < 0.9:
+        return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return moment.isoformat()
+
+
+def make_trade(
+    rng: random.Random,
+    index: int,
+    markets: List[Dict[str, Any]],
+    wallets: List[str],
+    ts: int,
+    mixed_formats: bool = True,
+) -> Dict[str, Any]:
+    wallet = wallets[min(int(rng.paretovariate(1.1)) - 1, len(wallets) - 1)]
+    market = markets[min(int(rng.paretovariate(1.3)) - 1, len(markets) - 1)]
+    return {
+        "proxyWallet": wallet,
+        "side": "BUY" if rng.random() < 0.6 else "SELL",
+        "asset": str(index),
+        "conditionId": market["conditionId"],
+        "size": round(rng.paretovariate(1.3) * 10, 2),
+        "price": round(rng.uniform(0.01, 0.99), 3),
+        "timestamp": _format_timestamp(rng, ts) if mixed_formats else ts,
+        "transactionHash": f"0x{rng.getrandbits(256):064x}",
+    }
+
+
+def iter_trades(
+    count: int,
+    markets: List[Dict[str, Any]],
+    wallets: List[str],
+    days: float = 60.0,
+    end: Optional[int] = None,
+    seed: int = 11,
+    batch_size: int = 10_000,
+    mixed_formats: bool = True,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield batches of trades in ascending time order, ending at ``end``.
+
+    Wallets and markets are drawn from Zipf-like distributions so activity
+    concentrates on a small head, as it does on Polymarket.
+    """
+    rng = random.Random(seed)
+    end = end if end is not None else int(time.time())
+    start = end - int(days * 86400)
+    step = (end - start) / max(count, 1)
+    batch: List[Dict[str, Any]] = []
+    for index in range(count):
+        ts = start + int(index * step)
+        batch.append(make_trade(rng, index, markets, wallets, ts, mixed_formats))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch